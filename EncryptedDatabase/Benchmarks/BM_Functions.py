@@ -0,0 +1,209 @@
+import argparse
+import os
+import random
+import string
+import time
+
+from FileInteractionMethods import ParsingMethods as PM
+from FileInteractionMethods.EncryptionMethods import Diffie_Hellman_Encryption as DH
+from FileInteractionMethods.EncryptionMethods import EncryptionConstants
+from FileInteractionMethods.EncryptionMethods import RSA_Encryption as RSA
+
+# Key sizes (in bits of the RSA modulus) measured by the RSA engine benchmark. The cost of the naive (chval ** d) % n engine grows about 100 times
+# every 4 bits (a single character takes more than a minute at 24 bits, and hours at 28 bits), so the sweep stops at 24 bits for both engines.
+RSA_BENCHMARK_KEY_SIZES = [12, 14, 16, 18, 20, 22, 24]
+# The naive engine is timed on as many characters of the sample as fit in this many seconds (at least one), its time being scaled to the whole sample
+NAIVE_TIME_BUDGET = 2.0
+SAMPLE_LENGTH = 100
+# Key sizes (in bits) measured by the key generation benchmark
+KEYGEN_BENCHMARK_KEY_SIZES = [512, 1024, 2048]
+KEYGEN_REPEATS = 3
+# Size (in bytes) of the random sample encrypted by the Diffie-Hellman backend benchmark
+DH_SAMPLE_SIZE = 4 * 1024 * 1024
+
+
+def pick_rsa_primes(key_size):
+    """
+    Picks two different prime numbers of key_size / 2 bits each, so that their product has (about) key_size bits.
+    :param key_size: The wanted size of the RSA modulus, in bits
+    :return: The two chosen prime numbers
+    """
+    half_size = key_size // 2
+    lower_bound = 2 ** (half_size - 1) + 1
+    primes_in_range = EncryptionConstants.generate_primes(lower_bound, lower_bound + min(2 ** (half_size - 2), 2 ** 12),
+                                                          persist=False)
+    p1, p2 = random.sample(primes_in_range, 2)
+    return p1, p2
+
+
+def time_call(function, *args):
+    """
+    Times a single call of the given function
+    :param function: The function to be timed
+    :param args: The arguments passed to the function
+    :return: The elapsed time, in seconds
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def naive_round_trip(key, values):
+    """
+    Encrypts and decrypts the values the way the RSA module used to, building (chval ** exponent) before reducing it modulo n
+    :param key: The RSA key material
+    :param values: The character codes to be encrypted and decrypted
+    """
+    encoded = [(chval ** key.public_exponent) % key.n_value for chval in values]
+    return [(chval ** key.private_exponent) % key.n_value for chval in encoded]
+
+
+def engine_round_trip(key, values):
+    """
+    Encrypts and decrypts the values using the three-argument pow / CRT engine of the RSA key
+    :param key: The RSA key material
+    :param values: The character codes to be encrypted and decrypted
+    """
+    encoded = [key.encrypt_value(chval) for chval in values]
+    return [key.decrypt_value(chval) for chval in encoded]
+
+
+def time_naive_round_trip(key, values, time_budget=NAIVE_TIME_BUDGET):
+    """
+    Times the naive engine on a single character, then on as many characters of the values as fit in the time budget
+    :param key: The RSA key material
+    :param values: The character codes to be encrypted and decrypted
+    :param time_budget: The time the naive engine may take, in seconds
+    :return: A touple of the time per character, in seconds, and the number of characters it was measured on
+    """
+    first_seconds = time_call(naive_round_trip, key, values[:1])
+    measured = max(1, min(len(values), int(time_budget / first_seconds)))
+    if measured == 1:
+        return first_seconds, 1
+    return time_call(naive_round_trip, key, values[:measured]) / measured, measured
+
+
+def benchmark_rsa_engine(key_sizes=None, sample_length=SAMPLE_LENGTH):
+    """
+    Measures an encrypt + decrypt round trip of a random text sample for every key size, using both the naive engine and the pow / CRT engine.
+    The naive engine is only measured on part of the sample for the larger keys (see time_naive_round_trip), its time being scaled to the whole sample.
+    :param key_sizes: The RSA modulus sizes to be measured, in bits
+    :param sample_length: The number of characters of the random text sample
+    :return: A list of (key_size, naive_seconds, engine_seconds, naive_characters) touples, naive_characters being the number of characters the naive engine was measured on
+    """
+    if key_sizes is None:
+        key_sizes = RSA_BENCHMARK_KEY_SIZES
+    values = [ord(ch) for ch in random.choices(string.printable, k=sample_length)]
+    results = []
+    for key_size in key_sizes:
+        key = RSA.RSAKey(*pick_rsa_primes(key_size))
+        if engine_round_trip(key, values) != values:
+            raise Exception("[BENCHMARK] The RSA engine did not return the original text!")
+        engine_seconds = time_call(engine_round_trip, key, values)
+        naive_character_seconds, naive_characters = time_naive_round_trip(key, values)
+        naive_seconds = naive_character_seconds * len(values)
+        results.append((key_size, naive_seconds, engine_seconds, naive_characters))
+        PM.display(
+            f"[BENCHMARK] RSA-{key_size}: naive {naive_seconds * 1000:.3f} ms (measured on {naive_characters} character(s)), pow/CRT {engine_seconds * 1000:.3f} ms, speedup x{naive_seconds / engine_seconds:.1f}")
+    return results
+
+
+def generate_rsa_key(key_size):
+    """
+    Generates the two Miller-Rabin prime numbers of an RSA key of the given size, then derives the key material from them
+    :param key_size: The size of the RSA modulus, in bits
+    :return: The RSA key material
+    """
+    p1 = EncryptionConstants.random_prime(key_size // 2)
+    p2 = p1
+    while p2 == p1:
+        p2 = EncryptionConstants.random_prime(key_size - key_size // 2)
+    return RSA.RSAKey(p1, p2)
+
+
+def benchmark_keygen(key_sizes=None, repeats=KEYGEN_REPEATS):
+    """
+    Measures the average time needed to generate an RSA key (two primes + key material) and a single Diffie-Hellman prime for every key size
+    :param key_sizes: The key sizes to be measured, in bits
+    :param repeats: How many keys are generated for every key size
+    :return: A list of (key_size, rsa_seconds, dh_prime_seconds) touples
+    """
+    if key_sizes is None:
+        key_sizes = KEYGEN_BENCHMARK_KEY_SIZES
+    results = []
+    for key_size in key_sizes:
+        rsa_seconds = sum(time_call(generate_rsa_key, key_size) for _ in range(repeats)) / repeats
+        dh_prime_seconds = sum(time_call(EncryptionConstants.random_prime, key_size - 1) for _ in range(repeats)) / repeats
+        results.append((key_size, rsa_seconds, dh_prime_seconds))
+        PM.display(
+            f"[BENCHMARK] {key_size} bits: RSA key {rsa_seconds * 1000:.1f} ms, Diffie-Hellman prime {dh_prime_seconds * 1000:.1f} ms")
+    return results
+
+
+def python_dh_round_trip(full_key, int_width, plaintext):
+    """
+    Encrypts, packs, unpacks and decrypts the plaintext with the pure-Python Diffie-Hellman backend, one chunk at a time
+    :param full_key: The full key shared by both ends
+    :param int_width: The width of the stored numbers, in bytes
+    :param plaintext: The bytes to be encrypted and decrypted
+    :return: The decrypted bytes
+    """
+    decrypted = []
+    for index in range(0, len(plaintext), PM.CHUNK_SIZE):
+        payload = PM.pack_numbers(DH.encrypt_bytes(full_key, plaintext[index:index + PM.CHUNK_SIZE]), int_width)
+        decrypted.append(DH.decrypt_numbers(full_key, PM.unpack_numbers(payload, int_width)))
+    return b"".join(decrypted)
+
+
+def numpy_dh_round_trip(full_key, int_width, plaintext):
+    """
+    Encrypts and decrypts the plaintext with the NumPy Diffie-Hellman backend, one chunk at a time
+    :param full_key: The full key shared by both ends
+    :param int_width: The width of the stored numbers, in bytes
+    :param plaintext: The bytes to be encrypted and decrypted
+    :return: The decrypted bytes
+    """
+    decrypted = []
+    for index in range(0, len(plaintext), PM.CHUNK_SIZE):
+        payload = DH.encrypt_bytes_numpy(full_key, int_width, plaintext[index:index + PM.CHUNK_SIZE])
+        decrypted.append(DH.decrypt_payload_numpy(full_key, int_width, payload))
+    return b"".join(decrypted)
+
+
+def benchmark_dh_backends(sample_size=DH_SAMPLE_SIZE):
+    """
+    Measures an encrypt + decrypt round trip of a random sample with both the pure-Python and the NumPy (if installed) Diffie-Hellman backends
+    :param sample_size: The size of the random sample, in bytes
+    :return: A touple of the pure-Python and NumPy throughputs, in MB/s, the latter being None if NumPy is not installed
+    """
+    plaintext = os.urandom(sample_size)
+    pub_key1, priv_key1, pub_key2, priv_key2 = DH.compute_initial_prime_numbers()
+    full_key = DH.derive_full_key(pub_key1, priv_key1, pub_key2, priv_key2)
+    int_width = PM.compute_int_width(full_key + 255)
+    megabytes = sample_size / (1024 * 1024)
+    python_throughput = megabytes / time_call(python_dh_round_trip, full_key, int_width, plaintext)
+    PM.display(
+        f"[BENCHMARK] Diffie-Hellman pure-Python backend: {python_throughput:.2f} MB/s")
+    if not DH.is_numpy_backend(int_width):
+        PM.LOGGER.warning(
+            "[BENCHMARK] NumPy is not installed (or disabled), skipping the NumPy backend!")
+        return python_throughput, None
+    if numpy_dh_round_trip(full_key, int_width, plaintext) != plaintext:
+        raise Exception("[BENCHMARK] The NumPy backend did not return the original bytes!")
+    numpy_throughput = megabytes / time_call(numpy_dh_round_trip, full_key, int_width, plaintext)
+    PM.display(
+        f"[BENCHMARK] Diffie-Hellman NumPy backend: {numpy_throughput:.2f} MB/s, speedup x{numpy_throughput / python_throughput:.1f}")
+    return python_throughput, numpy_throughput
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EncryptedDatabase benchmarks")
+    parser.add_argument("benchmark", choices=["rsa", "keygen", "dh"])
+    parser.add_argument("--length", type=int, default=SAMPLE_LENGTH, help="number of characters in the text sample")
+    arguments = parser.parse_args()
+    if arguments.benchmark == "rsa":
+        benchmark_rsa_engine(sample_length=arguments.length)
+    elif arguments.benchmark == "keygen":
+        benchmark_keygen()
+    elif arguments.benchmark == "dh":
+        benchmark_dh_backends()
@@ -0,0 +1,358 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from Database import DB_Cache
+from Database import DB_Functions as DB
+from FileInteractionMethods import CompressionMethods as CM
+from FileInteractionMethods import ParsingMethods as PM
+from FileInteractionMethods.EncryptionMethods import Diffie_Hellman_Encryption as DH
+from FileInteractionMethods.EncryptionMethods import EncryptionConstants
+from FileInteractionMethods.EncryptionMethods import RSA_Encryption as RSA
+
+# The alphabets the synthetic text corpora are drawn from, each byte of a corpus being chosen uniformly among them
+ALPHABETS = {"digits": (string.digits + "\n").encode(),
+             "lowercase": (string.ascii_lowercase + " " * 5 + "\n").encode(),
+             "printable": string.printable.encode(),
+             "latin1": bytes(range(32, 256)) + b"\n"}
+SIZE_UNITS = {"GB": 1024 ** 3, "MB": 1024 ** 2, "KB": 1024, "B": 1}
+DEFAULT_SIZES = ["1KB", "64KB", "1MB"]
+DEFAULT_ALPHABETS = ["lowercase", "printable"]
+DEFAULT_REPEATS = 5
+STAGES = ["keygen", "primes", "encrypt", "decrypt", "add", "list", "read", "delete", "end-to-end"]
+# The corpora are generated (and written) in blocks of this size, so that a 1 GB corpus does not need to fit in memory
+CORPUS_BLOCK_SIZE = 1024 * 1024
+# Writing this to /proc/self/clear_refs resets the peak RSS of the process (Linux only), so that it can be reported for every stage
+CLEAR_PEAK_RSS = "5"
+
+
+def parse_size(text):
+    """
+    Parses a corpus size such as '1KB', '64KB', '1MB' or '1GB'
+    :param text: The size, with an optional unit
+    :return: The size, in bytes
+    """
+    text = text.strip().upper()
+    for unit, multiplier in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * multiplier)
+    return int(text)
+
+
+def generate_corpus(path, size, alphabet, seed):
+    """
+    Writes a synthetic text corpus, every byte being drawn from the alphabet. Random bytes are mapped onto the alphabet with bytes.translate, so that even 1 GB corpora are generated in seconds.
+    :param path: Path of the corpus
+    :param size: The size of the corpus, in bytes
+    :param alphabet: The name of one of the ALPHABETS
+    :param seed: The seed of the random generator, so that the same corpus can be generated again
+    """
+    letters = ALPHABETS[alphabet]
+    table = bytes(letters[value % len(letters)] for value in range(256))
+    generator = random.Random(seed)
+    with open(path, "wb") as file:
+        for offset in range(0, size, CORPUS_BLOCK_SIZE):
+            file.write(generator.randbytes(min(CORPUS_BLOCK_SIZE, size - offset)).translate(table))
+
+
+def percentile(samples, fraction):
+    """
+    Computes a percentile of the samples with the nearest-rank method
+    :param samples: The measured values
+    :param fraction: The wanted percentile, between 0 and 1
+    :return: The smallest sample that is larger than or equal to the given fraction of the samples
+    """
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(len(ordered) * fraction) - 1)]
+
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS of the process, if the platform allows it
+    :return: True if the peak RSS was reset, False if it keeps counting since the process started
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write(CLEAR_PEAK_RSS)
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb():
+    """
+    Returns the peak RSS of the process or of its worker processes, whichever is larger
+    :return: The peak RSS in KB, or None if the platform does not report it
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # macOS reports bytes, while Linux reports KB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(stage, function, argument_sets, size=None, **labels):
+    """
+    Calls the function once for every argument set, timing every call. The argument sets may be a generator, so that any setup happens outside of the timed calls.
+    :param stage: The name of the measured stage
+    :param function: The measured function
+    :param argument_sets: An iterable of argument touples, one per call
+    :param size: The number of bytes processed by every call, if the throughput is wanted
+    :param labels: The algorithm, alphabet and whatever else identifies the measurement
+    :return: The result, as a dictionary with the latency percentiles (in ms), the throughput (in MB/s) and the peak RSS (in KB)
+    """
+    is_peak_reset = reset_peak_rss()
+    samples = []
+    for arguments in argument_sets:
+        start = time.perf_counter()
+        function(*arguments)
+        samples.append(time.perf_counter() - start)
+    result = {"stage": stage, **labels, "size": size, "repeats": len(samples),
+              "p50_ms": round(percentile(samples, 0.5) * 1000, 3), "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+              "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+              "throughput_mb_s": round(size * len(samples) / sum(samples) / (1024 * 1024), 3) if size else None,
+              "peak_rss_kb": peak_rss_kb(), "peak_rss_since_start": not is_peak_reset}
+    PM.display(f"[BENCHMARK] {describe(result)}: p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms"
+               + (f", {result['throughput_mb_s']} MB/s" if size else "") + f", peak RSS {result['peak_rss_kb']} KB")
+    return result
+
+
+def describe(result):
+    """
+    :param result: A measurement, as returned by measure
+    :return: The stage and labels of the measurement, as text
+    """
+    labels = [str(value) for key, value in result.items() if key in ("stage", "algorithm", "alphabet") and value]
+    if result.get("size"):
+        labels.append(f"{result['size']} bytes")
+    return " ".join(labels)
+
+
+def benchmark_keygen(repeats):
+    """
+    Measures the generation of the encryption parameters and the derivation of the key material, for both algorithms
+    :param repeats: How many keys are generated
+    :return: The list of results
+    """
+    def rsa_keygen():
+        RSA.RSAKey(*RSA.compute_initial_prime_numbers())
+
+    def dh_keygen():
+        DH.derive_full_key(*DH.compute_initial_prime_numbers())
+
+    return [measure("keygen", rsa_keygen, [()] * repeats, algorithm="RSA"),
+            measure("keygen", dh_keygen, [()] * repeats, algorithm="DH")]
+
+
+def benchmark_primes(repeats):
+    """
+    Measures the prime table used by the key generation: sieved from scratch, and served by EncryptionConstants.generate_primes once cached
+    :param repeats: How many times the table is generated
+    :return: The list of results
+    """
+    upper_bound = max(EncryptionConstants.RSA_UPPER_BOUND, EncryptionConstants.DIFFIE_HELLMAN_UPPER_BOUND)
+    return [measure("primes", EncryptionConstants.sieve_primes, [(upper_bound,)] * repeats, algorithm="sieve"),
+            measure("primes", EncryptionConstants.generate_primes,
+                    [(EncryptionConstants.LOWER_BOUND, upper_bound, False)] * repeats, algorithm="cached")]
+
+
+def benchmark_ciphers(corpus_path, size, alphabet, repeats, workers, stages):
+    """
+    Measures the encryption and decryption of a corpus with both algorithms, in isolation (the key material being derived beforehand, and the decrypted bytes being discarded)
+    :param corpus_path: Path of the corpus
+    :param size: The size of the corpus, in bytes
+    :param alphabet: The alphabet of the corpus
+    :param repeats: How many times the corpus is encrypted and decrypted
+    :param workers: The number of processes encrypting/decrypting chunks in parallel
+    :param stages: The measured stages
+    :return: The list of results
+    """
+    results = []
+    encrypted_path = corpus_path + ".encrypted"
+    for algorithm, module in (("RSA", RSA), ("DH", DH)):
+        params = module.compute_initial_prime_numbers()
+        key = RSA.RSAKey(*params) if module is RSA else DH.derive_full_key(*params)
+        module.encrypt(corpus_path, encrypted_path, *params, workers)
+        if "encrypt" in stages:
+            results.append(measure("encrypt", module.encrypt, [(corpus_path, encrypted_path, *params, workers)] * repeats,
+                                   size, algorithm=algorithm, alphabet=alphabet))
+        if "decrypt" in stages:
+            with open(os.devnull, "wb") as sink:
+                results.append(measure("decrypt", module.decrypt, [(encrypted_path, sink, *params, workers, key)] * repeats,
+                                       size, algorithm=algorithm, alphabet=alphabet))
+        os.remove(encrypted_path)
+    return results
+
+
+def benchmark_database(corpus_paths, size, alphabet, workers, codec, stages):
+    """
+    Measures the add, list, read and delete operations of DB_Functions on distinct corpora (so that no content is deduplicated), one operation per corpus,
+    then the three operations chained, as the end-to-end latency of a file. The caches are cleared before every read.
+    :param corpus_paths: The paths of the corpora, one per repeat
+    :param size: The size of every corpus, in bytes
+    :param alphabet: The alphabet of the corpora
+    :param workers: The number of processes encrypting/decrypting chunks in parallel
+    :param codec: The codec the corpora are compressed with before being encrypted
+    :param stages: The measured stages
+    :return: The list of results
+    """
+    results = []
+    names = [os.path.basename(path) for path in corpus_paths]
+    with open(os.devnull, "wb") as sink:
+        def cold_read(name):
+            DB_Cache.CONTENT_CACHE.clear()
+            DB_Cache.KEY_CACHE.clear()
+            DB.read_from_database(name, workers, sink)
+
+        def end_to_end(path, algorithm):
+            DB.add_to_database(path, algorithm, workers, codec)
+            cold_read(os.path.basename(path))
+            DB.delete_from_database(os.path.basename(path))
+
+        def quiet_list():
+            with contextlib.redirect_stdout(io.StringIO()):
+                DB.list_all()
+
+        for algorithm in ("rsa", "dh"):
+            labels = {"algorithm": algorithm.upper(), "alphabet": alphabet}
+            add_results = [measure("add", DB.add_to_database, [(path, algorithm, workers, codec) for path in corpus_paths],
+                                   size, **labels)]
+            if "list" in stages:
+                results.append(measure("list", quiet_list, [()] * len(corpus_paths), None, **labels, files=len(names)))
+            if "read" in stages:
+                results.append(measure("read", cold_read, [(name,) for name in names], size, **labels))
+            delete_results = [measure("delete", DB.delete_from_database, [(name,) for name in names], None, **labels)]
+            results += (add_results if "add" in stages else []) + (delete_results if "delete" in stages else [])
+            if "end-to-end" in stages:
+                results.append(measure("end-to-end", end_to_end, [(path, algorithm) for path in corpus_paths], size,
+                                       **labels))
+    return results
+
+
+@contextlib.contextmanager
+def benchmark_tree():
+    """
+    Runs the enclosed code in a temporary directory holding empty Files/, Files/Encrypted/ and Database/ folders, with a temporary Database, so that the real ones are left untouched
+    :return: The path of the temporary directory
+    """
+    previous_directory = os.getcwd()
+    previous_database_path = DB.DATABASE_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, PM.ENCRYPTED_FILES_PATH))
+        os.makedirs(os.path.join(directory, "Database"))
+        os.chdir(directory)
+        DB.DATABASE_PATH = os.path.join(directory, "Database", "benchmark_database.db")
+        try:
+            yield directory
+        finally:
+            DB.get_repository().close()
+            DB.DATABASE_PATH = previous_database_path
+            os.chdir(previous_directory)
+
+
+def run_suite(sizes=None, alphabets=None, stages=None, repeats=DEFAULT_REPEATS, workers=EncryptionConstants.DEFAULT_WORKERS,
+              codec=CM.CODEC_NONE):
+    """
+    Runs the selected stages on synthetic corpora of every size and alphabet, in a temporary Files/ tree and Database
+    :param sizes: The sizes of the corpora, in bytes
+    :param alphabets: The names of the alphabets of the corpora
+    :param stages: The stages to be measured, from STAGES
+    :param repeats: How many times every stage is measured (on distinct corpora, for the Database stages)
+    :param workers: The number of processes encrypting/decrypting chunks in parallel
+    :param codec: The codec the corpora are compressed with when added to the Database
+    :return: The report, as a dictionary holding the environment, the configuration and the list of results
+    """
+    sizes = sizes or [parse_size(size) for size in DEFAULT_SIZES]
+    alphabets = alphabets or DEFAULT_ALPHABETS
+    stages = stages or STAGES
+    report = {"started": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "platform": platform.platform(), "cpus": os.cpu_count(),
+              "config": {"sizes": sizes, "alphabets": alphabets, "stages": stages, "repeats": repeats, "workers": workers,
+                         "codec": codec, "rsa_key_size": EncryptionConstants.RSA_KEY_SIZE,
+                         "dh_key_size": EncryptionConstants.DIFFIE_HELLMAN_KEY_SIZE,
+                         "numpy": DH.np is not None and EncryptionConstants.USE_NUMPY},
+              "results": []}
+    results = report["results"]
+    with benchmark_tree() as directory:
+        DB.initialize_database()
+        if "keygen" in stages:
+            results += benchmark_keygen(repeats)
+        if "primes" in stages:
+            results += benchmark_primes(repeats)
+        for alphabet in alphabets:
+            for size in sizes:
+                corpus_paths = [os.path.join(directory, f"corpus_{alphabet}_{size}_{repeat}.txt") for repeat in range(repeats)]
+                for repeat, path in enumerate(corpus_paths):
+                    generate_corpus(path, size, alphabet, repeat)
+                if {"encrypt", "decrypt"} & set(stages):
+                    results += benchmark_ciphers(corpus_paths[0], size, alphabet, repeats, workers, stages)
+                if {"add", "list", "read", "delete", "end-to-end"} & set(stages):
+                    results += benchmark_database(corpus_paths, size, alphabet, workers, codec, stages)
+                for path in corpus_paths:
+                    os.remove(path)
+    return report
+
+
+def compare_reports(baseline, report):
+    """
+    Displays, for every measurement found in both reports, how the p50 latency and the throughput changed
+    :param baseline: The report of an earlier run, as loaded from its JSON file
+    :param report: The report of the current run
+    """
+    def key(result):
+        return tuple(result.get(name) for name in ("stage", "algorithm", "alphabet", "size"))
+
+    baseline_results = {key(result): result for result in baseline["results"]}
+    for result in report["results"]:
+        previous = baseline_results.get(key(result))
+        if previous is None:
+            continue
+        message = f"[COMPARISON] {describe(result)}: p50 {previous['p50_ms']} -> {result['p50_ms']} ms (x{result['p50_ms'] / max(previous['p50_ms'], 1e-9):.2f})"
+        if result["throughput_mb_s"] and previous["throughput_mb_s"]:
+            message += f", {previous['throughput_mb_s']} -> {result['throughput_mb_s']} MB/s (x{result['throughput_mb_s'] / previous['throughput_mb_s']:.2f})"
+        PM.display(message)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EncryptedDatabase benchmark suite: measures every stage on synthetic corpora, in a temporary Files/ tree and Database")
+    parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES), help="comma-separated corpus sizes, such as 1KB,1MB,1GB")
+    parser.add_argument("--alphabets", default=",".join(DEFAULT_ALPHABETS), help=f"comma-separated corpus alphabets, among {', '.join(ALPHABETS)}")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated stages, among {', '.join(STAGES)}")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="how many times every stage is measured")
+    parser.add_argument("--workers", type=int, default=EncryptionConstants.DEFAULT_WORKERS, help="the number of processes encrypting/decrypting in parallel")
+    parser.add_argument("--codec", choices=CM.CODEC_CHOICES, default=CM.CODEC_NONE, help="how the corpora are compressed when added to the Database")
+    parser.add_argument("--output", help="the JSON file the report is written to")
+    parser.add_argument("--compare", help="the JSON report of an earlier run, compared with this one")
+    parser.add_argument("--log", choices=list(PM.LOG_LEVELS), default="error", help="the lowest level that is logged to stderr")
+    arguments = parser.parse_args()
+    for name in arguments.alphabets.split(","):
+        if name not in ALPHABETS:
+            parser.error(f"unknown alphabet '{name}'")
+    for name in arguments.stages.split(","):
+        if name not in STAGES:
+            parser.error(f"unknown stage '{name}'")
+    PM.configure_logging(PM.LOG_LEVELS[arguments.log])
+    suite_report = run_suite([parse_size(size) for size in arguments.sizes.split(",")], arguments.alphabets.split(","),
+                             arguments.stages.split(","), arguments.repeats, arguments.workers, arguments.codec)
+    if arguments.output:
+        with open(arguments.output, "w") as report_file:
+            json.dump(suite_report, report_file, indent=2)
+        PM.display(f"[BENCHMARK] Report written at '{arguments.output}'")
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            compare_reports(json.load(baseline_file), suite_report)
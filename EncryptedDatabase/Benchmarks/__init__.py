@@ -0,0 +1,3 @@
+"""
+This package is responsible with measuring the performance of the encryption methods and of the database operations
+"""
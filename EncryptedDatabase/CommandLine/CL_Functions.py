@@ -1,76 +1,366 @@
-from tkinter import Tk
-from tkinter.filedialog import askopenfilename
+import argparse
+import contextlib
+import os
+import sys
+from datetime import datetime
 
-from Database import DB_Functions as DB
+from Database import DB_Listing
+from Database import DB_Repository
+from FileInteractionMethods import CompressionMethods as CM
 from FileInteractionMethods import ParsingMethods as PM
+from FileInteractionMethods import ProfilingMethods as PF
+from FileInteractionMethods.EncryptionMethods import EncryptionConstants
 
 
-def start():
+def ask_file_path():
+    """
+    Prompts a dialog window in order to select a file. tkinter is only imported here, so that the other commands (and the one-shot mode) do not need it.
+    :return: The path of the selected file
+    """
+    from tkinter import Tk
+    from tkinter.filedialog import askopenfilename
+    root = Tk()
+    root.withdraw()
+    root.attributes("-topmost", True)
+    file_path = askopenfilename(parent=root, filetypes=[("Text files", "*.txt")])
+    root.destroy()
+    return file_path
+
+
+def start(wipe=False):
     """
     Runs the command line and parses the commands, receiving parameters where it makes sense.
     Until the 'quit' command is typed or the program is terminated by force, the loop will continue to receive feedback from the user.
-    The Command Line begins by wiping the database clean (along with the Encrypted folder), however this can be skipped.
+    The Command Line can begin by wiping the database clean (along with the Encrypted folder), if asked to.
     The 'help' command will give more information about syntax.
+    :param wipe: True if the database and the Encrypted folder are wiped clean before starting
     """
-    # Comment if no initialization is wanted
-    DB.initialize_database()
-    print(
-        f"{PM.ConsoleColors.INFO}[COMMAND LINE] Welcome to EncryptedDatabase! Type 'help' for further information!{PM.ConsoleColors.ENDCHAR}")
+    # DB_Functions (with the encryption and the pool) is only imported by the commands that need it, so that 'list' starts faster
+    from Database import DB_Functions as DB
+    if wipe:
+        DB.initialize_database()
+    PM.LOGGER.info(
+        "[COMMAND LINE] Welcome to EncryptedDatabase! Type 'help' for further information!")
+    log_level = PM.LOGGER.level
+    structured = False
     while True:
         command = input("cmd> ")
         args = command.split(" ")
         if len(args) == 0:
-            print(f"{PM.ConsoleColors.ERROR}Command cannot be null! Try again!{PM.ConsoleColors.ENDCHAR}")
+            PM.LOGGER.error("Command cannot be null! Try again!")
             continue
         action = args[0]
-        if len(args) > 2:
-            print(
-                f"{PM.ConsoleColors.WARNING}[COMMAND LINE] No command requires more than 1 parameter! Ignoring everything from the first parameter forward!...{PM.ConsoleColors.ENDCHAR}")
+        workers = EncryptionConstants.DEFAULT_WORKERS
+        if "--workers" in args:
+            index = args.index("--workers")
+            if index + 1 >= len(args) or not args[index + 1].isdigit() or int(args[index + 1]) < 1:
+                PM.LOGGER.error(
+                    "[COMMAND LINE] The '--workers' option requires a positive number! Try again!")
+                continue
+            workers = int(args[index + 1])
+            del args[index:index + 2]
+        codec = CM.DEFAULT_CODEC
+        if "--codec" in args:
+            index = args.index("--codec")
+            if index + 1 >= len(args) or args[index + 1].lower() not in CM.CODEC_CHOICES:
+                PM.LOGGER.error(
+                    "[COMMAND LINE] The '--codec' option requires one of %s! Try again!", ', '.join(CM.CODEC_CHOICES))
+                continue
+            codec = args[index + 1].lower()
+            del args[index:index + 2]
+        if len(args) > 3 or (len(args) > 2 and action != "add-many"):
+            PM.LOGGER.warning(
+                "[COMMAND LINE] Only 'add-many' requires 2 parameters, the others require at most 1! Ignoring the extra parameters!...")
         if action == "add":
             if len(args) < 2:
-                print(f"{PM.ConsoleColors.ERROR}Insufficient parameters! Try again!{PM.ConsoleColors.ENDCHAR}")
+                PM.LOGGER.error("Insufficient parameters! Try again!")
                 continue
             param = args[1].lower()
-            print(
-                f"{PM.ConsoleColors.INFO}[COMMAND LINE] Prompting dialog window in order to select chosen file path!...{PM.ConsoleColors.ENDCHAR}")
-            root = Tk()
-            root.withdraw()
-            root.attributes("-topmost", True)
-            file_path = askopenfilename(parent=root, filetypes=[("Text files", "*.txt")])
-            print(
-                f"{PM.ConsoleColors.INFO}[COMMAND LINE] You have chosen the '{file_path}' path!...{PM.ConsoleColors.ENDCHAR}")
+            PM.LOGGER.info(
+                "[COMMAND LINE] Prompting dialog window in order to select chosen file path!...")
+            file_path = ask_file_path()
+            PM.LOGGER.info(
+                "[COMMAND LINE] You have chosen the '%s' path!...", file_path)
             if param != "rsa" and param != "dh":
-                print(
-                    f"{PM.ConsoleColors.WARNING}[SYSTEM] Unrecognized encryption algorithm! Using RSA by default!{PM.ConsoleColors.ENDCHAR}")
+                PM.LOGGER.warning(
+                    "[SYSTEM] Unrecognized encryption algorithm! Using RSA by default!")
                 param = "rsa"
-            DB.add_to_database(file_path, param)
+            DB.add_to_database(file_path, param, workers, codec)
+        elif action == "update":
+            if len(args) < 2:
+                PM.LOGGER.info(
+                    "[COMMAND LINE] Prompting dialog window in order to select chosen file path!...")
+                file_path = ask_file_path()
+            else:
+                file_path = args[1]
+            PM.LOGGER.info(
+                "[COMMAND LINE] You have chosen to update the file '%s' with the content at '%s'!...", os.path.basename(file_path), file_path)
+            DB.update_in_database(file_path, workers)
+        elif action == "add-many":
+            if len(args) < 3:
+                PM.LOGGER.error("Insufficient parameters! Try again!")
+                continue
+            param = args[2].lower()
+            if param != "rsa" and param != "dh":
+                PM.LOGGER.warning(
+                    "[SYSTEM] Unrecognized encryption algorithm! Using RSA by default!")
+                param = "rsa"
+            PM.LOGGER.info(
+                "[COMMAND LINE] You have chosen to add the files matching '%s' to the Database!...", args[1])
+            DB.add_many(args[1], param, workers, codec)
+        elif action == "read-many":
+            if len(args) < 2:
+                PM.LOGGER.error("Insufficient parameters! Try again!")
+                continue
+            PM.LOGGER.info(
+                "[COMMAND LINE] You have chosen to read the files matching '%s' from the Database!...", args[1])
+            DB.read_many(args[1], workers)
+        elif action == "delete-many":
+            if len(args) < 2:
+                PM.LOGGER.error("Insufficient parameters! Try again!")
+                continue
+            PM.LOGGER.info(
+                "[COMMAND LINE] You have chosen to delete the files matching '%s' from the Database, and also from the Encrypted Files folder!...", args[1])
+            DB.delete_many(args[1])
         elif action == "list":
-            if len(args) == 2:
-                print(f"{PM.ConsoleColors.INFO}Ignoring second parameter!{PM.ConsoleColors.ENDCHAR}")
-            DB.list_all()
+            if len(args) > 2:
+                PM.LOGGER.info("Ignoring extra parameters!")
+            DB.list_all(DB_Repository.FileFilter(prefix=args[1] if len(args) == 2 else None))
         elif action == "read":
             if len(args) < 2:
-                print(f"{PM.ConsoleColors.ERROR}Insufficient parameters! Try again!{PM.ConsoleColors.ENDCHAR}")
+                PM.LOGGER.error("Insufficient parameters! Try again!")
                 continue
             param = args[1]
-            print(
-                f"{PM.ConsoleColors.INFO}[COMMAND LINE] You have chosen to read the file '{param}' from the Database!...{PM.ConsoleColors.ENDCHAR}")
-            DB.read_from_database(param)
+            PM.LOGGER.info(
+                "[COMMAND LINE] You have chosen to read the file '%s' from the Database!...", param)
+            sys.stdout.flush()
+            if DB.read_from_database(param, workers, sys.stdout.buffer):
+                print()
+        elif action == "restore":
+            if len(args) < 2:
+                PM.LOGGER.error("Insufficient parameters! Try again!")
+                continue
+            param = args[1]
+            PM.LOGGER.info(
+                "[COMMAND LINE] You have chosen to restore the cached copy of the file '%s' in the Files folder!...", param)
+            DB.read_from_database(param, workers, None, True)
         elif action == "delete":
             if len(args) < 2:
-                print(f"{PM.ConsoleColors.ERROR}Insufficient parameters! Try again!{PM.ConsoleColors.ENDCHAR}")
+                PM.LOGGER.error("Insufficient parameters! Try again!")
                 continue
             param = args[1]
-            print(
-                f"{PM.ConsoleColors.INFO}[COMMAND LINE] You have chosen to delete the file '{param}' from the Database, and also from the Encrypted Files folder!...{PM.ConsoleColors.ENDCHAR}")
+            PM.LOGGER.info(
+                "[COMMAND LINE] You have chosen to delete the file '%s' from the Database, and also from the Encrypted Files folder!...", param)
             DB.delete_from_database(param)
+        elif action == "log":
+            if len(args) < 2:
+                PM.LOGGER.error("Insufficient parameters! Try again!")
+                continue
+            param = args[1].lower()
+            if param == "json" or param == "text":
+                structured = param == "json"
+            elif param in PM.LOG_LEVELS:
+                log_level = PM.LOG_LEVELS[param]
+            else:
+                PM.LOGGER.error(
+                    "[COMMAND LINE] Unrecognized log setting! Choose one of %s, json or text!", ', '.join(PM.LOG_LEVELS))
+                continue
+            PM.configure_logging(log_level, structured)
+            PM.LOGGER.info("[COMMAND LINE] Logging set to '%s'!", param)
+        elif action == "cache":
+            if len(args) == 2:
+                PM.LOGGER.info("Ignoring second parameter!")
+            DB.show_cache_stats()
+        elif action == "stats":
+            param = args[1].lower() if len(args) == 2 else ""
+            if param == "on" or param == "off":
+                PF.enable(param == "on")
+                PM.LOGGER.info("[COMMAND LINE] Instrumentation turned %s!", param)
+            elif param == "reset":
+                PF.reset()
+                PM.LOGGER.info("[COMMAND LINE] Timing spans cleared!")
+            elif param:
+                PM.LOGGER.error("[COMMAND LINE] Unrecognized stats setting! Choose one of on, off or reset!")
+            else:
+                PF.show_stats()
         elif action == "help":
-            print(
-                f"{PM.ConsoleColors.METADATA}This application allows you to store metadata about certain files in a Database, while caching the file in the Files directory! Once a file is added, is it encrypted and stored in the Files.Encrypted directory, and its metadata is stored alongside the encryption method used and parameters used for encryption/decryption!\n*The Database entries are uniquely identified by file name. That means that if you want to add a file with the same name as an existing one, you need to first delete it from the database. Files stored in the Files folder, where cached files are stored, can be overwritten!\nThe commands are:\n[ADD] add (encryption_method) - Prompts a dialog window where you navigate to the chosen file and select it. Using the selected encryption method - either RSA or DH (Diffie-Hellman), we store a copy of your file to the Files directory, we encrypt it and we store it in the Database.\n[LIST ALL FILES] list - Displays all files' names from the Database.\n[READ] read (file_name) - Fetch information about the selected file from the Database, decrypt it from the Encryption file stored when added and replaced with the cached version. Also opens file so the decrypted content can be seen.\n[DELETE] delete (file_name) - deletes the file entry from the Database, and removes its encrypted version from the Encrypted folder. The cached copy from the Files directory still remains, in case the user wants to add it again.\n[QUIT] quit - Terminates application.{PM.ConsoleColors.ENDCHAR}")
+            PM.display(
+                "This application allows you to store metadata about certain files in a Database, while caching the file in the Files directory! Once a file is added, is it encrypted and stored in the Files.Encrypted directory, and its metadata is stored alongside the encryption method used and parameters used for encryption/decryption!\n*The Database entries are uniquely identified by file name. That means that if you want to add a file with the same name as an existing one, you need to first delete it from the database. Files stored in the Files folder, where cached files are stored, can be overwritten!\nThe commands are:\n[ADD] add (encryption_method) - Prompts a dialog window where you navigate to the chosen file and select it. Using the selected encryption method - either RSA or DH (Diffie-Hellman), we store a copy of your file to the Files directory, we encrypt it and we store it in the Database.\n[LIST ALL FILES] list [name_prefix] - Displays the names of all the files from the Database (or of the files whose names start with the prefix). The one-shot 'list' command also filters them by algorithm, size and creation time, lists them a page at a time, counts them or writes them as JSON lines (see 'main.py list --help').\n[READ] read (file_name) - Fetch information about the selected file from the Database, decrypt it from the Encryption file stored when added and print its content.\n[RESTORE] restore (file_name) - Decrypts the selected file over its cached copy from the Files directory, if the cached copy was changed or deleted.\n[UPDATE] update [file_path] - Replaces the content of the file with the same name from the Database with the (modified) file at the given path, or with the file selected in a dialog window. Only the chunks of the file that changed since it was last stored are encrypted again, using the same encryption parameters.\n[DELETE] delete (file_name) - deletes the file entry from the Database, and removes its encrypted version from the Encrypted folder. The cached copy from the Files directory still remains, in case the user wants to add it again.\n[ADD MANY] add-many (directory|glob_pattern) (encryption_method) - Adds every .txt file from the directory (or every file matching the pattern) without prompting any dialog window. The files are encrypted in parallel and stored in the Database in a single transaction.\n[READ MANY] read-many (name_pattern) - Restores the cached copies (in the Files directory) of every file from the Database whose name matches the pattern (for example '*.txt').\n[DELETE MANY] delete-many (name_pattern) - Deletes every file from the Database whose name matches the pattern, along with their encrypted versions.\n[CACHE] cache - Displays the hits and misses of the caches that keep the key material and the decrypted content of the files read recently, so that reading them again is faster.\n[STATS] stats [on|off|reset] - Turns the instrumentation on or off, clears the timing spans, or (without a parameter) displays how many times every stage of the add, read, update and delete commands ran and how long it took (prime generation, key derivation, encryption, file I/O, SQLite...). The instrumentation is off by default, so that it costs nothing.\n[LOG] log (debug|info|quiet|error|json|text) - Chooses how much the application logs to stderr ('quiet' only shows warnings and errors, 'debug' also dumps key material and plaintext/ciphertext chunks) and whether the logs are colored text or JSON lines.\n[QUIT] quit - Terminates application.\n*The 'add', 'update', 'read', 'restore', 'add-many' and 'read-many' commands also accept a trailing '--workers N' option, which encrypts/decrypts the file in N parallel processes (useful for large files).\n*The 'add' and 'add-many' commands also accept a trailing '--codec (auto|none|zlib|lzma)' option, choosing how the files are compressed before being encrypted. By default ('none'), the files are not compressed, so that 'update' only encrypts the chunks that changed. With 'auto', a sample of every file is compressed with each codec (their ratio and throughput being logged) and compression is skipped if it does not help. A compressed file is encrypted whole by every 'update'.")
         elif action == "quit":
-            print(
-                f"{PM.ConsoleColors.INFO}[COMMAND LINE] You have chosen to quit the application! Terminating...{PM.ConsoleColors.ENDCHAR}")
+            PM.LOGGER.info(
+                "[COMMAND LINE] You have chosen to quit the application! Terminating...")
             break
         else:
-            print(
-                f"{PM.ConsoleColors.ERROR}[COMMAND LINE] Unrecognized command! Try again!...{PM.ConsoleColors.ENDCHAR}")
+            PM.LOGGER.error(
+                "[COMMAND LINE] Unrecognized command! Try again!...")
+
+
+def positive_number(text):
+    """
+    Parses a positive number given as a command line argument
+    :param text: The argument
+    :return: The parsed number
+    """
+    if not text.isdigit() or int(text) < 1:
+        raise argparse.ArgumentTypeError("a positive number is required")
+    return int(text)
+
+
+def non_negative_number(text):
+    """
+    Parses a number of bytes (or any other number that may be 0) given as a command line argument
+    :param text: The argument
+    :return: The parsed number
+    """
+    if not text.isdigit():
+        raise argparse.ArgumentTypeError("a non-negative number is required")
+    return int(text)
+
+
+def timestamp(text):
+    """
+    Parses a date (or a date and time) in ISO format given as a command line argument, for example '2024-01-31' or '2024-01-31T12:00'
+    :param text: The argument
+    :return: The POSIX timestamp of that (local) time
+    """
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError("a date in ISO format (YYYY-MM-DD[THH:MM[:SS]]) is required")
+
+
+def list_columns(text):
+    """
+    Parses the comma-separated columns listed by 'list --fields'
+    :param text: The argument
+    :return: The touple of column names, without the id (which is always listed)
+    """
+    columns = tuple(column for column in text.lower().split(",") if column and column != "id")
+    unknown = [column for column in columns if column not in DB_Repository.LIST_COLUMNS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown columns {', '.join(unknown)} (choose from {', '.join(DB_Repository.LIST_COLUMNS)})")
+    return columns
+
+
+def build_parser():
+    """
+    Builds the parser of the one-shot (non-interactive) mode, where a single command is given as program arguments
+    :return: The argument parser
+    """
+    parser = argparse.ArgumentParser(prog="main.py", description="EncryptedDatabase - stores files encrypted with RSA or Diffie-Hellman. Without a command, the interactive Command Line is started.")
+    parser.add_argument("--wipe", action="store_true", help="wipe the Database and the Encrypted folder clean before running")
+    parser.add_argument("--log", choices=list(PM.LOG_LEVELS), default="info", help="the lowest level that is logged to stderr")
+    parser.add_argument("--json-logs", action="store_true", help="log JSON lines instead of colored text")
+    parser.add_argument("--stats", action="store_true", help="time every stage of the command and display the timing spans afterwards")
+    parser.add_argument("--profile", help="profile the command into the given file: a Chrome trace of the timing spans for a '.json' path, a cProfile dump otherwise")
+    commands = parser.add_subparsers(dest="command")
+    workers = argparse.ArgumentParser(add_help=False)
+    workers.add_argument("--workers", type=positive_number, default=EncryptionConstants.DEFAULT_WORKERS, help="the number of processes encrypting/decrypting in parallel")
+    add_command = commands.add_parser("add", parents=[workers], help="encrypt files and add them to the Database")
+    add_command.add_argument("--alg", choices=["rsa", "dh"], default="rsa", help="the encryption algorithm")
+    add_command.add_argument("--codec", choices=CM.CODEC_CHOICES, default=CM.DEFAULT_CODEC, help="how the files are compressed before being encrypted ('auto' chooses for every file; 'update' encrypts compressed files whole, so none by default)")
+    add_command.add_argument("paths", nargs="+", help="the paths of the files")
+    add_many_command = commands.add_parser("add-many", parents=[workers], help="add every .txt file from a directory, or every file matching a glob pattern")
+    add_many_command.add_argument("--alg", choices=["rsa", "dh"], default="rsa", help="the encryption algorithm")
+    add_many_command.add_argument("--codec", choices=CM.CODEC_CHOICES, default=CM.DEFAULT_CODEC, help="how the files are compressed before being encrypted ('auto' chooses for every file; 'update' encrypts compressed files whole, so none by default)")
+    add_many_command.add_argument("pattern", help="a directory or a glob pattern")
+    update_command = commands.add_parser("update", parents=[workers], help="replace the content of files from the Database, encrypting only the chunks that changed")
+    update_command.add_argument("paths", nargs="+", help="the paths of the modified files")
+    list_command = commands.add_parser("list", help="list the files from the Database, optionally filtered and a page at a time")
+    list_command.add_argument("--prefix", help="only the files whose names start with the prefix")
+    list_command.add_argument("--alg", choices=["rsa", "dh"], help="only the files encrypted with the algorithm")
+    list_command.add_argument("--min-size", type=non_negative_number, help="only the files of at least that many bytes")
+    list_command.add_argument("--max-size", type=non_negative_number, help="only the files of at most that many bytes")
+    list_command.add_argument("--created-after", type=timestamp, help="only the files created at or after that date (YYYY-MM-DD[THH:MM])")
+    list_command.add_argument("--created-before", type=timestamp, help="only the files created before that date (YYYY-MM-DD[THH:MM])")
+    list_command.add_argument("--fields", type=list_columns, default=("name",), help=f"the comma-separated columns listed after the id, from {','.join(DB_Repository.LIST_COLUMNS)} (name by default)")
+    list_command.add_argument("--limit", type=positive_number, help="the most files listed (a page)")
+    list_command.add_argument("--after", type=non_negative_number, default=0, help="only the files with a greater id, to continue from the last id of the previous page")
+    list_command.add_argument("--count", action="store_true", help="only display how many files match")
+    list_command.add_argument("--json", action="store_true", help="write every file (or the count) to stdout as a JSON line")
+    read_command = commands.add_parser("read", parents=[workers], help="decrypt files and write their content to stdout (or to a file)")
+    read_command.add_argument("names", nargs="+", help="the names of the files")
+    read_command.add_argument("--output", help="the file the content is written to, instead of stdout")
+    read_command.add_argument("--restore", action="store_true", help="restore the cached copies from the Files folder (if they changed) instead of writing the content to stdout")
+    read_many_command = commands.add_parser("read-many", parents=[workers], help="restore the cached copies of every file whose name matches the pattern in the Files folder")
+    read_many_command.add_argument("pattern", help="a glob pattern matched against the file names")
+    delete_command = commands.add_parser("delete", help="delete files from the Database and their encrypted versions")
+    delete_command.add_argument("names", nargs="+", help="the names of the files")
+    delete_many_command = commands.add_parser("delete-many", help="delete every file whose name matches the pattern")
+    delete_many_command.add_argument("pattern", help="a glob pattern matched against the file names")
+    serve_command = commands.add_parser("serve", parents=[workers], help="serve the commands to many clients over a local socket, as JSON lines")
+    serve_command.add_argument("--host", help="the address of the TCP socket (127.0.0.1 by default)")
+    serve_command.add_argument("--port", type=int, help="the port of the TCP socket (8765 by default)")
+    serve_command.add_argument("--socket", help="the path of a UNIX socket, used instead of TCP")
+    return parser
+
+
+def run(argv):
+    """
+    Runs a single command given as program arguments (for example 'add --alg dh a.txt b.txt'), or the interactive Command Line if no command is given
+    :param argv: The program arguments
+    :return: The exit status: 0 if no error was logged, 1 otherwise
+    """
+    arguments = build_parser().parse_args(argv)
+    PM.configure_logging(PM.LOG_LEVELS[arguments.log], arguments.json_logs)
+    PF.enable(arguments.stats)
+    if arguments.command is None:
+        start(arguments.wipe)
+        return 0
+    if arguments.wipe:
+        from Database import DB_Functions as DB
+        DB.initialize_database()
+    with PF.profiled(arguments.profile) if arguments.profile else contextlib.nullcontext():
+        run_command(arguments)
+    if arguments.stats:
+        PF.show_stats()
+    return 1 if PM.LOGGER.error_count else 0
+
+
+def run_command(arguments):
+    """
+    Runs the single command parsed from the program arguments
+    :param arguments: The parsed program arguments
+    """
+    if arguments.command == "list":
+        file_filter = DB_Repository.FileFilter(arguments.prefix, arguments.alg and arguments.alg.upper(),
+                                               arguments.min_size, arguments.max_size, arguments.created_after,
+                                               arguments.created_before)
+        DB_Listing.list_all(DB_Repository.get_repository(DB_Repository.DATABASE_PATH), file_filter, arguments.fields,
+                            arguments.after, arguments.limit, arguments.count, arguments.json)
+        return
+    # DB_Functions (with the encryption and the pool) is only imported by the commands that need it, so that 'list' starts faster
+    from Database import DB_Functions as DB
+    if arguments.command == "add":
+        if len(arguments.paths) == 1:
+            DB.add_to_database((os.path.abspath(arguments.paths[0])).replace("\\", "/"), arguments.alg, arguments.workers,
+                               arguments.codec)
+        else:
+            DB.add_files(arguments.paths, arguments.alg, arguments.workers, arguments.codec)
+    elif arguments.command == "add-many":
+        DB.add_many(arguments.pattern, arguments.alg, arguments.workers, arguments.codec)
+    elif arguments.command == "update":
+        for path in arguments.paths:
+            DB.update_in_database(path, arguments.workers)
+    elif arguments.command == "read":
+        with contextlib.ExitStack() as stack:
+            output = None
+            if arguments.output is not None:
+                output = stack.enter_context(open(arguments.output, "wb"))
+            elif not arguments.restore:
+                output = sys.stdout.buffer
+            for name in arguments.names:
+                DB.read_from_database(name, arguments.workers, output, arguments.restore)
+    elif arguments.command == "read-many":
+        DB.read_many(arguments.pattern, arguments.workers)
+    elif arguments.command == "delete":
+        for name in arguments.names:
+            DB.delete_from_database(name)
+    elif arguments.command == "delete-many":
+        DB.delete_many(arguments.pattern)
+    elif arguments.command == "serve":
+        # The service (and asyncio) is only imported when it is started, so that the other commands start faster
+        from Service import SV_Functions as SV
+        SV.start(arguments.workers, SV.DEFAULT_HOST if arguments.host is None else arguments.host,
+                 SV.DEFAULT_PORT if arguments.port is None else arguments.port, arguments.socket)
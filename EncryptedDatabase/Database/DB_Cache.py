@@ -0,0 +1,90 @@
+import collections
+import threading
+
+# The caches are bounded by the (estimated) number of bytes they hold, not by their number of entries
+KEY_CACHE_SIZE = 1024 * 1024
+CONTENT_CACHE_SIZE = 64 * 1024 * 1024
+# A rough upper bound of the memory held by the key material of one file (the numbers, and for RSA the two 256-entry codebooks)
+KEY_ENTRY_SIZE = 16 * 1024
+# Larger decrypted files are never cached, so that a single file cannot evict everything else
+MAX_CACHED_FILE_SIZE = CONTENT_CACHE_SIZE // 4
+
+
+class LRUCache:
+    """
+    A cache that evicts the least recently used entries once the total size of its entries exceeds the given limit.
+    It counts hits and misses, so that its efficiency can be reported.
+    Every operation holds a lock, since the caches are also used from the threads of the service (asyncio.to_thread).
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: The largest total size of the entries, in bytes
+        """
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def get(self, key):
+        """
+        Fetches an entry, marking it as the most recently used one
+        :param key: The key of the entry
+        :return: The cached value, or None if it is not cached
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, value, size):
+        """
+        Caches an entry, evicting the least recently used ones until everything fits. Entries larger than the whole cache are not stored.
+        :param key: The key of the entry
+        :param value: The value to be cached
+        :param size: The size of the value, in bytes
+        """
+        with self.lock:
+            self.discard(key)
+            if size > self.max_size:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def discard(self, key):
+        """
+        Removes an entry, if it is cached
+        :param key: The key of the entry
+        """
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+    def clear(self):
+        """
+        Removes all the entries (the counters are kept)
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        :return: A touple of the number of entries, their total size, the number of hits and the number of misses
+        """
+        with self.lock:
+            return len(self.entries), self.size, self.hits, self.misses
+
+
+# The key material derived from the encryption parameters, keyed by the row id and the parameters of the file
+KEY_CACHE = LRUCache(KEY_CACHE_SIZE)
+# The decrypted files, keyed by the path, modification time and size of their encrypted versions
+CONTENT_CACHE = LRUCache(CONTENT_CACHE_SIZE)
@@ -1,13 +1,31 @@
+import glob
+import hashlib
 import os
 import shutil
 import sqlite3
+import zlib
 from datetime import datetime
 
+from Database import DB_Cache
+from Database import DB_Listing
+from Database import DB_Repository
+from FileInteractionMethods import CompressionMethods as CM
 from FileInteractionMethods import ParsingMethods as PM
+from FileInteractionMethods import ProfilingMethods as PF
 from FileInteractionMethods.EncryptionMethods import Diffie_Hellman_Encryption as DH
+from FileInteractionMethods.EncryptionMethods import EncryptionConstants
 from FileInteractionMethods.EncryptionMethods import RSA_Encryption as RSA
 
-DATABASE_PATH = 'Database/files_database.db'
+# Replaced by the benchmarks (and the tests) with the path of a scratch Database
+DATABASE_PATH = DB_Repository.DATABASE_PATH
+
+
+def get_repository():
+    """
+    Returns the repository holding the (single, long-lived) connection to the Database
+    :return: The repository of the Database
+    """
+    return DB_Repository.get_repository(DATABASE_PATH)
 
 
 def initialize_database():
@@ -15,39 +33,22 @@ def initialize_database():
     Initialize database in order to store the appropriate file information.
     This function deleted all the files from the Files/Encrypted folder, while also wiping the Database clean of any record.
     """
-    print(f"{PM.ConsoleColors.INFO}[SYSTEM] Wiping the Encrypted folder clean...{PM.ConsoleColors.ENDCHAR}")
+    PM.LOGGER.info("[SYSTEM] Wiping the Encrypted folder clean...")
     for file in os.listdir(PM.ENCRYPTED_FILES_PATH):
         file_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, file)).replace("\\", "/")
         try:
             os.unlink(file_path)
         except Exception as err:
-            print("Failed to delete file %s : %s" % (file_path, err))
-    print(f"{PM.ConsoleColors.SUCCESS}[SYSTEM] Encrypted folder cleared...{PM.ConsoleColors.ENDCHAR}")
-    print(f"{PM.ConsoleColors.INFO}[DATABASE] Database creation started...{PM.ConsoleColors.ENDCHAR}")
-    init_conn = sqlite3.connect(DATABASE_PATH)
+            PM.LOGGER.error("[SYSTEM] Failed to delete file %s : %s", file_path, err)
+    PM.LOGGER.success("[SYSTEM] Encrypted folder cleared...")
+    DB_Cache.KEY_CACHE.clear()
+    DB_Cache.CONTENT_CACHE.clear()
+    PM.LOGGER.info("[DATABASE] Database creation started...")
     try:
-        c = init_conn.cursor()
-        c.execute("""DROP TABLE IF EXISTS files""")
-        c.execute("""CREATE TABLE files (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                encryption_type TEXT NOT NULL,
-                encryption_param_1 INTEGER,
-                encryption_param_2 INTEGER,
-                encryption_param_3 INTEGER DEFAULT -1,
-                encryption_param_4 INTEGER DEFAULT -1,
-                size INTEGER,
-                last_access TIMESTAMP,
-                last_modification TIMESTAMP,
-                creation_time TIMESTAMP)""")
-        init_conn.commit()
-        c.close()
-        print(f"{PM.ConsoleColors.SUCCESS}[DATABASE] Database creation completed!{PM.ConsoleColors.ENDCHAR}")
+        get_repository().create_table()
+        PM.LOGGER.success("[DATABASE] Database creation completed!")
     except sqlite3.Error as err:
-        print("[DATABASE] Failed to create SqLite table", err)
-    finally:
-        if init_conn:
-            init_conn.close()
+        PM.LOGGER.error("[DATABASE] Failed to create SqLite table: %s", err)
 
 
 def is_in_database(file_name):
@@ -57,86 +58,91 @@ def is_in_database(file_name):
     :return: True if any files exist, False otherwise
     """
     is_found = False
-    check_conn = sqlite3.connect(DATABASE_PATH)
     try:
-        c = check_conn.cursor()
-        check_command = """SELECT * FROM files WHERE name = (?)"""
-        c.execute(check_command, (file_name,))
-        data = c.fetchall()
-        if not data:
-            is_found = False
-        else:
-            is_found = True
-        c.close()
+        is_found = get_repository().contains(file_name)
     except sqlite3.Error as err:
-        print("[DATABASE] Failed to check from SqLite table", err)
-    finally:
-        if check_conn:
-            check_conn.close()
+        PM.LOGGER.error("[DATABASE] Failed to check from SqLite table: %s", err)
     return is_found
 
 
-def add_with_RSA(file_name):
+def get_encrypted_file_name(data):
+    """
+    Returns the name of the encrypted file (from the Files/Encrypted folder) holding the content of a file
+    :param data: The row of the file from the Database
+    :return: The name of its blob, or of its own encrypted file if it was stored before the blobs
+    """
+    if data[11] is not None:
+        return get_blob_file_name(data[11], data[2])
+    return data[1][:-4] + "_encrypted.txt"
+
+
+def get_blob_file_name(digest, encryption_type):
+    """
+    Returns the name of the encrypted file holding the content with the given digest, encrypted with the given algorithm
+    :param digest: The SHA-256 digest of the plaintext
+    :param encryption_type: Either "RSA" or "DH"
+    :return: The name of the blob, in the Files/Encrypted folder
+    """
+    return f"{digest}_{encryption_type.lower()}.blob"
+
+
+def add_with_RSA(file_name, digest, complete, workers=EncryptionConstants.DEFAULT_WORKERS, codec=CM.CODEC_NONE):
     """
     Inserts the metadata of the specified file into the DataBase, while also encrypting the file with RSA and storing it in the Files/Encrypted folder (in encrypted form).
     :param file_name: The name of the file to be encrypted with RSA and stored in the Database
+    :param digest: The SHA-256 digest of the file, naming the blob the encrypted file is stored as
+    :param complete: The function storing the encryption parameters and metadata in the entry inserted for the file
+    :param workers: The number of processes encrypting the file in parallel
+    :param codec: The codec the file is compressed with before being encrypted
     """
     before_path = (os.path.join(PM.SIMPLE_FILES_PATH, file_name)).replace("\\", "/")
-    after_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, file_name[:-4] + "_encrypted.txt")).replace("\\", "/")
-    param1, param2 = RSA.compute_initial_prime_numbers()
-    print(
-        f"{PM.ConsoleColors.INFO}[RSA] The two selected prime numbers are: {str(param1)} and {str(param2)} {PM.ConsoleColors.ENDCHAR}")
-    RSA.encrypt(before_path, after_path, param1, param2)
+    after_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, get_blob_file_name(digest, "RSA"))).replace("\\", "/")
+    with PF.span("add.keygen"):
+        param1, param2 = RSA.compute_initial_prime_numbers()
+        key = RSA.RSAKey(param1, param2)
+    PM.LOGGER.debug("[RSA] The two selected prime numbers are: %s and %s", param1, param2)
+    with CM.compressed_copy(before_path, codec) as source_path, PF.span("add.encrypt"):
+        RSA.encrypt(source_path, after_path, param1, param2, workers, key)
+    with PF.span("add.manifest"):
+        manifest = compute_blob_manifest(before_path, after_path, codec)
     size, atime, mtime, ctime = PM.extract_file_metadata(before_path)
-    add_conn = sqlite3.connect(DATABASE_PATH)
-    try:
-        c = add_conn.cursor()
-        add_command = """INSERT INTO files(name, encryption_type, encryption_param_1, encryption_param_2, size, last_access, last_modification, creation_time) VALUES (?,?,?,?,?,?,?,?)"""
-        param_touple = (file_name, "RSA", param1, param2, size, atime, mtime, ctime)
-        c.execute(add_command, param_touple)
-        add_conn.commit()
-        c.close()
-        print(
-            f"{PM.ConsoleColors.SUCCESS}[DATABASE] File '{file_name}' added to DataBase using RSA Encryption!{PM.ConsoleColors.ENDCHAR}")
-    except sqlite3.Error as err:
-        print("[DATABASE] Failed to add into SqLite table", err)
-    finally:
-        if add_conn:
-            add_conn.close()
+    with PF.span("add.sqlite"):
+        complete((param1, param2), (size, atime, mtime, ctime), digest, codec, key.material(), manifest)
+    PM.LOGGER.success(
+        "[DATABASE] File '%s' added to DataBase using RSA Encryption!", file_name)
 
 
-def add_with_DH(file_name):
+def add_with_DH(file_name, digest, complete, workers=EncryptionConstants.DEFAULT_WORKERS, codec=CM.CODEC_NONE):
     """
     Inserts the metadata of the specified file into the DataBase, while also encrypting the file with Diffie-Hellman and storing it in the Files/Encrypted folder (in encrypted form).
     :param file_name: The name of the file to be encrypted with Diffie-Hellman and stored in the Database
+    :param digest: The SHA-256 digest of the file, naming the blob the encrypted file is stored as
+    :param complete: The function storing the encryption parameters and metadata in the entry inserted for the file
+    :param workers: The number of processes encrypting the file in parallel
+    :param codec: The codec the file is compressed with before being encrypted
     """
     before_path = (os.path.join(PM.SIMPLE_FILES_PATH, file_name)).replace("\\", "/")
-    after_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, file_name[:-4] + "_encrypted.txt")).replace("\\", "/")
-    pb_key1, pr_key1, pb_key2, pr_key2 = DH.compute_initial_prime_numbers()
+    after_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, get_blob_file_name(digest, "DH"))).replace("\\", "/")
+    with PF.span("add.keygen"):
+        pb_key1, pr_key1, pb_key2, pr_key2 = DH.compute_initial_prime_numbers()
+        full_key = DH.derive_full_key(pb_key1, pr_key1, pb_key2, pr_key2)
 
-    print(
-        f"{PM.ConsoleColors.INFO}[DIFFIE-HELLMAN] Party 1 has the key pair ({str(pb_key1)},{str(pr_key1)}), while Party 2 has the key pair ({str(pb_key2)},{str(pr_key2)}){PM.ConsoleColors.ENDCHAR}")
+    PM.LOGGER.debug("[DIFFIE-HELLMAN] Party 1 has the key pair (%s,%s), while Party 2 has the key pair (%s,%s)",
+                    pb_key1, pr_key1, pb_key2, pr_key2)
 
-    DH.encrypt(before_path, after_path, pb_key1, pr_key1, pb_key2, pr_key2)
+    with CM.compressed_copy(before_path, codec) as source_path, PF.span("add.encrypt"):
+        DH.encrypt(source_path, after_path, pb_key1, pr_key1, pb_key2, pr_key2, workers, full_key)
+    with PF.span("add.manifest"):
+        manifest = compute_blob_manifest(before_path, after_path, codec)
     size, atime, mtime, ctime = PM.extract_file_metadata(before_path)
-    add_conn = sqlite3.connect(DATABASE_PATH)
-    try:
-        c = add_conn.cursor()
-        add_command = """INSERT INTO files(name, encryption_type, encryption_param_1, encryption_param_2, encryption_param_3, encryption_param_4, size, last_access, last_modification, creation_time) VALUES (?,?,?,?,?,?,?,?,?,?)"""
-        param_touple = (file_name, "DH", pb_key1, pr_key1, pb_key2, pr_key2, size, atime, mtime, ctime)
-        c.execute(add_command, param_touple)
-        add_conn.commit()
-        c.close()
-        print(
-            f"{PM.ConsoleColors.SUCCESS}[DATABASE] File '{file_name}' added to DataBase using Diffie-Hellman Encryption!{PM.ConsoleColors.ENDCHAR}")
-    except sqlite3.Error as err:
-        print("[DATABASE] Failed to add into SqLite table", err)
-    finally:
-        if add_conn:
-            add_conn.close()
+    with PF.span("add.sqlite"):
+        complete((pb_key1, pr_key1, pb_key2, pr_key2), (size, atime, mtime, ctime), digest, codec, (full_key,), manifest)
+    PM.LOGGER.success(
+        "[DATABASE] File '%s' added to DataBase using Diffie-Hellman Encryption!", file_name)
 
 
-def add_to_database(file_path, encryption_alg):
+@PF.timed("add")
+def add_to_database(file_path, encryption_alg, workers=EncryptionConstants.DEFAULT_WORKERS, codec=CM.DEFAULT_CODEC):
     """
     The method the user will interact with the database. Specifying the file name and the algorithm, we will encrypt the file with the chosen algorithm and add the file metadata to the Database.
     This method is secured and if something is wrong, an exception will be logged.
@@ -144,172 +150,749 @@ def add_to_database(file_path, encryption_alg):
     :param file_path: In the Command Line, a dialog box will be opened so that the user can interactively select the file he wants to encrypt. Then, this function 'caches' a copy of that file in the Files/ folder,
     or does nothing, if the file is selected from the Files/ folder
     :param encryption_alg: Represents the chosen Encryption Algorithm (RSA or Diffie-Hellman) that will be used for encrypting/decrypting the file. Is RSA by default.
+    :param workers: The number of processes encrypting the file in parallel
+    :param codec: The codec the file is compressed with before being encrypted (one of CompressionMethods.CODEC_CHOICES), not compressed by default
     """
     if not os.path.exists(file_path) or not os.path.isfile(file_path):
-        print(f"{PM.ConsoleColors.ERROR}[SYSTEM] Given path is not a valid one!{PM.ConsoleColors.ENDCHAR}")
+        PM.LOGGER.error("[SYSTEM] Given path is not a valid one!")
         return
     file_name = os.path.basename(file_path)
-    if is_in_database(file_name):
-        print(
-            f"{PM.ConsoleColors.ERROR}[SYSTEM] Error when attempting to add :  File '{file_name}' is already in DataBase!{PM.ConsoleColors.ENDCHAR}")
+    # The entry is inserted (in a transaction) before the file is copied and encrypted, so that the UNIQUE index on the name detects duplicates
+    try:
+        with get_repository().adding(file_name, "RSA" if encryption_alg == "rsa" else "DH") as complete:
+            copy_and_encrypt(file_path, file_name, encryption_alg, complete, workers, codec)
+    except sqlite3.IntegrityError:
+        PM.LOGGER.error(
+            "[SYSTEM] Error when attempting to add :  File '%s' is already in DataBase!", file_name)
+    except sqlite3.Error as err:
+        PM.LOGGER.error("[DATABASE] Failed to add into SqLite table: %s", err)
+
+
+def copy_and_encrypt(file_path, file_name, encryption_alg, complete, workers=EncryptionConstants.DEFAULT_WORKERS,
+                     codec=CM.DEFAULT_CODEC):
+    """
+    Caches a copy of the file in the Files/ folder (unless it was selected from there), then encrypts it with the chosen algorithm.
+    If the same content was already encrypted with that algorithm, the existing blob is referenced instead.
+    :param file_path: The path of the file selected by the user
+    :param file_name: The name of the file
+    :param encryption_alg: The chosen Encryption Algorithm, either "rsa" or "dh"
+    :param complete: The function storing the encryption parameters and metadata in the entry inserted for the file
+    :param workers: The number of processes encrypting the file in parallel
+    :param codec: The codec the file is compressed with before being encrypted (one of CompressionMethods.CODEC_CHOICES)
+    """
+    with PF.span("add.copy"):
+        digest = cache_file(file_path, file_name)
+    if digest is None:
         return
+    encryption_type = "RSA" if encryption_alg == "rsa" else "DH"
+    with PF.span("add.sqlite"):
+        blob = get_repository().fetch_blob(digest, encryption_type)
+    before_path = (os.path.join(PM.SIMPLE_FILES_PATH, file_name)).replace("\\", "/")
+    if blob is not None:
+        complete(parse_params(blob[:4]), PM.extract_file_metadata(before_path), digest, blob[4])
+        PM.LOGGER.success(
+            "[DEDUP] The content of '%s' is already stored, skipping encryption!", file_name)
+    elif encryption_alg == "rsa":
+        add_with_RSA(file_name, digest, complete, workers, choose_codec(before_path, encryption_alg, codec))
+    else:
+        add_with_DH(file_name, digest, complete, workers, choose_codec(before_path, encryption_alg, codec))
+
+
+def parse_params(param_columns):
+    """
+    Parses the encryption parameters stored in the Database
+    :param param_columns: The four encryption parameters, stored as text (since they can exceed the 64-bit SQLite integers), or as integers by the tables created before
+    :return: The two (for RSA) or four (for Diffie-Hellman) encryption parameters, as numbers
+    """
+    return [int(param) for param in param_columns if str(param) != "-1"]
+
+
+def parse_key_material(material_column):
+    """
+    Parses the key material stored in the keys table
+    :param material_column: The key material, stored as comma-separated numbers (since they can exceed the 64-bit SQLite integers), or None if it was not stored
+    :return: The key material, as a touple of numbers, or None
+    """
+    if material_column is None:
+        return None
+    return tuple(int(value) for value in material_column.split(","))
+
+
+def get_stored_material(key):
+    """
+    :param key: The RSA key material, or the Diffie-Hellman full key
+    :return: The key material, as the touple of numbers stored in the keys table
+    """
+    return key.material() if isinstance(key, RSA.RSAKey) else (key,)
+
+
+def choose_codec(path, encryption_alg, codec=CM.DEFAULT_CODEC):
+    """
+    Chooses the codec a file is compressed with before being encrypted (see CompressionMethods.choose_codec).
+    Files encrypted with RSA one character at a time (when RSA_BLOCK_MODE is disabled) are never compressed, since they are read as text.
+    :param path: Path of the file, in the Files/ folder
+    :param encryption_alg: The chosen Encryption Algorithm, either "rsa" or "dh"
+    :param codec: One of CompressionMethods.CODEC_CHOICES
+    :return: The chosen codec
+    """
+    if encryption_alg == "rsa" and not EncryptionConstants.RSA_BLOCK_MODE:
+        return CM.CODEC_NONE
+    with PF.span("add.codec"):
+        return CM.choose_codec(path, codec)
+
+
+def cache_file(file_path, file_name):
+    """
+    Caches a copy of the file in the Files/ folder, overriding any file with the same name, or does nothing if the file was selected from the Files/ folder.
+    The SHA-256 digest of the content is computed while it is copied.
+    :param file_path: The absolute path of the file selected by the user
+    :param file_name: The name of the file
+    :return: The hexadecimal digest of the file if it is in the Files/ folder, None otherwise
+    """
     simple_files_path = (os.path.abspath(os.path.join(PM.SIMPLE_FILES_PATH, file_name))).replace("\\", "/")
     if simple_files_path != file_path:
         if os.path.exists((os.path.join(PM.SIMPLE_FILES_PATH, file_name)).replace("\\", "/")):
-            print(
-                f"{PM.ConsoleColors.WARNING}[SYSTEM] A file with the name '{file_name}' already exists in the Files folder! Overriding!...{PM.ConsoleColors.ENDCHAR}")
+            PM.LOGGER.warning(
+                "[SYSTEM] A file with the name '%s' already exists in the Files folder! Overriding!...", file_name)
             os.remove(simple_files_path)
-        shutil.copy2(file_path, (os.path.abspath(PM.SIMPLE_FILES_PATH)).replace("\\", "/"))
-        print(
-            f"{PM.ConsoleColors.INFO}[SYSTEM] File '{file_name}' copied to Files folder at '{simple_files_path}'{PM.ConsoleColors.ENDCHAR}")
+        digest = PM.copy_and_hash(file_path, simple_files_path)
+        PM.LOGGER.info(
+            "[SYSTEM] File '%s' copied to Files folder at '%s'", file_name, simple_files_path)
     else:
-        print(
-            f"{PM.ConsoleColors.INFO}[SYSTEM] File '{file_name}' chosen from the Files folder!{PM.ConsoleColors.ENDCHAR}")
-    if not PM.verify_file(file_name, True):
+        PM.LOGGER.info(
+            "[SYSTEM] File '%s' chosen from the Files folder!", file_name)
+        if not PM.verify_file(file_name, True):
+            return None
+        digest = PM.hash_file(simple_files_path)
+    return digest if PM.verify_file(file_name, True) else None
+
+
+def encrypt_file(job):
+    """
+    Encrypts a file from the Files/ folder with the chosen algorithm, storing it as a blob in the Files/Encrypted folder. It is run by add_many, possibly in a worker process.
+    :param job: A (file name, encryption algorithm, digest, codec) touple, the algorithm being either "rsa" or "dh", and the codec one of CompressionMethods.CODEC_CHOICES
+    :return: The (name, encryption type, encryption parameters, size, time of last access, time of last modification, time of creation, digest, codec, key material, manifest) touple of the file, or None if the encryption failed
+    """
+    file_name, encryption_alg, digest, codec = job
+    encryption_type = "RSA" if encryption_alg == "rsa" else "DH"
+    before_path = (os.path.join(PM.SIMPLE_FILES_PATH, file_name)).replace("\\", "/")
+    after_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, get_blob_file_name(digest, encryption_type))).replace("\\", "/")
+    try:
+        codec = choose_codec(before_path, encryption_alg, codec)
+        with CM.compressed_copy(before_path, codec) as source_path:
+            if encryption_alg == "rsa":
+                params = RSA.compute_initial_prime_numbers()
+                key = RSA.RSAKey(*params)
+                RSA.encrypt(source_path, after_path, *params, EncryptionConstants.DEFAULT_WORKERS, key)
+            else:
+                params = DH.compute_initial_prime_numbers()
+                key = DH.derive_full_key(*params)
+                DH.encrypt(source_path, after_path, *params, EncryptionConstants.DEFAULT_WORKERS, key)
+        manifest = compute_blob_manifest(before_path, after_path, codec)
+    except Exception as err:
+        PM.LOGGER.error("[SYSTEM] Failed to encrypt file %s : %s", file_name, err)
+        return None
+    return (file_name, encryption_type, params, *PM.extract_file_metadata(before_path), digest, codec,
+            get_stored_material(key), manifest)
+
+
+def add_many(pattern, encryption_alg, workers=EncryptionConstants.DEFAULT_WORKERS, codec=CM.DEFAULT_CODEC):
+    """
+    Adds all the files matching the pattern to the Database at once (see add_files)
+    :param pattern: Either a directory (whose .txt files are added) or a glob pattern of file paths
+    :param encryption_alg: The chosen Encryption Algorithm, either "rsa" or "dh"
+    :param workers: The number of processes encrypting files in parallel
+    :param codec: The codec the files are compressed with before being encrypted (one of CompressionMethods.CODEC_CHOICES), not compressed by default
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.txt")
+    file_paths = [path for path in sorted(glob.glob(pattern)) if os.path.isfile(path)]
+    if not file_paths:
+        PM.LOGGER.error("[SYSTEM] No files match '%s'!", pattern)
         return
-    if encryption_alg == "rsa":
-        add_with_RSA(file_name)
-    else:
-        add_with_DH(file_name)
+    add_files(file_paths, encryption_alg, workers, codec)
 
 
-def list_all():
+def add_files(file_paths, encryption_alg, workers=EncryptionConstants.DEFAULT_WORKERS, codec=CM.DEFAULT_CODEC):
     """
-    Lists all files' names from Database
-    :return: All files names from Database
+    Adds the given files to the Database at once: the files are encrypted in parallel, then all their entries are inserted in a single transaction.
+    Files whose names are already in the Database (or appear twice in the batch) are skipped, while every distinct content is encrypted only once.
+    :param file_paths: The paths of the files to be added
+    :param encryption_alg: The chosen Encryption Algorithm, either "rsa" or "dh"
+    :param workers: The number of processes encrypting files in parallel
+    :param codec: The codec the files are compressed with before being encrypted (one of CompressionMethods.CODEC_CHOICES), not compressed by default
     """
-    list_conn = sqlite3.connect(DATABASE_PATH)
+    for file_path in file_paths:
+        if not os.path.isfile(file_path):
+            PM.LOGGER.error("[SYSTEM] Given path '%s' is not a valid one!", file_path)
+    file_paths = [(os.path.abspath(path)).replace("\\", "/") for path in file_paths if os.path.isfile(path)]
+    encryption_type = "RSA" if encryption_alg == "rsa" else "DH"
     try:
-        c = list_conn.cursor()
-        list_command = """SELECT id,name FROM files"""
-        c.execute(list_command)
-        count = 0
-        for file_id, file_name in c.fetchall():
-            count += 1
-            print(
-                f"{PM.ConsoleColors.METADATA}[ID #{file_id}] {file_name}!{PM.ConsoleColors.ENDCHAR}")
-        print(
-            f"{PM.ConsoleColors.SUCCESS}A total of {count} files displayed!{PM.ConsoleColors.ENDCHAR}")
-        c.close()
-        print(
-            f"{PM.ConsoleColors.SUCCESS}[DATABASE] List of all files in the Database provided!{PM.ConsoleColors.ENDCHAR}")
+        existing_names = get_repository().existing_names([os.path.basename(path) for path in file_paths])
     except sqlite3.Error as err:
-        print("[DATABASE] Failed to select from SqLite table", err)
+        PM.LOGGER.error("[DATABASE] Failed to check from SqLite table: %s", err)
+        return
+    jobs = {}
+    # The encryption parameters, codecs, key material and manifests (None and empty for the blobs stored before) of the blobs shared by the files of the batch
+    blobs = {}
+    duplicates = []
+    for file_path in file_paths:
+        file_name = os.path.basename(file_path)
+        if file_name in existing_names:
+            PM.LOGGER.error(
+                "[SYSTEM] Error when attempting to add :  File '%s' is already in DataBase!", file_name)
+            continue
+        existing_names.add(file_name)
+        digest = cache_file(file_path, file_name)
+        if digest is None:
+            continue
+        if digest not in jobs and digest not in blobs:
+            try:
+                blob = get_repository().fetch_blob(digest, encryption_type)
+            except sqlite3.Error as err:
+                PM.LOGGER.error("[DATABASE] Failed to check from SqLite table: %s", err)
+                return
+            if blob is None:
+                jobs[digest] = (file_name, encryption_alg, digest, codec)
+                continue
+            blobs[digest] = (parse_params(blob[:4]), blob[4], None, [])
+        duplicates.append((file_name, digest))
+    encrypted = [row for row in EncryptionConstants.parallel_map(encrypt_file, list(jobs.values()), workers) if row is not None]
+    blobs.update((row[7], (row[2], row[8], None, [])) for row in encrypted)
+    rows = list(encrypted)
+    for file_name, digest in duplicates:
+        if digest not in blobs:
+            continue
+        params, blob_codec, material, manifest = blobs[digest]
+        before_path = (os.path.join(PM.SIMPLE_FILES_PATH, file_name)).replace("\\", "/")
+        rows.append((file_name, encryption_type, params, *PM.extract_file_metadata(before_path), digest, blob_codec,
+                     material, manifest))
+        PM.LOGGER.info("[DEDUP] The content of '%s' is already stored, skipping encryption!", file_name)
+    try:
+        get_repository().insert_many(rows)
+        PM.LOGGER.success(
+            "[DATABASE] %d out of %d files added to DataBase (%d encrypted)!", len(rows), len(file_paths), len(encrypted))
+    except sqlite3.Error as err:
+        PM.LOGGER.error("[DATABASE] Failed to add into SqLite table: %s", err)
+        for row in encrypted:
+            os.remove((os.path.join(PM.ENCRYPTED_FILES_PATH, get_blob_file_name(row[7], encryption_type))).replace("\\", "/"))
+
+
+@PF.timed("update")
+def update_in_database(file_path, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    The method the users will interact with the DataBase. Being a secured method, it will log an Exception if something is wrong.
+    Replaces the content of a file from the Database with the (modified) file at the given path, keeping its encryption parameters.
+    Only the content-defined chunks that changed since the last update are encrypted again (see reencrypt_changed_chunks), so appending to a file costs work proportional to the appended bytes.
+    :param file_path: The path of the modified file, whose name is already in the Database. It is copied over the cached copy from the Files/ folder.
+    :param workers: The number of processes encrypting the changed chunks in parallel
+    """
+    if not os.path.isfile(file_path):
+        PM.LOGGER.error("[SYSTEM] Given path is not a valid one!")
+        return
+    file_name = os.path.basename(file_path)
+    try:
+        data = get_repository().fetch(file_name)
+    except sqlite3.Error as err:
+        PM.LOGGER.error("[DATABASE] Failed to read from SqLite table: %s", err)
+        return
+    if data is None:
+        PM.LOGGER.error(
+            "[SYSTEM] Error when attempting to update :  File '%s' is not in DataBase!", file_name)
+        return
+    if not PM.verify_file(get_encrypted_file_name(data), False):
+        return
+    digest = cache_file((os.path.abspath(file_path)).replace("\\", "/"), file_name)
+    if digest is None:
+        return
+    metadata = PM.extract_file_metadata((os.path.join(PM.SIMPLE_FILES_PATH, file_name)).replace("\\", "/"))
+    try:
+        blob = get_repository().fetch_blob(digest, data[2])
+        if digest == data[11]:
+            get_repository().update(file_name, data[3:7], metadata, digest, [], data[12])
+            PM.LOGGER.success("[DATABASE] The content of '%s' did not change, only its metadata was updated!", file_name)
+            return
+        if blob is not None:
+            unreferenced = get_repository().update(file_name, blob[:4], metadata, digest, [], blob[4])
+            PM.LOGGER.success(
+                "[DEDUP] The new content of '%s' is already stored, skipping encryption!", file_name)
+        else:
+            unreferenced = reencrypt_changed_chunks(data, digest, metadata, workers)
+    except sqlite3.Error as err:
+        PM.LOGGER.error("[DATABASE] Failed to update SqLite table: %s", err)
+        return
+    except (OSError, ValueError) as err:
+        PM.LOGGER.error("[SYSTEM] Failed to encrypt the new content of '%s', the stored content is kept: %s", file_name, err)
+        return
+    remove_encrypted_files(unreferenced)
+
+
+def compute_manifest(path, alignment):
+    """
+    Splits a file in content-defined chunks, hashing each of them
+    :param path: Path of the file
+    :param alignment: The block width of the encrypted file, every chunk (except the last one) holding a whole number of blocks
+    :return: The list of (digest, length) touples of the chunks, the length of the file and its CRC32
+    """
+    manifest = []
+    length = 0
+    checksum = 0
+    for chunk in PM.content_defined_chunks(path, alignment):
+        manifest.append((hashlib.sha256(chunk).hexdigest(), len(chunk)))
+        length += len(chunk)
+        checksum = zlib.crc32(chunk, checksum)
+    return manifest, length, checksum
+
+
+def compute_blob_manifest(before_path, after_path, codec):
+    """
+    Computes the manifest of a blob that was just encrypted whole, so that the next update of the file only encrypts the chunks that changed
+    :param before_path: Path of the plaintext, in the Files/ folder
+    :param after_path: Path of the encrypted file
+    :param codec: The codec the plaintext was compressed with
+    :return: The list of (digest, length) touples of the chunks (see compute_manifest), empty for the compressed files, which are always encrypted whole
+    """
+    if codec != CM.CODEC_NONE or not PM.is_container(after_path):
+        return []
+    with open(after_path, "rb") as file:
+        return compute_manifest(before_path, PM.read_container_header(file).block_width)[0]
+
+
+def reencrypt_changed_chunks(data, digest, metadata, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Stores the new content of a file (cached in the Files/ folder) as the blob of the given digest, with the same encryption parameters.
+    Since every block is encrypted on its own with the same key, the encrypted chunks are the same wherever they appear. The leading chunks shared with the previous content are copied
+    from the old blob, the other shared ones are reused, and only the others are encrypted. Without a stored manifest, the whole file is encrypted.
+    Compressed files are always encrypted whole (with the same codec), since an edit changes the rest of the compressed stream.
+    The new blob is written to a temporary file, moved in place, and only then is the entry pointed at it: if anything fails, the old blob and the entry are left unchanged.
+    :param data: The row of the file from the Database
+    :param digest: The SHA-256 digest of the new content
+    :param metadata: The size, time of last access, time of last modification and time of creation of the new content
+    :param workers: The number of processes encrypting the changed chunks in parallel
+    :return: The rows whose encrypted files are no longer referenced (see FilesRepository.update), to be removed once the update is committed
+    """
+    file_name = data[1]
+    before_path = (os.path.join(PM.SIMPLE_FILES_PATH, file_name)).replace("\\", "/")
+    old_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, get_encrypted_file_name(data))).replace("\\", "/")
+    after_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, get_blob_file_name(digest, data[2]))).replace("\\", "/")
+    temporary_path = f"{after_path}.{os.getpid()}.tmp"
+    params = parse_params(data[3:7])
+    old_manifest = get_repository().fetch_manifest(data[11], data[2]) if data[11] is not None else []
+    try:
+        if old_manifest and data[12] == CM.CODEC_NONE and PM.is_container(old_path):
+            with open(old_path, "rb") as file:
+                header = PM.read_container_header(file)
+            manifest, length, checksum = compute_manifest(before_path, header.block_width)
+            # The leading chunks that did not change, and the offsets (past the header) of the encrypted chunks of the old content
+            prefix = 0
+            while prefix < min(len(manifest), len(old_manifest)) and manifest[prefix] == old_manifest[prefix]:
+                prefix += 1
+            offsets = [PM.CONTAINER_HEADER.size]
+            for _, chunk_length in old_manifest:
+                offsets.append(offsets[-1] + -(-chunk_length // header.block_width) * header.int_width)
+            # The other old chunks still needed
+            needed = set(manifest[prefix:])
+            reused = {}
+            with open(old_path, "rb") as file:
+                for position, chunk in enumerate(old_manifest):
+                    if chunk in needed and chunk not in reused:
+                        file.seek(offsets[position])
+                        reused[chunk] = file.read(offsets[position + 1] - offsets[position])
+            changed = [position for position in range(prefix, len(manifest)) if manifest[position] not in reused]
+            PM.write_patched_container(old_path, temporary_path, offsets[prefix],
+                                       encrypt_manifest_chunks(data, header, before_path, manifest, prefix, reused, changed, workers),
+                                       length, checksum)
+            summary = f"{len(changed)} out of {len(manifest)} chunks encrypted"
+        else:
+            key = get_key_material(data)
+            with CM.compressed_copy(before_path, data[12]) as source_path:
+                if data[2] == "RSA":
+                    RSA.encrypt(source_path, temporary_path, *params, workers, key)
+                else:
+                    DH.encrypt(source_path, temporary_path, *params, workers, key)
+            manifest = compute_blob_manifest(before_path, temporary_path, data[12])
+            summary = "the whole file was encrypted"
+        os.replace(temporary_path, after_path)
+        try:
+            unreferenced = get_repository().update(file_name, params, metadata, digest, manifest, data[12])
+        except BaseException:
+            os.remove(after_path)
+            raise
     finally:
-        if list_conn:
-            list_conn.close()
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    PM.LOGGER.success("[DATABASE] File '%s' updated, %s!", file_name, summary)
+    return unreferenced
 
 
-def read_with_RSA(file_name, encrypted_file_name, param1, param2):
+def encrypt_manifest_chunks(data, header, before_path, manifest, prefix, reused, changed, workers=EncryptionConstants.DEFAULT_WORKERS):
     """
-    Decrypts a file encrypted with RSA and opens the decrypted file, after overriding the original file in the Files/ folder
-    :param file_name: The name of the original file
-    :param encrypted_file_name: The name of the encrypted file (that is the original name, with an appended _encrypted at the end) - example => test.txt, test_encrypted.txt
-    :param param1: The first prime number needed to compute the RSA algorithm decryption
-    :param param2: The second prime number needed to compute the RSA algorithm decryption
-    Starts the file from the Files/ folder, after overwriting it with the decrypted version (that should be identical)
+    Yields the encrypted chunks of the new content following the unchanged leading ones: the old encrypted chunks that are reused, and the changed ones, encrypted with the key material of the file
+    :param data: The row of the file from the Database
+    :param header: The container header of the encrypted file
+    :param before_path: Path of the new content, in the Files/ folder
+    :param manifest: The list of (digest, length) touples of the chunks of the new content
+    :param prefix: How many leading chunks did not change (and are not yielded)
+    :param reused: The packed encrypted chunks of the old content, by (digest, length)
+    :param changed: The positions (in the manifest) of the chunks that need to be encrypted
+    :param workers: The number of processes encrypting chunks in parallel
+    :return: A generator of packed encrypted chunks, in order
     """
-    before_path = (os.path.abspath(os.path.join(PM.ENCRYPTED_FILES_PATH, encrypted_file_name))).replace("\\", "/")
-    after_path = (os.path.abspath(os.path.join(PM.SIMPLE_FILES_PATH, file_name))).replace("\\", "/")
-    if RSA.decrypt(before_path, after_path, param1, param2):
-        os.startfile((os.path.abspath(after_path)).replace("\\", "/"))
+    offsets = [0]
+    for _, chunk_length in manifest:
+        offsets.append(offsets[-1] + chunk_length)
 
+    def read_changed_chunks():
+        with open(before_path, "rb") as file:
+            for position in changed:
+                file.seek(offsets[position])
+                yield file.read(manifest[position][1])
+
+    if data[2] == "RSA":
+        encrypted = RSA.encrypt_chunks(get_key_material(data), read_changed_chunks(), header.block_width, workers)
+    else:
+        encrypted = DH.encrypt_chunks(get_key_material(data), read_changed_chunks(), header.int_width, workers)
+    changed_positions = set(changed)
+    for position in range(prefix, len(manifest)):
+        if position in changed_positions:
+            _, numbers = next(encrypted)
+            yield PM.pack_numbers(numbers, header.int_width)
+        else:
+            yield reused[manifest[position]]
 
-def read_with_DH(file_name, encrypted_file_name, param1, param2, param3, param4):
+
+def list_all(file_filter=DB_Repository.FileFilter(), columns=("name",), after_id=0, limit=None, count_only=False,
+             as_json=False):
+    """
+    Lists the files from Database matching the filter, streaming them a page at a time (see DB_Listing.list_all)
+    """
+    DB_Listing.list_all(get_repository(), file_filter, columns, after_id, limit, count_only, as_json)
+
+
+def is_main_process():
     """
-    Decrypts a file encrypted with Diffie-Hellman and opens the decrypted file, after overriding the original file in the Files/ folder
-    :param file_name: The name of the original file
-    :param encrypted_file_name: The name of the encrypted file (that is the original name, with an appended _encrypted at the end) - example => test.txt, test_encrypted.txt
-    :param param1: The first prime number needed to compute the Diffie-Hellman algorithm decryption
-    :param param2: The second prime number needed to compute the Diffie-Hellman algorithm decryption
-    :param param3: The third prime number needed to compute the Diffie-Hellman algorithm decryption
-    :param param4: The fourth prime number needed to compute the Diffie-Hellman algorithm decryption
-    Starts the file from the Files/ folder, after overwriting it with the decrypted version (that should be identical)
+    :return: True in the main process, False in the worker processes of a pool (which must not write to the Database)
     """
-    before_path = (os.path.abspath(os.path.join(PM.ENCRYPTED_FILES_PATH, encrypted_file_name))).replace("\\", "/")
-    after_path = (os.path.abspath(os.path.join(PM.SIMPLE_FILES_PATH, file_name))).replace("\\", "/")
-    if DH.decrypt(before_path, after_path, param1, param2, param3, param4):
-        os.startfile((os.path.abspath(after_path)).replace("\\", "/"))
+    # multiprocessing is only imported once the key material of a file is derived, so that the commands start faster (the pools import it anyway)
+    import multiprocessing
+    return multiprocessing.parent_process() is None
 
 
-# The method the users will interact with the DataBase. Being a secured method, it will log an Exception if something is wrong. We receive the original file name, and we fetch
-# the metadata from the database, display it, decrypt the file, store it in the appropriate folder and open the file
-def read_from_database(file_name):
+def decrypt_entry(data, output, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Decrypts the encrypted version of a file with its key material (see decrypt_content), decompressing it as it is decrypted if it was compressed
+    :param data: The row of the file from the Database
+    :param output: The path the decrypted file is written at, or a writable binary file object the decrypted bytes are streamed to
+    :param workers: The number of processes decrypting the file in parallel
+    :return: True if the file was decrypted, False otherwise
+    """
+    if data[12] == CM.CODEC_NONE:
+        return decrypt_content(data, output, workers)
+    with PM.open_output(output) as file:
+        writer = CM.DecompressingWriter(data[12], file)
+        try:
+            is_decrypted = decrypt_content(data, writer, workers) and writer.is_complete()
+        except ValueError:
+            is_decrypted = False
+    if not is_decrypted:
+        PM.LOGGER.error("[SYSTEM] The decrypted content of '%s' could not be decompressed with %s!", data[1], data[12])
+        PM.remove_output(output)
+    return is_decrypted
+
+
+def decrypt_content(data, output, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Decrypts the encrypted version of a file with its key material (see get_key_material)
+    :param data: The row of the file from the Database
+    :param output: The path the decrypted content is written at, or a writable binary file object it is streamed to
+    :param workers: The number of processes decrypting the file in parallel
+    :return: True if the file was decrypted, False otherwise
+    """
+    encrypted_path = (os.path.abspath(os.path.join(PM.ENCRYPTED_FILES_PATH, get_encrypted_file_name(data)))).replace("\\", "/")
+    # The encryption parameters are stored as text, since they can exceed the 64-bit SQLite integers
+    params = [int(param) for param in data[3:7]]
+    if data[2] == "RSA":
+        return RSA.decrypt(encrypted_path, output, params[0], params[1], workers, get_key_material(data))
+    if data[2] == "DH":
+        return DH.decrypt(encrypted_path, output, *params, workers, get_key_material(data))
+    PM.LOGGER.error(
+        "[SYSTEM] Error when trying to read file - Invalid encryption algorithm!")
+    return False
+
+
+def get_key_material(data):
+    """
+    Fetches the key material of a file from the cache, or builds it from the material stored in the keys table (which is fetched along with the row of the file).
+    The key material of the blobs stored before the keys table is derived from the encryption parameters, then stored, so that it is derived only once.
+    :param data: The row of the file from the Database
+    :return: The RSA key material, or the Diffie-Hellman full key
+    """
+    # The parameters are part of the cache key, since the id of a deleted row can be given to a new file
+    cache_key = tuple(data[0:7])
+    key = DB_Cache.KEY_CACHE.get(cache_key)
+    if key is not None:
+        return key
+    params = [int(param) for param in data[3:7]]
+    material = parse_key_material(data[13])
+    with PF.span("read.key"):
+        if data[2] == "RSA":
+            key = RSA.RSAKey(params[0], params[1], material)
+        else:
+            key = material[0] if material is not None else DH.derive_full_key(*params)
+    # The worker processes do not write to the Database, whose connection belongs to the main process
+    if material is None and data[11] is not None and is_main_process():
+        try:
+            get_repository().store_key(data[11], data[2], get_stored_material(key))
+        except sqlite3.Error as err:
+            PM.LOGGER.warning("[DATABASE] Failed to store the key material of '%s': %s", data[1], err)
+    DB_Cache.KEY_CACHE.put(cache_key, key, DB_Cache.KEY_ENTRY_SIZE)
+    return key
+
+
+def get_content_key(data):
+    """
+    Returns the key the decrypted content of a file is cached by: the path, modification time and size of its encrypted file, so that a file added again is not served from the cache
+    :param data: The row of the file from the Database
+    :return: The key of the file in DB_Cache.CONTENT_CACHE
+    """
+    encrypted_path = (os.path.abspath(os.path.join(PM.ENCRYPTED_FILES_PATH, get_encrypted_file_name(data)))).replace("\\", "/")
+    file_stats = os.stat(encrypted_path)
+    return encrypted_path, file_stats.st_mtime_ns, file_stats.st_size
+
+
+def read_content(data, output, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Writes the decrypted content of a file to the output. Files small enough to be cached are decrypted in memory (or fetched from the cache) first,
+    so that nothing is written if the decryption fails, while larger files are streamed as they are decrypted.
+    :param data: The row of the file from the Database
+    :param output: A writable binary file object, such as sys.stdout.buffer, an opened file or an io.BytesIO
+    :param workers: The number of processes decrypting the file in parallel
+    :return: True if the content was written, False otherwise
+    """
+    content_key = get_content_key(data)
+    payload = DB_Cache.CONTENT_CACHE.get(content_key)
+    if payload is None:
+        if data[7] > DB_Cache.MAX_CACHED_FILE_SIZE:
+            with PF.span("read.decrypt"):
+                return decrypt_entry(data, output, workers)
+        buffer = PM.PreallocatedOutput(data[7])
+        with PF.span("read.decrypt"):
+            is_decrypted = decrypt_entry(data, buffer, workers)
+        if not is_decrypted:
+            return False
+        payload = buffer.getvalue()
+        DB_Cache.CONTENT_CACHE.put(content_key, payload, len(payload))
+    else:
+        PM.LOGGER.info("[CACHE] File '%s' served from the decrypted files cache!", data[1])
+    with PF.span("read.write"):
+        output.write(payload)
+        output.flush()
+    return True
+
+
+def is_cached_copy_valid(data, cached_path):
+    """
+    Checks if the cached copy of a file (from the Files/ folder) is identical to the original one: it needs to have the same size, and either the same modification time or the same content
+    (the same SHA-256 digest as its blob, or, for the files stored before the blobs, the same CRC32 as the one stored in the encrypted container)
+    :param data: The row of the file from the Database
+    :param cached_path: The path of the cached copy
+    :return: True if the cached copy does not need to be written again, False otherwise
+    """
+    if not os.path.isfile(cached_path) or os.path.getsize(cached_path) != data[7]:
+        return False
+    if os.path.getmtime(cached_path) == data[9]:
+        return True
+    if data[11] is not None:
+        return PM.hash_file(cached_path) == data[11]
+    encrypted_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, get_encrypted_file_name(data))).replace("\\", "/")
+    if not PM.is_container(encrypted_path):
+        return False
+    with open(encrypted_path, "rb") as file:
+        try:
+            header = PM.read_container_header(file)
+        except ValueError:
+            return False
+    checksum = 0
+    for chunk in PM.read_chunks(cached_path, PM.CHUNK_SIZE):
+        checksum = zlib.crc32(chunk, checksum)
+    return checksum == header.checksum
+
+
+def restore_file(data, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Writes the decrypted version of a file over its cached copy from the Files/ folder, unless the cached copy is unchanged. The original access and modification times are restored as well.
+    :param data: The row of the file from the Database
+    :param workers: The number of processes decrypting the file in parallel
+    :return: True if the cached copy is identical to the original file, False otherwise
+    """
+    file_name = data[1]
+    cached_path = (os.path.abspath(os.path.join(PM.SIMPLE_FILES_PATH, file_name))).replace("\\", "/")
+    with PF.span("read.verify"):
+        is_valid = is_cached_copy_valid(data, cached_path)
+    if is_valid:
+        PM.LOGGER.info("[SYSTEM] The cached copy of '%s' is up to date!", file_name)
+        return True
+    with open(cached_path, "wb") as file:
+        is_restored = read_content(data, file, workers)
+    if not is_restored:
+        os.remove(cached_path)
+        return False
+    os.utime(cached_path, (data[8], data[9]))
+    PM.LOGGER.info("[SYSTEM] The cached copy of '%s' was restored at '%s'", file_name, cached_path)
+    return True
+
+
+def show_cache_stats():
+    """
+    Displays the number of entries, size, hits and misses of the key material and decrypted files caches
+    """
+    for cache_name, cache in (("Key material", DB_Cache.KEY_CACHE), ("Decrypted files", DB_Cache.CONTENT_CACHE)):
+        entries, size, hits, misses = cache.stats()
+        PM.display(
+            f"[CACHE] {cache_name}: {entries} entries, {size} bytes, {hits} hits, {misses} misses")
+
+
+@PF.timed("read")
+def read_from_database(file_name, workers=EncryptionConstants.DEFAULT_WORKERS, output=None, write_back=False):
     """
     The method the users will interact with the DataBase. Being a secured method, it will log an Exception if something is wrong.
-    We receive the original file name, and we fetch the metadata from the database, display it, decrypt the file, store it in the Files/ folder (thus overwriting the original file, which should be identical) and open the file
+    We receive the original file name, and we fetch the metadata from the database, log it, decrypt the file and write its content to the given output.
+    The cached copy from the Files/ folder is only written again if asked to, and only if it differs from the original file.
     :param file_name: The name of the file that the user wants to read
-    Based on the encryption method used for the chosen file, we call the appropriate method from the two above.
+    :param workers: The number of processes decrypting the file in parallel
+    :param output: A writable binary file object the content is written to (such as sys.stdout.buffer), or None if the content is not wanted
+    :param write_back: True if the cached copy from the Files/ folder should be restored (if it was changed or deleted)
+    :return: True if everything went good, False otherwise
     """
-    if not is_in_database(file_name):
-        print(
-            f"{PM.ConsoleColors.ERROR}[DATABASE] Error when attempting to read : File '{file_name}' is not in DataBase!{PM.ConsoleColors.ENDCHAR}")
-        return
-    encrypted_file_name = file_name[:-4] + "_encrypted.txt"
-    if not PM.verify_file(encrypted_file_name, False):
-        return
-    encryption_algorithm = ""
-    metadata = ()
-    rsa_params = ()
-    dh_params = ()
-    check_conn = sqlite3.connect(DATABASE_PATH)
     try:
-        c = check_conn.cursor()
-        check_command = """SELECT * FROM files WHERE name = (?)"""
-        c.execute(check_command, (file_name,))
-        data = c.fetchone()
-        encryption_algorithm = data[2]
-        rsa_params = (data[3], data[4])
-        dh_params = (data[3], data[4], data[5], data[6])
-        metadata = (data[1], data[7], data[8], data[9], data[10])
-        c.close()
+        with PF.span("read.sqlite"):
+            data = get_repository().fetch(file_name)
     except sqlite3.Error as err:
-        print("[DATABASE] Failed to read from SqLite table", err)
-    finally:
-        if check_conn:
-            check_conn.close()
-        print(
-            f"{PM.ConsoleColors.METADATA}[SYSTEM] File Metadata:\nName: {metadata[0]}\nSize: {str(metadata[1])} byte(s)\nLast access at: {datetime.fromtimestamp(metadata[2]).strftime('%d-%m-%Y')}\nLast modification at: {datetime.fromtimestamp(metadata[3]).strftime('%d-%m-%Y')}\nCreated at: {datetime.fromtimestamp(metadata[4]).strftime('%d-%m-%Y')}{PM.ConsoleColors.ENDCHAR}")
-        if encryption_algorithm == "RSA":
-            read_with_RSA(file_name, encrypted_file_name, rsa_params[0], rsa_params[1])
-        elif encryption_algorithm == "DH":
-            read_with_DH(file_name, encrypted_file_name, dh_params[0], dh_params[1], dh_params[2], dh_params[3])
+        PM.LOGGER.error("[DATABASE] Failed to read from SqLite table: %s", err)
+        return False
+    if data is None:
+        PM.LOGGER.error(
+            "[DATABASE] Error when attempting to read : File '%s' is not in DataBase!", file_name)
+        return False
+    if not PM.verify_file(get_encrypted_file_name(data), False):
+        return False
+    PM.LOGGER.info(
+        "[SYSTEM] File Metadata:\nName: %s\nSize: %d byte(s)\nLast access at: %s\nLast modification at: %s\nCreated at: %s", data[1], data[7], datetime.fromtimestamp(data[8]).strftime('%d-%m-%Y'), datetime.fromtimestamp(data[9]).strftime('%d-%m-%Y'), datetime.fromtimestamp(data[10]).strftime('%d-%m-%Y'))
+    if output is not None and not read_content(data, output, workers):
+        return False
+    if write_back:
+        return restore_file(data, workers)
+    return True
+
+
+def decrypt_file(data):
+    """
+    Restores the cached copy of a file in the Files/ folder, unless it is unchanged. It is run by read_many, possibly in a worker process.
+    :param data: The row of the file from the Database
+    :return: True if the cached copy is identical to the original file, False otherwise
+    """
+    if not PM.verify_file(get_encrypted_file_name(data), False):
+        return False
+    return restore_file(data)
+
+
+def decrypt_to_bytes(data):
+    """
+    Decrypts a file in memory. It is run by the service in a worker process, which caches the content in the main process.
+    :param data: The row of the file from the Database
+    :return: The decrypted content, or None if the file could not be decrypted
+    """
+    if not PM.verify_file(get_encrypted_file_name(data), False):
+        return None
+    buffer = PM.PreallocatedOutput(data[7])
+    with PF.span("read.decrypt"):
+        if not decrypt_entry(data, buffer):
+            return None
+    return buffer.getvalue()
+
+
+def read_many(pattern, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Restores the cached copies (in the Files/ folder) of all the files whose names match the pattern, in parallel. Unchanged cached copies are not written again.
+    :param pattern: A glob pattern matched against the names of the files from the Database
+    :param workers: The number of processes decrypting files in parallel
+    """
+    try:
+        rows = get_repository().fetch_matching(pattern)
+    except sqlite3.Error as err:
+        PM.LOGGER.error("[DATABASE] Failed to read from SqLite table: %s", err)
+        return
+    if not rows:
+        PM.LOGGER.error("[DATABASE] No files in DataBase match '%s'!", pattern)
+        return
+    decrypted = sum(EncryptionConstants.parallel_map(decrypt_file, rows, workers))
+    PM.LOGGER.success(
+        "[DATABASE] %d out of %d files restored in the Files folder!", decrypted, len(rows))
+
+
+def remove_encrypted_files(rows):
+    """
+    Removes the encrypted files that are no longer referenced by any file from the Database
+    :param rows: The deleted rows whose encrypted files are no longer referenced, as returned by the repository
+    """
+    for data in rows:
+        encrypted_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, get_encrypted_file_name(data))).replace("\\", "/")
+        if os.path.isfile(encrypted_path):
+            os.remove(encrypted_path)
+            PM.LOGGER.success(
+                "[SYSTEM] Removed file from encrypted files folder at %s", encrypted_path)
         else:
-            print(
-                f"{PM.ConsoleColors.ERROR}[SYSTEM] Error when trying to read file - Invalid encryption algorithm!{PM.ConsoleColors.ENDCHAR}")
+            PM.LOGGER.warning("[SYSTEM] The encrypted file at %s was already removed!", encrypted_path)
+
+
+def delete_many(pattern):
+    """
+    Deletes all the files whose names match the pattern from the Database, in a single transaction, then removes their encrypted versions (unless other files share them).
+    As with 'delete', the cached copies from the Files/ folder remain.
+    :param pattern: A glob pattern matched against the names of the files from the Database
+    """
+    try:
+        file_names = [data[1] for data in get_repository().fetch_matching(pattern)]
+        if not file_names:
+            PM.LOGGER.error("[DATABASE] No files in DataBase match '%s'!", pattern)
             return
+        unreferenced = get_repository().delete_many(file_names)
+    except sqlite3.Error as err:
+        PM.LOGGER.error("[DATABASE] Failed to delete from SqLite table: %s", err)
+        return
+    PM.LOGGER.success(
+        "[DATABASE] Deleted %d files from Database!", len(file_names))
+    remove_encrypted_files(unreferenced)
 
 
+@PF.timed("delete")
 def delete_from_database(file_name):
     """
     The method the users will interact with the DataBase. Being a secured method, it will log an Exception if something is wrong.
-    Deletes file from Database, as well as its encrypted version from the Files/Encrypted folder. That means the 'cached', decrypted version remains in the Files/ folder, in case it is needed.
+    Deletes file from Database, as well as its encrypted version from the Files/Encrypted folder, unless other files share it. That means the 'cached', decrypted version remains in the Files/ folder, in case it is needed.
     :param file_name: The name of the file that the user wants to delete
     """
-    if not is_in_database(file_name):
-        print(
-            f"{PM.ConsoleColors.ERROR}[SYSTEM] Error when attempting to delete :  File '{file_name}' is not in DataBase!{PM.ConsoleColors.ENDCHAR}")
+    try:
+        with PF.span("delete.sqlite"):
+            data = get_repository().fetch(file_name)
+    except sqlite3.Error as err:
+        PM.LOGGER.error("[DATABASE] Failed to check from SqLite table: %s", err)
+        return
+    if data is None:
+        PM.LOGGER.error(
+            "[SYSTEM] Error when attempting to delete :  File '%s' is not in DataBase!", file_name)
         return
     if not PM.verify_file(file_name, True):
         return
-    encrypted_file_name = file_name[:-4] + "_encrypted.txt"
-    if not PM.verify_file(encrypted_file_name, False):
+    if not PM.verify_file(get_encrypted_file_name(data), False):
         return
-    delete_conn = sqlite3.connect(DATABASE_PATH)
     try:
-        c = delete_conn.cursor()
-        delete_command = """DELETE FROM files WHERE name = (?)"""
-        c.execute(delete_command, (file_name,))
-        delete_conn.commit()
-        c.close()
+        with PF.span("delete.sqlite"):
+            unreferenced = get_repository().delete(file_name)
     except sqlite3.Error as err:
-        print("[DATABASE] Failed to delete from SqLite table", err)
-    finally:
-        if delete_conn:
-            delete_conn.close()
-        print(
-            f"{PM.ConsoleColors.SUCCESS}[DATABASE] Deleted file '{file_name}' from Database!{PM.ConsoleColors.ENDCHAR}")
-        encrypted_path = (os.path.join(PM.ENCRYPTED_FILES_PATH, encrypted_file_name)).replace("\\", "/")
-        os.remove(encrypted_path)
-        print(
-            f"{PM.ConsoleColors.SUCCESS}[SYSTEM] Removed file from encrypted files folder at {encrypted_path}{PM.ConsoleColors.ENDCHAR}")
+        PM.LOGGER.error("[DATABASE] Failed to delete from SqLite table: %s", err)
+        return
+    PM.LOGGER.success(
+        "[DATABASE] Deleted file '%s' from Database!", file_name)
+    with PF.span("delete.remove"):
+        remove_encrypted_files(unreferenced)
@@ -0,0 +1,68 @@
+import json
+import sqlite3
+from datetime import datetime
+
+from Database import DB_Repository
+from FileInteractionMethods import ParsingMethods as PM
+
+
+def list_all(repository, file_filter=DB_Repository.FileFilter(), columns=("name",), after_id=0, limit=None,
+             count_only=False, as_json=False):
+    """
+    Lists the files from Database matching the filter, streaming them a page at a time.
+    This module only needs the repository, so that 'list' starts without importing the encryption (and the pool) of DB_Functions.
+    :param repository: The DB_Repository.FilesRepository of the Database
+    :param file_filter: A DB_Repository.FileFilter, the default one matching every file
+    :param columns: The columns displayed after the id of every file (see DB_Repository.LIST_COLUMNS)
+    :param after_id: Only the files with a greater id are listed, as printed at the end of the previous page
+    :param limit: The most files to be listed, or None to list all of them
+    :param count_only: True if only the number of matching files is displayed
+    :param as_json: True if every file is written to stdout as a JSON line (and the count as {"count": ...}), for scripts
+    """
+    try:
+        if count_only:
+            count = repository.count_files(file_filter)
+            if as_json:
+                print(json.dumps({"count": count}))
+            else:
+                PM.display(f"[DATABASE] {count} files match!")
+            return
+        count = 0
+        last_id = None
+        for row in repository.list_files(file_filter, columns, after_id, limit):
+            count += 1
+            last_id = row[0]
+            if as_json:
+                print(json.dumps(dict(zip(("id", *columns), row))))
+            else:
+                PM.display(format_listed_file(row, columns))
+        PM.LOGGER.success(
+            "A total of %d files displayed!", count)
+        if limit is not None and count == limit:
+            PM.LOGGER.success(
+                "[DATABASE] More files may follow! Continue after the id #%s!", last_id)
+        else:
+            PM.LOGGER.success(
+                "[DATABASE] List of all files in the Database provided!")
+    except sqlite3.Error as err:
+        PM.LOGGER.error("[DATABASE] Failed to select from SqLite table: %s", err)
+
+
+def format_listed_file(row, columns):
+    """
+    :param row: The id of a file followed by the listed columns
+    :param columns: The names of the listed columns
+    :return: The line displayed for the file, as '[ID #id] name (column: value, ...)!'
+    """
+    values = dict(zip(columns, row[1:]))
+    details = []
+    for column, value in values.items():
+        if column == "name":
+            continue
+        if column in ("accessed", "modified", "created") and value is not None:
+            value = datetime.fromtimestamp(value).strftime('%d-%m-%Y')
+        details.append(f"{column}: {value}")
+    listed = [values["name"]] if "name" in values else []
+    if details:
+        listed.append(f"({', '.join(details)})")
+    return f"[ID #{row[0]}] {' '.join(listed)}!"
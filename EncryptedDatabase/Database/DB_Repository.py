@@ -0,0 +1,505 @@
+import atexit
+import collections
+import contextlib
+import sqlite3
+import threading
+import time
+
+# The pragmas applied once, when the connection is opened: write-ahead logging, so that readers never wait for the writer,
+# fewer fsync calls (still safe in WAL mode), an 8 MB page cache and 64 MB of memory-mapped I/O
+CONNECTION_PRAGMAS = ["PRAGMA journal_mode = WAL", "PRAGMA synchronous = NORMAL", "PRAGMA cache_size = -8192",
+                      "PRAGMA mmap_size = 67108864"]
+# The SQLite Database of the files, relative to the application folder
+DATABASE_PATH = 'Database/files_database.db'
+# How many prepared statements are kept by the connection, so that repeated queries are not compiled again
+CACHED_STATEMENTS = 64
+
+CREATE_TABLE_COMMAND = """CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                encryption_type TEXT NOT NULL,
+                encryption_param_1 TEXT,
+                encryption_param_2 TEXT,
+                encryption_param_3 TEXT DEFAULT -1,
+                encryption_param_4 TEXT DEFAULT -1,
+                size INTEGER,
+                last_access TIMESTAMP,
+                last_modification TIMESTAMP,
+                creation_time TIMESTAMP)"""
+# The schema changes applied, in order, to an existing files table (a list of statements being a single change). PRAGMA user_version stores how many of them were already applied.
+MIGRATIONS = ["""CREATE UNIQUE INDEX IF NOT EXISTS files_name ON files(name)""",
+              # The encrypted contents, stored once per plaintext SHA-256 digest and encryption algorithm, and shared by all the files with that content
+              """CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT NOT NULL,
+                encryption_type TEXT NOT NULL,
+                encryption_param_1 TEXT,
+                encryption_param_2 TEXT,
+                encryption_param_3 TEXT DEFAULT -1,
+                encryption_param_4 TEXT DEFAULT -1,
+                refcount INTEGER NOT NULL,
+                PRIMARY KEY (digest, encryption_type))""",
+              # The digest of the blob holding the encrypted content, or NULL for the files stored (one encrypted file per name) before the blobs
+              """ALTER TABLE files ADD COLUMN blob TEXT""",
+              # The manifest of every blob: the SHA-256 digest and length of each content-defined chunk of the plaintext, in order, so that 'update' only re-encrypts the chunks that changed
+              """CREATE TABLE IF NOT EXISTS chunks (
+                blob TEXT NOT NULL,
+                encryption_type TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (blob, encryption_type, position))""",
+              # The codec the content was compressed with before being encrypted (see CompressionMethods), for the files and their blobs
+              """ALTER TABLE files ADD COLUMN codec TEXT NOT NULL DEFAULT 'none'""",
+              """ALTER TABLE blobs ADD COLUMN codec TEXT NOT NULL DEFAULT 'none'""",
+              # The key material derived from the encryption parameters of every blob (n, e, d and the CRT components for RSA, the full key for Diffie-Hellman),
+              # stored as comma-separated numbers, so that reads build the key without deriving it again
+              """CREATE TABLE IF NOT EXISTS keys (
+                blob TEXT NOT NULL,
+                encryption_type TEXT NOT NULL,
+                material TEXT NOT NULL,
+                PRIMARY KEY (blob, encryption_type))""",
+              # The indexes backing the filters of 'list' (the name prefix is matched as a range of the unique name index)
+              """CREATE INDEX IF NOT EXISTS files_encryption_type ON files(encryption_type)""",
+              """CREATE INDEX IF NOT EXISTS files_size ON files(size)""",
+              """CREATE INDEX IF NOT EXISTS files_creation_time ON files(creation_time)""",
+              # The tables created before the encryption parameters were stored as text declare them as INTEGER, so that the large parameters are rounded to REAL.
+              # SQLite cannot change the type of a column, so the files table is rebuilt with text parameters (and its indexes created again).
+              # A copy left by a rebuild made outside a transaction (before the migrations were applied in one) is dropped first.
+              ["""DROP TABLE IF EXISTS files_rebuilt""",
+               """CREATE TABLE files_rebuilt (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                encryption_type TEXT NOT NULL,
+                encryption_param_1 TEXT,
+                encryption_param_2 TEXT,
+                encryption_param_3 TEXT DEFAULT -1,
+                encryption_param_4 TEXT DEFAULT -1,
+                size INTEGER,
+                last_access TIMESTAMP,
+                last_modification TIMESTAMP,
+                creation_time TIMESTAMP,
+                blob TEXT,
+                codec TEXT NOT NULL DEFAULT 'none')""",
+               """INSERT INTO files_rebuilt SELECT id, name, encryption_type, encryption_param_1, encryption_param_2, encryption_param_3, encryption_param_4, size, last_access, last_modification, creation_time, blob, codec FROM files""",
+               """DROP TABLE files""",
+               """ALTER TABLE files_rebuilt RENAME TO files""",
+               """CREATE UNIQUE INDEX files_name ON files(name)""",
+               """CREATE INDEX files_encryption_type ON files(encryption_type)""",
+               """CREATE INDEX files_size ON files(size)""",
+               """CREATE INDEX files_creation_time ON files(creation_time)"""]]
+# The names reserved by an 'add' that is still running are checked as well, so that they are not added twice
+CHECK_COMMAND = """SELECT 1 FROM files WHERE name = (?) LIMIT 1"""
+# The rows of the files end with the key material of their blob (NULL if it was not stored, or for the files stored before the blobs), so that a read needs a single query.
+# The entries reserved by an 'add' that is still running (without encryption parameters yet) are left out.
+FETCH_COMMAND = """SELECT files.*, keys.material FROM files LEFT JOIN keys ON keys.blob = files.blob AND keys.encryption_type = files.encryption_type WHERE files.name = (?) AND files.encryption_param_1 IS NOT NULL LIMIT 1"""
+# The name is reserved first (with the time of the reservation as its creation time), so that the UNIQUE index rejects duplicates before any file is encrypted, and completed once the encryption is done
+ADD_COMMAND = """INSERT INTO files(name, encryption_type, creation_time) VALUES (?,?,?)"""
+COMPLETE_COMMAND = """UPDATE files SET encryption_param_1 = ?, encryption_param_2 = ?, encryption_param_3 = ?, encryption_param_4 = ?, size = ?, last_access = ?, last_modification = ?, creation_time = ?, blob = ?, codec = ? WHERE id = ?"""
+RELEASE_RESERVATION_COMMAND = """DELETE FROM files WHERE id = ? AND encryption_param_1 IS NULL"""
+# The reservations left by a process that was killed while adding a file are released after this many seconds, when the Database is opened
+STALE_RESERVATION_AGE = 24 * 60 * 60
+RELEASE_STALE_RESERVATIONS_COMMAND = """DELETE FROM files WHERE encryption_param_1 IS NULL AND creation_time < ?"""
+INSERT_COMMAND = """INSERT INTO files(name, encryption_type, encryption_param_1, encryption_param_2, encryption_param_3, encryption_param_4, size, last_access, last_modification, creation_time, blob, codec) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)"""
+FETCH_BLOB_COMMAND = """SELECT encryption_param_1, encryption_param_2, encryption_param_3, encryption_param_4, codec FROM blobs WHERE digest = (?) AND encryption_type = (?)"""
+# A new blob is referenced once, while an existing one gets one more reference
+REFERENCE_BLOB_COMMAND = """INSERT INTO blobs(digest, encryption_type, encryption_param_1, encryption_param_2, encryption_param_3, encryption_param_4, codec, refcount) VALUES (?,?,?,?,?,?,?,1)
+                ON CONFLICT(digest, encryption_type) DO UPDATE SET refcount = refcount + 1"""
+RELEASE_BLOB_COMMAND = """UPDATE blobs SET refcount = refcount - 1 WHERE digest = (?) AND encryption_type = (?)"""
+UNREFERENCED_BLOBS_COMMAND = """SELECT digest, encryption_type FROM blobs WHERE refcount <= 0"""
+DELETE_BLOBS_COMMAND = """DELETE FROM blobs WHERE refcount <= 0"""
+REFCOUNT_COMMAND = """SELECT refcount FROM blobs WHERE digest = (?) AND encryption_type = (?)"""
+# The content of a file is replaced by another blob, keeping its encryption parameters
+UPDATE_COMMAND = """UPDATE files SET encryption_param_1 = ?, encryption_param_2 = ?, encryption_param_3 = ?, encryption_param_4 = ?, size = ?, last_access = ?, last_modification = ?, creation_time = ?, blob = ?, codec = ? WHERE name = ?"""
+FETCH_MANIFEST_COMMAND = """SELECT digest, length FROM chunks WHERE blob = (?) AND encryption_type = (?) ORDER BY position"""
+INSERT_MANIFEST_COMMAND = """INSERT OR REPLACE INTO chunks(blob, encryption_type, position, digest, length) VALUES (?,?,?,?,?)"""
+# The manifests of the deleted blobs are dropped along with them
+DELETE_MANIFESTS_COMMAND = """DELETE FROM chunks WHERE NOT EXISTS (SELECT 1 FROM blobs WHERE blobs.digest = chunks.blob AND blobs.encryption_type = chunks.encryption_type)"""
+INSERT_KEY_COMMAND = """INSERT OR IGNORE INTO keys(blob, encryption_type, material) VALUES (?,?,?)"""
+# The blob written by 'update' keeps the encryption parameters (hence the key material) of the blob it replaces
+COPY_KEY_COMMAND = """INSERT OR IGNORE INTO keys(blob, encryption_type, material) SELECT ?, encryption_type, material FROM keys WHERE blob = (?) AND encryption_type = (?)"""
+# The key material of the deleted blobs is dropped along with them
+DELETE_KEYS_COMMAND = """DELETE FROM keys WHERE NOT EXISTS (SELECT 1 FROM blobs WHERE blobs.digest = keys.blob AND blobs.encryption_type = keys.encryption_type)"""
+MATCH_COMMAND = """SELECT files.*, keys.material FROM files LEFT JOIN keys ON keys.blob = files.blob AND keys.encryption_type = files.encryption_type WHERE files.name GLOB (?) AND files.encryption_param_1 IS NOT NULL"""
+# The columns 'list' can project, by the name they are displayed with
+LIST_COLUMNS = {"id": "id", "name": "name", "alg": "encryption_type", "size": "size", "accessed": "last_access",
+                "modified": "last_modification", "created": "creation_time", "codec": "codec"}
+# The files are listed in pages of ids (keyset pagination), so that every page is a range scan however deep it is, and only a page is held in memory at once
+LIST_COMMAND = """SELECT {columns} FROM files WHERE id > ? AND encryption_param_1 IS NOT NULL{filters} ORDER BY id LIMIT ?"""
+COUNT_COMMAND = """SELECT COUNT(*) FROM files WHERE encryption_param_1 IS NOT NULL{filters}"""
+LIST_PAGE_SIZE = 1000
+DELETE_COMMAND = """DELETE FROM files WHERE name = (?)"""
+# How many names are looked up by a single 'IN (...)' query, staying below the SQLite limit of bound parameters
+NAMES_PER_QUERY = 500
+
+# The filters of 'list', None meaning that the files are not filtered by that field. The times are POSIX timestamps.
+FileFilter = collections.namedtuple("FileFilter",
+                                    ["prefix", "encryption_type", "min_size", "max_size", "created_after", "created_before"],
+                                    defaults=[None] * 6)
+
+
+class FilesRepository:
+    """
+    Holds a single long-lived connection to the Database, shared by all the operations (and threads) of the application.
+    The connection is opened on first use, and every operation is serialized by a lock, since a sqlite3 connection must not be used by two threads at once.
+    The methods raise sqlite3.Error, which is logged by the callers from DB_Functions.
+    """
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.connection = None
+        self.lock = threading.RLock()
+
+    def connect(self):
+        """
+        Opens the connection (if it is not already open), applies the pragmas and creates (or migrates) the files table
+        :return: The open connection
+        """
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.database_path, check_same_thread=False,
+                                              cached_statements=CACHED_STATEMENTS)
+            try:
+                for pragma in CONNECTION_PRAGMAS:
+                    self.connection.execute(pragma)
+                with self.transaction() as connection:
+                    connection.execute(CREATE_TABLE_COMMAND)
+                self.migrate()
+                with self.connection:
+                    self.connection.execute(RELEASE_STALE_RESERVATIONS_COMMAND, (time.time() - STALE_RESERVATION_AGE,))
+            except sqlite3.Error:
+                # The next operation opens the connection (and migrates the table) again
+                self.connection.close()
+                self.connection = None
+                raise
+        return self.connection
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Runs the statements of the block in an explicit (immediate) transaction, since the sqlite3 module does not open one before the schema statements.
+        The transaction is committed at the end of the block, and rolled back if an exception is raised.
+        :return: The open connection
+        """
+        self.connection.execute("""BEGIN IMMEDIATE""")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
+    def migrate(self):
+        """
+        Applies the migrations that were not yet applied to the files table, each one in its own transaction along with the schema version it leads to,
+        so that an interrupted migration is rolled back as a whole (and applied again on the next start), and a migration is never applied twice by concurrent processes
+        """
+        while True:
+            with self.transaction() as connection:
+                version = connection.execute("""PRAGMA user_version""").fetchone()[0]
+                if version >= len(MIGRATIONS):
+                    return
+                self.apply_migration(version)
+
+    def apply_migration(self, version):
+        """
+        Applies a single migration and records the schema version it leads to. It must run in a transaction.
+        :param version: The schema version the migration starts from (its index in MIGRATIONS)
+        """
+        migration = MIGRATIONS[version]
+        for statement in [migration] if isinstance(migration, str) else migration:
+            self.connection.execute(statement)
+        self.connection.execute(f"""PRAGMA user_version = {version + 1}""")
+
+    def close(self):
+        """
+        Closes the connection, if it is open. The next operation will open it again.
+        """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def create_table(self):
+        """
+        Drops the files, blobs, chunks and keys tables (if they exist) and creates them again, empty, in a single transaction
+        """
+        with self.lock:
+            self.connect()
+            with self.transaction() as connection:
+                connection.execute("""DROP TABLE IF EXISTS files""")
+                connection.execute("""DROP TABLE IF EXISTS blobs""")
+                connection.execute("""DROP TABLE IF EXISTS chunks""")
+                connection.execute("""DROP TABLE IF EXISTS keys""")
+                connection.execute(CREATE_TABLE_COMMAND)
+                for version in range(len(MIGRATIONS)):
+                    self.apply_migration(version)
+
+    def fetch(self, file_name):
+        """
+        Fetches the entry of the file with the given name
+        :param file_name: The name of the file
+        :return: The row of the file, or None if it is not in the Database
+        """
+        with self.lock:
+            return self.connect().execute(FETCH_COMMAND, (file_name,)).fetchone()
+
+    def contains(self, file_name):
+        """
+        Checks if a file with the given name exists in the Database
+        :param file_name: The name of the file
+        :return: True if the file exists, False otherwise
+        """
+        with self.lock:
+            return self.connect().execute(CHECK_COMMAND, (file_name,)).fetchone() is not None
+
+    @contextlib.contextmanager
+    def adding(self, file_name, encryption_type):
+        """
+        Reserves the name of a new file with a short committed insert, so that sqlite3.IntegrityError is raised before anything else is done if a file with the same name already exists.
+        The file is then encrypted without holding the lock (or any transaction), so that the other operations are not kept waiting, while the reserved entry is hidden from fetch and list.
+        The entry is completed in a second short transaction if the yielded function is called, and deleted otherwise (or if an exception is raised).
+        :param file_name: The name of the file
+        :param encryption_type: Either "RSA" or "DH"
+        :return: A function storing the (two or four) encryption parameters, the metadata (size, time of last access, time of last modification and time of creation), the blob digest, the codec
+        and (optionally) the key material and manifest of the file, which also references the blob
+        """
+        with self.lock, self.connect() as connection:
+            row_id = connection.execute(ADD_COMMAND, (file_name, encryption_type, time.time())).lastrowid
+        completed = []
+
+        def complete(params, metadata, digest, codec, material=None, manifest=()):
+            # The encryption parameters are stored as text, since they can exceed the 64-bit SQLite integers
+            param_columns = [str(param) for param in params] + ["-1"] * (4 - len(params))
+            with self.lock, self.connect() as connection:
+                if connection.execute(COMPLETE_COMMAND, (*param_columns, *metadata, digest, codec, row_id)).rowcount == 0:
+                    raise sqlite3.IntegrityError(f"The reservation of '{file_name}' was released!")
+                connection.execute(REFERENCE_BLOB_COMMAND, (digest, encryption_type, *param_columns, codec))
+                if material is not None:
+                    connection.execute(INSERT_KEY_COMMAND, (digest, encryption_type, format_key_material(material)))
+                connection.executemany(INSERT_MANIFEST_COMMAND, ((digest, encryption_type, position, chunk_digest, length)
+                                                                 for position, (chunk_digest, length) in enumerate(manifest)))
+            completed.append(True)
+
+        try:
+            yield complete
+        finally:
+            if not completed:
+                with self.lock, self.connect() as connection:
+                    connection.execute(RELEASE_RESERVATION_COMMAND, (row_id,))
+
+    def existing_names(self, file_names):
+        """
+        Checks which of the given names already exist in the Database
+        :param file_names: A list of file names
+        :return: The set of names that exist in the Database
+        """
+        existing = set()
+        with self.lock:
+            connection = self.connect()
+            for index in range(0, len(file_names), NAMES_PER_QUERY):
+                names = file_names[index:index + NAMES_PER_QUERY]
+                query = f"""SELECT name FROM files WHERE name IN ({','.join('?' * len(names))})"""
+                existing.update(name for name, in connection.execute(query, names))
+        return existing
+
+    def insert_many(self, rows):
+        """
+        Inserts the entries of many encrypted files in a single transaction, referencing their blobs. If any name already exists, none of them is inserted.
+        :param rows: A list of (name, encryption type, (two or four) encryption parameters, size, time of last access, time of last modification, time of creation, blob digest, codec, key material, manifest) touples,
+        the key material being None and the manifest empty if they are not known (or already stored)
+        """
+        # The encryption parameters are stored as text, since they can exceed the 64-bit SQLite integers
+        entries = [(name, encryption_type, *[str(param) for param in params], *["-1"] * (4 - len(params)), *metadata)
+                   for name, encryption_type, params, *metadata, _, _ in rows]
+        with self.lock, self.connect() as connection:
+            connection.executemany(INSERT_COMMAND, entries)
+            connection.executemany(REFERENCE_BLOB_COMMAND, ((entry[10], *entry[1:6], entry[11]) for entry in entries))
+            connection.executemany(INSERT_KEY_COMMAND, ((row[7], row[1], format_key_material(row[9])) for row in rows
+                                                        if row[9] is not None))
+            connection.executemany(INSERT_MANIFEST_COMMAND, ((row[7], row[1], position, chunk_digest, length) for row in rows
+                                                             for position, (chunk_digest, length) in enumerate(row[10])))
+
+    def fetch_blob(self, digest, encryption_type):
+        """
+        Fetches the encryption parameters of the blob holding the given content, encrypted with the given algorithm
+        :param digest: The SHA-256 digest of the plaintext
+        :param encryption_type: Either "RSA" or "DH"
+        :return: The four encryption parameters (as text) and the codec of the blob, or None if no such blob is stored
+        """
+        with self.lock:
+            return self.connect().execute(FETCH_BLOB_COMMAND, (digest, encryption_type)).fetchone()
+
+    def fetch_matching(self, pattern):
+        """
+        Fetches the entries of all the files whose names match the pattern
+        :param pattern: A glob pattern (with *, ? and [...] wildcards), matched case-sensitively
+        :return: A list of rows
+        """
+        with self.lock:
+            return self.connect().execute(MATCH_COMMAND, (pattern,)).fetchall()
+
+    def list_files(self, file_filter=FileFilter(), columns=("id", "name"), after_id=0, limit=None):
+        """
+        Lists the files matching the filter, in the order of their ids. The rows are fetched a page at a time, the lock being released between pages.
+        :param file_filter: A FileFilter
+        :param columns: The names of the columns to be listed (see LIST_COLUMNS), the id being listed first in any case
+        :param after_id: Only the files with a greater id are listed, so that a listing can be continued from the last id it returned
+        :param limit: The most files to be listed, or None to list all of them
+        :return: A generator of rows, each being the id followed by the requested columns
+        """
+        filters, params = build_filters(file_filter)
+        query = LIST_COMMAND.format(columns=",".join(["id"] + [LIST_COLUMNS[column] for column in columns]),
+                                    filters=filters)
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_size = LIST_PAGE_SIZE if remaining is None else min(LIST_PAGE_SIZE, remaining)
+            with self.lock:
+                page = self.connect().execute(query, (after_id, *params, page_size)).fetchall()
+            yield from page
+            if len(page) < page_size:
+                return
+            after_id = page[-1][0]
+            if remaining is not None:
+                remaining -= len(page)
+
+    def count_files(self, file_filter=FileFilter()):
+        """
+        Counts the files matching the filter
+        :param file_filter: A FileFilter
+        :return: The number of files
+        """
+        filters, params = build_filters(file_filter)
+        with self.lock:
+            return self.connect().execute(COUNT_COMMAND.format(filters=filters), params).fetchone()[0]
+
+    def delete(self, file_name):
+        """
+        Deletes the entry of the file with the given name (see delete_many)
+        :param file_name: The name of the file
+        :return: A list with the deleted row, if its encrypted file is no longer referenced
+        """
+        return self.delete_many([file_name])
+
+    def delete_many(self, file_names):
+        """
+        Deletes the entries of all the given files in a single transaction, releasing their blobs. Blobs left without references are deleted as well.
+        :param file_names: A list of file names
+        :return: The deleted rows whose encrypted files are no longer referenced (one row per deleted blob, and every row stored before the blobs), so that those files can be removed
+        """
+        with self.lock, self.connect() as connection:
+            rows = [data for data in (connection.execute(FETCH_COMMAND, (file_name,)).fetchone() for file_name in file_names)
+                    if data is not None]
+            connection.executemany(DELETE_COMMAND, ((data[1],) for data in rows))
+            connection.executemany(RELEASE_BLOB_COMMAND, ((data[11], data[2]) for data in rows if data[11] is not None))
+            released = {(data[11], data[2]): data for data in rows}
+            unreferenced = [released[blob] for blob in connection.execute(UNREFERENCED_BLOBS_COMMAND) if blob in released]
+            connection.execute(DELETE_BLOBS_COMMAND)
+            connection.execute(DELETE_MANIFESTS_COMMAND)
+            connection.execute(DELETE_KEYS_COMMAND)
+        return [data for data in rows if data[11] is None] + unreferenced
+
+    def store_key(self, digest, encryption_type, material):
+        """
+        Stores the key material of a blob, unless it is already stored (or the blob was deleted meanwhile)
+        :param digest: The SHA-256 digest of the plaintext
+        :param encryption_type: Either "RSA" or "DH"
+        :param material: The key material, as a touple of numbers
+        """
+        with self.lock, self.connect() as connection:
+            if connection.execute(REFCOUNT_COMMAND, (digest, encryption_type)).fetchone() is not None:
+                connection.execute(INSERT_KEY_COMMAND, (digest, encryption_type, format_key_material(material)))
+
+    def references(self, digest, encryption_type):
+        """
+        Counts the files sharing the given blob
+        :param digest: The SHA-256 digest of the plaintext
+        :param encryption_type: Either "RSA" or "DH"
+        :return: The number of files referencing the blob, 0 if it is not stored
+        """
+        with self.lock:
+            row = self.connect().execute(REFCOUNT_COMMAND, (digest, encryption_type)).fetchone()
+        return 0 if row is None else row[0]
+
+    def fetch_manifest(self, digest, encryption_type):
+        """
+        Fetches the manifest of the given blob
+        :param digest: The SHA-256 digest of the plaintext
+        :param encryption_type: Either "RSA" or "DH"
+        :return: The list of (digest, length) touples of its chunks, in order, empty if no manifest was stored
+        """
+        with self.lock:
+            return self.connect().execute(FETCH_MANIFEST_COMMAND, (digest, encryption_type)).fetchall()
+
+    def update(self, file_name, params, metadata, digest, manifest, codec):
+        """
+        Points the entry of a file at another blob in a single transaction, referencing the new blob (and storing its manifest) and releasing the old one
+        :param file_name: The name of the file
+        :param params: The (two or four) encryption parameters of the new blob
+        :param metadata: The size, time of last access, time of last modification and time of creation of the file
+        :param digest: The SHA-256 digest of the new content
+        :param manifest: The list of (digest, length) touples of the chunks of the new content, or an empty list to keep the stored manifest
+        :param codec: The codec the new content was compressed with
+        :return: The old row, if its encrypted file is no longer referenced (as a list, see delete_many)
+        """
+        with self.lock, self.connect() as connection:
+            data = connection.execute(FETCH_COMMAND, (file_name,)).fetchone()
+            param_columns = [str(param) for param in params] + ["-1"] * (4 - len(params))
+            connection.execute(UPDATE_COMMAND, (*param_columns, *metadata, digest, codec, file_name))
+            connection.execute(REFERENCE_BLOB_COMMAND, (digest, data[2], *param_columns, codec))
+            connection.executemany(INSERT_MANIFEST_COMMAND, ((digest, data[2], position, chunk_digest, length)
+                                                             for position, (chunk_digest, length) in enumerate(manifest)))
+            if data[11] is None:
+                return [data]
+            if [str(param) for param in data[3:7]] == param_columns:
+                connection.execute(COPY_KEY_COMMAND, (digest, data[11], data[2]))
+            connection.execute(RELEASE_BLOB_COMMAND, (data[11], data[2]))
+            is_unreferenced = connection.execute(REFCOUNT_COMMAND, (data[11], data[2])).fetchone()[0] <= 0
+            connection.execute(DELETE_BLOBS_COMMAND)
+            connection.execute(DELETE_MANIFESTS_COMMAND)
+            connection.execute(DELETE_KEYS_COMMAND)
+        return [data] if is_unreferenced else []
+
+
+def format_key_material(material):
+    """
+    :param material: The key material of a blob, as a touple of numbers
+    :return: The key material, as stored in the keys table (as text, since the numbers can exceed the 64-bit SQLite integers)
+    """
+    return ",".join(str(value) for value in material)
+
+
+def build_filters(file_filter):
+    """
+    Builds the conditions of a FileFilter, every one of them usable with an index
+    :param file_filter: A FileFilter
+    :return: The (conditions, parameters) touple, the conditions being empty or starting with ' AND '
+    """
+    conditions = []
+    params = []
+    if file_filter.prefix:
+        # The names starting with the prefix are the ones between the prefix and the prefix with its last character incremented
+        conditions.append("name >= ? AND name < ?")
+        params += [file_filter.prefix, file_filter.prefix[:-1] + chr(ord(file_filter.prefix[-1]) + 1)]
+    for column, operator, value in (("encryption_type", "=", file_filter.encryption_type),
+                                    ("size", ">=", file_filter.min_size), ("size", "<=", file_filter.max_size),
+                                    ("creation_time", ">=", file_filter.created_after),
+                                    ("creation_time", "<", file_filter.created_before)):
+        if value is not None:
+            conditions.append(f"{column} {operator} ?")
+            params.append(value)
+    return "".join(f" AND {condition}" for condition in conditions), params
+
+
+_repositories = {}
+
+
+def get_repository(database_path):
+    """
+    Returns the repository of the given Database, creating it on first use. The connection is closed when the application exits.
+    :param database_path: The path of the SQLite Database
+    :return: The repository of that Database
+    """
+    if database_path not in _repositories:
+        repository = FilesRepository(database_path)
+        atexit.register(repository.close)
+        _repositories[database_path] = repository
+    return _repositories[database_path]
@@ -0,0 +1,187 @@
+import contextlib
+import os
+import time
+import zlib
+
+from FileInteractionMethods import ParsingMethods as PM
+from FileInteractionMethods import ProfilingMethods as PF
+
+# The codecs a file can be compressed with before being encrypted, recorded in the 'codec' column of the Database
+CODEC_NONE = "none"
+CODEC_ZLIB = "zlib"
+CODEC_LZMA = "lzma"
+# The codecs tried by the adaptive selection, from the fastest to the slowest
+CODECS = [CODEC_ZLIB, CODEC_LZMA]
+# The adaptive selection: every codec compresses a sample of the file, and the one that pays off is used (or none, if compression does not help)
+CODEC_AUTO = "auto"
+CODEC_CHOICES = [CODEC_AUTO, CODEC_NONE] + CODECS
+# The files are not compressed unless asked to, since 'update' encrypts a compressed file whole, while it only encrypts the changed chunks of an uncompressed one
+DEFAULT_CODEC = CODEC_NONE
+ZLIB_LEVEL = 6
+# Higher presets compress text about 50% better, but at about 1 MB/s
+LZMA_PRESET = 1
+# How many bytes (from the beginning of the file) are compressed by every codec in order to choose one
+SAMPLE_SIZE = 1024 * 1024
+# A codec is only chosen if its output is at least this much smaller than the one of the previous (faster) choice, starting with the uncompressed file
+MIN_SAVING = 0.1
+
+
+def create_compressor(codec):
+    """
+    Creates a streaming compressor for the given codec
+    :param codec: CODEC_ZLIB or CODEC_LZMA
+    :return: An object with the 'compress' and 'flush' methods
+    """
+    if codec == CODEC_ZLIB:
+        return zlib.compressobj(ZLIB_LEVEL)
+    if codec == CODEC_LZMA:
+        # lzma is only imported once a file is (de)compressed with it, so that the commands start faster
+        import lzma
+        return lzma.LZMACompressor(preset=LZMA_PRESET)
+    raise ValueError(f"Unrecognized codec '{codec}'!")
+
+
+def create_decompressor(codec):
+    """
+    Creates a streaming decompressor for the given codec
+    :param codec: CODEC_ZLIB or CODEC_LZMA
+    :return: An object with the 'decompress' method and the 'eof' attribute
+    """
+    if codec == CODEC_ZLIB:
+        return zlib.decompressobj()
+    if codec == CODEC_LZMA:
+        import lzma
+        return lzma.LZMADecompressor()
+    raise ValueError(f"Unrecognized codec '{codec}'!")
+
+
+def get_decompression_error(codec):
+    """
+    :param codec: CODEC_ZLIB or CODEC_LZMA
+    :return: The exception raised by the decompressor of the codec when the content is corrupted
+    """
+    if codec == CODEC_ZLIB:
+        return zlib.error
+    import lzma
+    return lzma.LZMAError
+
+
+def compress_chunks(codec, chunks):
+    """
+    Compresses the given chunks of bytes one after the other
+    :param codec: CODEC_ZLIB or CODEC_LZMA
+    :param chunks: An iterable of bytes
+    :return: A generator of compressed chunks of bytes
+    """
+    compressor = create_compressor(codec)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def measure_codecs(path):
+    """
+    Compresses a sample of the file with every codec
+    :param path: Path of the file
+    :return: A list of (codec, ratio, throughput in MB/s) touples, in the order of CODECS, the ratio being the sample size divided by its compressed size
+    """
+    with open(path, "rb") as file:
+        sample = file.read(SAMPLE_SIZE)
+    results = []
+    for codec in CODECS:
+        start = time.perf_counter()
+        compressed_size = sum(len(chunk) for chunk in compress_chunks(codec, [sample]))
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        results.append((codec, len(sample) / compressed_size, len(sample) / (1024 * 1024) / elapsed))
+    return results
+
+
+def choose_codec(path, codec=DEFAULT_CODEC):
+    """
+    Chooses the codec a file is compressed with. With the adaptive selection, the sample is compressed by every codec (their ratio and throughput being logged), and
+    a slower codec is only chosen if it saves at least MIN_SAVING more than the faster one, so that files which barely compress are stored as they are.
+    :param path: Path of the file
+    :param codec: One of CODEC_CHOICES
+    :return: CODEC_NONE, CODEC_ZLIB or CODEC_LZMA
+    """
+    if codec != CODEC_AUTO:
+        return codec
+    if os.path.getsize(path) == 0:
+        return CODEC_NONE
+    chosen, chosen_size = CODEC_NONE, 1.0
+    for candidate, ratio, throughput in measure_codecs(path):
+        PM.LOGGER.info("[COMPRESSION] '%s' sample with %s: ratio x%.2f at %.1f MB/s", os.path.basename(path), candidate,
+                       ratio, throughput)
+        if 1 / ratio <= chosen_size * (1 - MIN_SAVING):
+            chosen, chosen_size = candidate, 1 / ratio
+    PM.LOGGER.info("[COMPRESSION] '%s' will be compressed with %s", os.path.basename(path), chosen)
+    return chosen
+
+
+@contextlib.contextmanager
+def compressed_copy(path, codec):
+    """
+    Compresses the file into a temporary file, which is removed afterwards. Without a codec, the file itself is used.
+    :param path: Path of the file
+    :param codec: CODEC_NONE, CODEC_ZLIB or CODEC_LZMA
+    :return: The path of the file that needs to be encrypted
+    """
+    if codec == CODEC_NONE:
+        yield path
+        return
+    # tempfile is only imported once a file is compressed, so that the commands start faster
+    import tempfile
+    descriptor, compressed_path = tempfile.mkstemp(suffix=".compressed")
+    os.close(descriptor)
+    try:
+        start = time.perf_counter()
+        with PF.span("compress"):
+            compressed_size, _ = PM.write_chunks(compressed_path, compress_chunks(codec, PM.read_chunks(path, PM.CHUNK_SIZE)))
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        size = os.path.getsize(path)
+        PM.LOGGER.info("[COMPRESSION] '%s' compressed with %s from %s to %s bytes (x%.2f) at %.1f MB/s",
+                       os.path.basename(path), codec, size, compressed_size, size / max(compressed_size, 1),
+                       size / (1024 * 1024) / elapsed)
+        yield compressed_path
+    finally:
+        os.remove(compressed_path)
+
+
+class DecompressingWriter:
+    """
+    A writable binary file object decompressing everything written to it into another output, so that decrypted files are decompressed as they are streamed.
+    A content that cannot be decompressed with the codec raises ValueError.
+    """
+
+    def __init__(self, codec, output):
+        """
+        :param codec: CODEC_ZLIB or CODEC_LZMA
+        :param output: A writable binary file object the decompressed bytes are written to
+        """
+        self.codec = codec
+        self.decompressor = create_decompressor(codec)
+        self.error = get_decompression_error(codec)
+        self.output = output
+
+    def write(self, data):
+        """
+        :param data: The compressed bytes
+        :return: The number of compressed bytes consumed
+        """
+        try:
+            decompressed = self.decompressor.decompress(data)
+        except self.error as err:
+            raise ValueError(f"The content could not be decompressed with {self.codec}: {err}") from err
+        self.output.write(decompressed)
+        return len(data)
+
+    def flush(self):
+        self.output.flush()
+
+    def is_complete(self):
+        """
+        :return: True if the whole compressed stream was written, False otherwise
+        """
+        return self.decompressor.eof
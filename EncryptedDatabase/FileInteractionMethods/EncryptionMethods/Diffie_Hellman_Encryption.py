@@ -1,18 +1,39 @@
+import functools
+import itertools
 import os.path
 import random
 
 from FileInteractionMethods import ParsingMethods as PM
+from FileInteractionMethods import ProfilingMethods as PF
 from FileInteractionMethods.EncryptionMethods import EncryptionConstants
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The integer widths (in bytes) NumPy has unsigned dtypes for
+NUMPY_INT_WIDTHS = (1, 2, 4, 8)
+
 
 def compute_initial_prime_numbers():
     """
     This function computes four (relatively) large prime numbers representing the communicating parties' private and public keys by first computing all the 16-bit possible prime numbers, then randomly choosing 4 different ones.
     I chose DIFFIE_HELLMAN_KEY_SIZE = 16, same as RSA encryption, since it is the most efficient
+    For key sizes above SIEVE_KEY_SIZE_LIMIT, the four prime numbers are generated with the Miller-Rabin test instead.
     :return: A touple of the generated numbers
     """
-    primes_in_range = EncryptionConstants.generate_primes(EncryptionConstants.LOWER_BOUND,
-                                                          EncryptionConstants.DIFFIE_HELLMAN_UPPER_BOUND)
+    with PF.span("dh.primes"):
+        if EncryptionConstants.DIFFIE_HELLMAN_KEY_SIZE > EncryptionConstants.SIEVE_KEY_SIZE_LIMIT:
+            keys = []
+            while len(keys) < 4:
+                key = EncryptionConstants.random_prime(EncryptionConstants.DIFFIE_HELLMAN_KEY_SIZE - 1)
+                if key not in keys:
+                    keys.append(key)
+            priv_key1, pub_key1, priv_key2, pub_key2 = keys
+            return pub_key1, priv_key1, pub_key2, priv_key2
+        primes_in_range = EncryptionConstants.generate_primes(EncryptionConstants.LOWER_BOUND,
+                                                              EncryptionConstants.DIFFIE_HELLMAN_UPPER_BOUND)
     priv_key1 = 0
     pub_key1 = 0
     priv_key2 = 0
@@ -35,10 +56,8 @@ def generate_partial_keys(pub_key1, priv_key1, pub_key2, priv_key2):
     :param priv_key2: Private key of the second party
     :return: A touple with the partial keys of both the first and the second parties
     """
-    partial_key1 = pub_key1 ** priv_key1
-    partial_key1 %= pub_key2
-    partial_key2 = pub_key1 ** priv_key2
-    partial_key2 %= pub_key2
+    partial_key1 = pow(pub_key1, priv_key1, pub_key2)
+    partial_key2 = pow(pub_key1, priv_key2, pub_key2)
     return partial_key1, partial_key2
 
 
@@ -54,83 +73,220 @@ def generate_full_key(priv_key1, partial_key1, pub_key2, priv_key2, partial_key2
     The method raises an Exception if the generated full keys are different from one another, which would mean there is something wrong with the algorithm.
     :return: The full key shared by both ends
     """
-    full_key_1 = partial_key2 ** priv_key1
-    full_key_1 %= pub_key2
-    full_key_2 = partial_key1 ** priv_key2
-    full_key_2 %= pub_key2
+    full_key_1 = pow(partial_key2, priv_key1, pub_key2)
+    full_key_2 = pow(partial_key1, priv_key2, pub_key2)
     if full_key_1 != full_key_2:
         raise Exception("Encryption failed!")
     return full_key_1
 
 
-def encrypt(before_path, after_path, pub_key1, priv_key1, pub_key2, priv_key2):
+def derive_full_key(pub_key1, priv_key1, pub_key2, priv_key2):
+    """
+    Computes the partial keys of both parties, then the full key shared by both ends
+    :param pub_key1: Public key of the first party
+    :param priv_key1: Private key of the first party
+    :param pub_key2: Public key of the second party
+    :param priv_key2: Private key of the second party
+    :return: The full key shared by both ends
+    """
+    partial_key1, partial_key2 = generate_partial_keys(pub_key1, priv_key1, pub_key2, priv_key2)
+    PM.LOGGER.debug("[DH] The two partial keys are %s and %s", partial_key1, partial_key2)
+    return generate_full_key(priv_key1, partial_key1, pub_key2, priv_key2, partial_key2)
+
+
+def encrypt_bytes(full_key, plaintext):
+    """
+    Adds the full key to each byte's value
+    :param full_key: The full key shared by both ends
+    :param plaintext: The bytes to be encrypted
+    :return: The list of encrypted numbers
+    """
+    return [chval + full_key for chval in plaintext]
+
+
+def decrypt_numbers(full_key, encoded_numbers):
+    """
+    Subtracts the full key from each encrypted number
+    :param full_key: The full key shared by both ends
+    :param encoded_numbers: The encrypted numbers
+    :return: The decrypted bytes
+    """
+    return bytes([chval - full_key for chval in encoded_numbers])
+
+
+def is_numpy_backend(int_width):
+    """
+    Checks if the NumPy backend can be used for numbers of the given width
+    :param int_width: The width of the stored numbers, in bytes
+    :return: True if NumPy is installed, enabled and has a dtype for that width, False otherwise
+    """
+    return np is not None and EncryptionConstants.USE_NUMPY and int_width in NUMPY_INT_WIDTHS
+
+
+def encrypt_bytes_numpy(full_key, int_width, plaintext):
+    """
+    Adds the full key to each byte's value in a single array operation
+    :param full_key: The full key shared by both ends
+    :param int_width: The width of the stored numbers, in bytes
+    :param plaintext: The bytes to be encrypted
+    :return: The encrypted numbers, already packed as little-endian integers
+    """
+    encoded_numbers = np.frombuffer(plaintext, dtype=np.uint8).astype(f"<u{int_width}")
+    encoded_numbers += full_key
+    return encoded_numbers.tobytes()
+
+
+def decrypt_payload_numpy(full_key, int_width, payload):
+    """
+    Subtracts the full key from each packed number in a single array operation
+    :param full_key: The full key shared by both ends
+    :param int_width: The width of the stored numbers, in bytes
+    :param payload: The encrypted numbers, packed as little-endian integers
+    :return: The decrypted bytes
+    """
+    encoded_numbers = np.frombuffer(payload, dtype=f"<u{int_width}")
+    return (encoded_numbers - full_key).astype(np.uint8).tobytes()
+
+
+def encrypt_chunks(full_key, chunks, int_width, workers=EncryptionConstants.DEFAULT_WORKERS):
     """
-    For DH encryption, we are simply going to add the full_key to each character's ASCII value, obtaining a sequence of numbers which we will then turn back to characters and write the result in a separate file.
+    Encrypts the plaintext one chunk at a time, using the NumPy backend when possible
+    :param full_key: The full key shared by both ends
+    :param chunks: An iterable of plaintext chunks
+    :param int_width: The width of the stored numbers, in bytes
+    :param workers: The number of processes encrypting chunks in parallel
+    :return: An iterator of (plaintext chunk, encrypted numbers of that chunk) touples, in order
+    """
+    plaintext_chunks, submitted_chunks = itertools.tee(chunks)
+    if is_numpy_backend(int_width):
+        encrypt_chunk = functools.partial(encrypt_bytes_numpy, full_key, int_width)
+    else:
+        encrypt_chunk = functools.partial(encrypt_bytes, full_key)
+    return zip(plaintext_chunks, EncryptionConstants.parallel_map(encrypt_chunk, submitted_chunks, workers))
+
+
+def decrypt_chunks(full_key, number_chunks, workers=EncryptionConstants.DEFAULT_WORKERS, int_width=None):
+    """
+    Decrypts the encrypted numbers one chunk at a time
+    :param full_key: The full key shared by both ends
+    :param number_chunks: An iterable of sequences of encrypted numbers, or of packed bytes if int_width is given
+    :param workers: The number of processes decrypting chunks in parallel
+    :param int_width: The width of the packed numbers, in bytes, if they are to be decrypted with the NumPy backend
+    :return: A generator of decrypted chunks of bytes, in order
+    """
+    if int_width is not None:
+        decrypt_chunk = functools.partial(decrypt_payload_numpy, full_key, int_width)
+    else:
+        decrypt_chunk = functools.partial(decrypt_numbers, full_key)
+    return EncryptionConstants.parallel_map(decrypt_chunk, number_chunks, workers)
+
+
+def decrypt_container(full_key, before_path, after_path, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Decrypts an encrypted file written in the binary container layout, checking the result against the container checksum
+    :param full_key: The full key shared by both ends
+    :param before_path: Path of the encrypted file
+    :param after_path: Path of the decrypted file, or a writable binary file object
+    :param workers: The number of processes decrypting chunks in parallel
+    :returns: True if the decryption went good, False otherwise
+    """
+    with open(before_path, "rb") as file:
+        header = PM.read_container_header(file)
+        if header.algorithm != PM.ALGORITHM_DH:
+            PM.LOGGER.error(
+                "[DH] Encrypted file was not encrypted with Diffie-Hellman!")
+            return False
+        if is_numpy_backend(header.int_width):
+            number_chunks = PF.timed_chunks(PM.read_container_chunks(file, header, PM.CHUNK_SIZE, True), "io.read")
+            decrypted_chunks = decrypt_chunks(full_key, number_chunks, workers, header.int_width)
+        else:
+            number_chunks = PF.timed_chunks(PM.read_container_chunks(file, header, PM.CHUNK_SIZE), "io.read")
+            decrypted_chunks = decrypt_chunks(full_key, number_chunks, workers)
+        decrypted_chunks = PF.timed_chunks(decrypted_chunks, "dh.decrypt_chunks")
+        length, checksum = PM.write_chunks(after_path,
+                                           PM.log_chunks(decrypted_chunks, "[DH DECRYPTION] Plaintext chunk is %r"))
+    if not PM.verify_checksum(length, checksum, header):
+        PM.remove_output(after_path)
+        return False
+    return True
+
+
+def decrypt_text(full_key, before_path, after_path):
+    """
+    Decrypts an encrypted file written in the older text layout, with one number per character
+    :param full_key: The full key shared by both ends
+    :param before_path: Path of the encrypted file
+    :param after_path: Path of the decrypted file, or a writable binary file object
+    :returns: True if the decryption went good, False otherwise
+    """
+    with open(before_path, "r") as file, PM.open_output(after_path, True) as output_file:
+        for encoded_numbers in PM.read_text_numbers(file, PM.CHUNK_SIZE):
+            output_file.write("".join([chr(chval - full_key) for chval in encoded_numbers]))
+    return True
+
+
+def encrypt(before_path, after_path, pub_key1, priv_key1, pub_key2, priv_key2,
+            workers=EncryptionConstants.DEFAULT_WORKERS, full_key=None):
+    """
+    For DH encryption, we are simply going to add the full_key to each byte's value, obtaining a sequence of numbers which we will then write in a separate file, using the binary container layout from ParsingMethods.
+    The file is read, encrypted and written one chunk at a time, so the memory used does not depend on the file size. If NumPy is installed, each chunk is encrypted in a single array operation.
     :param before_path: Path of the original file, the cached version from the Files/ folder
     :param after_path: Path of the encrypted file, from the Files/Encrypted/ folder, where we will store the encrypted version of the file - with '_encrypted' added to the end of the original file name
     :param pub_key1: Public key of the first party (stored in Database)
     :param priv_key1: Private key of the first party (stored in Database)
     :param pub_key2: Public key of the second party (stored in Database)
     :param priv_key2: Private key of the second party (stored in Database)
+    :param workers: The number of processes encrypting chunks in parallel
+    :param full_key: The full key of the four keys, if it was already derived (it is derived here otherwise)
     """
-    partial_key1, partial_key2 = generate_partial_keys(pub_key1, priv_key1, pub_key2, priv_key2)
-    print(
-        f"{PM.ConsoleColors.INFO}[DH ENCRYPTION] The two partial keys are {str(partial_key1)} and {str(partial_key2)}{PM.ConsoleColors.ENDCHAR}")
-    full_key = generate_full_key(priv_key1, partial_key1, pub_key2, priv_key2, partial_key2)
-    print(f"{PM.ConsoleColors.INFO}[DH ENCRYPTION] The full key is {str(full_key)}{PM.ConsoleColors.ENDCHAR}")
-    file = open(before_path, "r")
-    plaintext = file.read()
-    print(f"{PM.ConsoleColors.INFO}[DH ENCRYPTION] Plaintext is '{plaintext}'{PM.ConsoleColors.ENDCHAR}")
-    ascii_characters = [ord(ch) for ch in plaintext]
-    encoded_numbers = [chval + full_key for chval in ascii_characters]
-    ciphertext = ""
-    for x in encoded_numbers:
-        ciphertext += str(x)
-    print(f"{PM.ConsoleColors.INFO}[DH ENCRYPTION] Ciphertext is '{ciphertext}'{PM.ConsoleColors.ENDCHAR}")
-
-    with open(after_path, "w") as output_file:
-        output_file.write('\n'.join(str(number) for number in encoded_numbers))
-
-
-def decrypt(before_path, after_path, pub_key1, priv_key1, pub_key2, priv_key2):
-    """
-    For DH decryption, we will decrypt the ciphertext by subtracting the full key from each character's ASCII value. We will obtain a sequence of numbers which we will then turn back to characters and write the result in a separate file.
+    if full_key is None:
+        full_key = derive_full_key(pub_key1, priv_key1, pub_key2, priv_key2)
+    PM.LOGGER.debug("[DH ENCRYPTION] The full key is %s", full_key)
+    int_width = PM.compute_int_width(full_key + 255)
+    chunks = PF.timed_chunks(PM.read_chunks(before_path, PM.CHUNK_SIZE), "io.read")
+    encoded_chunks = PM.log_chunks(PF.timed_chunks(encrypt_chunks(full_key, chunks, int_width, workers), "dh.encrypt_chunks"),
+                                   "[DH ENCRYPTION] Plaintext chunk %r is encrypted as %s")
+    PM.write_container(after_path, PM.ALGORITHM_DH, 1, int_width, encoded_chunks)
+    PM.LOGGER.info("[DH ENCRYPTION] Encrypted file written at '%s'", after_path)
+
+
+def decrypt(before_path, after_path, pub_key1, priv_key1, pub_key2, priv_key2,
+            workers=EncryptionConstants.DEFAULT_WORKERS, full_key=None):
+    """
+    For DH decryption, we will decrypt the ciphertext by subtracting the full key from each stored number. We will obtain a sequence of bytes which we will write in a separate file, after checking them against the container checksum.
+    The file is read, decrypted and written one chunk at a time (as arrays, if NumPy is installed). Files written in the older text layout (one number per line) are decrypted character by character.
     :param before_path: Path of the encrypted file, from the Files/Encrypted/ folder, where we have stored the encrypted version of the file - with '_encrypted' added to the end of the original file name
-    :param after_path: Path of the decrypted file, which will overwrite the cached version from the Files/ folder
+    :param after_path: Path of the decrypted file, which will overwrite the cached version from the Files/ folder, or a writable binary file object (such as sys.stdout.buffer) the decrypted bytes are streamed to
     :param pub_key1: Public key of the first party (stored in Database)
     :param priv_key1: Private key of the first party (stored in Database)
     :param pub_key2: Public key of the second party (stored in Database)
     :param priv_key2: Private key of the second party (stored in Database)
+    :param workers: The number of processes decrypting chunks in parallel
+    :param full_key: The full key of the four keys, if it was already derived (it is derived here otherwise)
     :returns: True if the decryption went good, False otherwise
     """
     if not os.path.exists(before_path):
-        print(f"{PM.ConsoleColors.ERROR}[DH] Encrypted file does not exist!{PM.ConsoleColors.ENDCHAR}")
+        PM.LOGGER.error("[DH] Encrypted file does not exist!")
         return False
-    if not os.path.exists(after_path):
-        print(
-            f"{PM.ConsoleColors.WARNING}[DH] The file was deleted from the cache folder! It will now be restored!{PM.ConsoleColors.ENDCHAR}")
-    else:
-        os.remove(after_path)
-    partial_key1, partial_key2 = generate_partial_keys(pub_key1, priv_key1, pub_key2, priv_key2)
-    print(
-        f"{PM.ConsoleColors.INFO}[DH DECRYPTION] The two partial keys are {str(partial_key1)} and {str(partial_key2)}{PM.ConsoleColors.ENDCHAR}")
-    full_key = generate_full_key(priv_key1, partial_key1, pub_key2, priv_key2, partial_key2)
-    print(f"{PM.ConsoleColors.INFO}[DH DECRYPTION] The full key is {str(full_key)}{PM.ConsoleColors.ENDCHAR}")
-    encoded_numbers = []
-    file = open(before_path, "r")
-    for line in file:
-        encoded_numbers.append(int(line.strip('\n')))
-    ciphertext = ""
-    for x in encoded_numbers:
-        ciphertext += str(x)
-    print(f"{PM.ConsoleColors.INFO}[DH DECRYPTION] Ciphertext is '{ciphertext}'{PM.ConsoleColors.ENDCHAR}")
-    decoded_characters = [chr(chval - full_key) for chval in encoded_numbers]
-    plaintext = ""
-    for x in decoded_characters:
-        plaintext += x
-    print(f"{PM.ConsoleColors.INFO}[DH DECRYPTION] Plaintext is '{plaintext}'{PM.ConsoleColors.ENDCHAR}")
-
-    with open(after_path, "w") as output_file:
-        output_file.write(plaintext)
-
-    return True
+    if PM.is_path(after_path):
+        if not os.path.exists(after_path):
+            PM.LOGGER.warning(
+                "[DH] The file was deleted from the cache folder! It will now be restored!")
+        else:
+            os.remove(after_path)
+    if full_key is None:
+        full_key = derive_full_key(pub_key1, priv_key1, pub_key2, priv_key2)
+    PM.LOGGER.debug("[DH DECRYPTION] The full key is %s", full_key)
+    try:
+        if PM.is_container(before_path):
+            is_decrypted = decrypt_container(full_key, before_path, after_path, workers)
+        else:
+            is_decrypted = decrypt_text(full_key, before_path, after_path)
+    except (ValueError, OverflowError):
+        PM.LOGGER.error(
+            "[DH] The encrypted file does not match the stored keys!")
+        PM.remove_output(after_path)
+        return False
+    if is_decrypted and PM.is_path(after_path):
+        PM.LOGGER.info("[DH DECRYPTION] Decrypted file written at '%s'", after_path)
+    return is_decrypted
@@ -1,4 +1,11 @@
+import array
+import bisect
+import collections
+import itertools
 import math
+import os
+import struct
+import sys
 
 RSA_KEY_SIZE = 16
 DIFFIE_HELLMAN_KEY_SIZE = 16
@@ -7,6 +14,34 @@ LOWER_BOUND = 3
 # UPPER BOUNDS for prime number generation
 RSA_UPPER_BOUND = int(2 ** RSA_KEY_SIZE / 2)
 DIFFIE_HELLMAN_UPPER_BOUND = int(2 ** DIFFIE_HELLMAN_KEY_SIZE / 2)
+# If True, RSA packs as many plaintext bytes as fit below n into a single encrypted number, instead of encrypting each character separately
+RSA_BLOCK_MODE = True
+# The RSA modulus needs to be larger than any byte value
+RSA_MIN_MODULUS = 255
+# Above this key size, prime numbers are no longer picked from a sieved table, but generated with the Miller-Rabin test
+SIEVE_KEY_SIZE_LIMIT = 24
+# Number of Miller-Rabin rounds, each one letting a composite number pass with a probability of at most 1/4
+MILLER_RABIN_ROUNDS = 40
+# Numbers divisible by one of the primes below this bound are rejected before running the Miller-Rabin test
+SMALL_PRIMES_BOUND = 1000
+# When generating a large prime, a window of this many consecutive odd numbers is sieved by all the primes below the sieve bound
+# The sieve bound grows with the size of the prime (bits * PRIME_SEARCH_SIEVE_FACTOR), since the Miller-Rabin rounds it saves get more expensive
+PRIME_SEARCH_WINDOW = 4096
+PRIME_SEARCH_SIEVE_FACTOR = 32
+PRIME_SEARCH_SIEVE_BOUND = 2 ** 16
+# The number of processes used to encrypt / decrypt a file, unless specified otherwise; 1 means no process pool is started
+DEFAULT_WORKERS = 1
+# How many chunks per worker can be waiting to be processed or consumed, so that the memory used stays bounded
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+# If True and NumPy is installed, the Diffie-Hellman cipher transforms whole chunks as arrays instead of byte by byte
+USE_NUMPY = True
+# If True, the prime tables are also stored next to the Database, so that they are generated once per machine instead of once per run
+PERSIST_PRIMES = True
+PRIMES_CACHE_PATH = "Database/primes_{}.bin"
+# The stored prime tables start with their upper bound and their length, so that a truncated (or foreign) file is detected and generated again
+PRIMES_CACHE_HEADER = struct.Struct("<II")
+# The prime tables already generated in this run, by upper bound
+_primes_cache = {}
 
 
 def gcd(a, b):
@@ -38,15 +73,227 @@ def extended_gcd(a, b):
     return a, last_x, last_y
 
 
-def generate_primes(lower_bound, upper_bound):
+def sieve_primes(upper_bound):
     """
-    Generates all the prime numbers between the lower and upper bound, depending on the key size
+    Applies the Sieve of Eratosthenes on a bytearray in order to find all the prime numbers up to the upper bound
+    :param upper_bound: The largest number that is checked
+    :return: An array of all the prime numbers smaller than or equal to the upper bound, in ascending order
+    """
+    sieve = bytearray([1]) * (upper_bound + 1)
+    sieve[0:2] = bytes(min(2, upper_bound + 1))
+    for num in range(2, math.isqrt(upper_bound) + 1):
+        if sieve[num]:
+            sieve[num * num::num] = bytes(len(range(num * num, upper_bound + 1, num)))
+    return array.array("I", itertools.compress(range(upper_bound + 1), sieve))
+
+
+def load_primes(upper_bound, persist=PERSIST_PRIMES):
+    """
+    Returns all the prime numbers up to the upper bound, generating them only if they are neither in the in-process cache, nor in the binary file stored next to the Database
+    :param upper_bound: The largest number that is checked
+    :param persist: True if the prime table should be read from / written to the Database folder
+    :return: An array of all the prime numbers smaller than or equal to the upper bound, in ascending order
+    """
+    if upper_bound in _primes_cache:
+        return _primes_cache[upper_bound]
+    cache_path = PRIMES_CACHE_PATH.format(upper_bound)
+    primes = read_primes_cache(cache_path, upper_bound) if persist else None
+    if primes is None:
+        primes = sieve_primes(upper_bound)
+        if persist and os.path.isdir(os.path.dirname(cache_path)):
+            write_primes_cache(cache_path, upper_bound, primes)
+    _primes_cache[upper_bound] = primes
+    return primes
+
+
+def read_primes_cache(cache_path, upper_bound):
+    """
+    Reads a prime table stored by write_primes_cache
+    :param cache_path: The path of the binary file
+    :param upper_bound: The upper bound the table was generated for
+    :return: The array of prime numbers, or None if the file is missing, truncated or holds the table of another upper bound
+    """
+    try:
+        with open(cache_path, "rb") as cache_file:
+            content = cache_file.read()
+    except OSError:
+        return None
+    primes = array.array("I")
+    if len(content) < PRIMES_CACHE_HEADER.size:
+        return None
+    stored_bound, count = PRIMES_CACHE_HEADER.unpack_from(content)
+    if stored_bound != upper_bound or len(content) != PRIMES_CACHE_HEADER.size + count * primes.itemsize:
+        return None
+    primes.frombytes(content[PRIMES_CACHE_HEADER.size:])
+    if sys.byteorder == "big":
+        primes.byteswap()
+    return primes
+
+
+def write_primes_cache(cache_path, upper_bound, primes):
+    """
+    Stores a prime table in a binary file (as little-endian numbers after the header). The table is written to a temporary file first, then moved over the binary file,
+    so that an interrupted run never leaves a truncated table behind.
+    :param cache_path: The path of the binary file
+    :param upper_bound: The upper bound the table was generated for
+    :param primes: The array of prime numbers
+    """
+    stored_primes = array.array("I", primes)
+    if sys.byteorder == "big":
+        stored_primes.byteswap()
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "wb") as cache_file:
+            cache_file.write(PRIMES_CACHE_HEADER.pack(upper_bound, len(stored_primes)))
+            stored_primes.tofile(cache_file)
+        os.replace(temporary_path, cache_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def generate_primes(lower_bound, upper_bound, persist=PERSIST_PRIMES):
+    """
+    Generates all the prime numbers between the lower and upper bound, depending on the key size.
+    The prime table is sieved once per upper bound and reused by every following call.
     :param lower_bound: Lower bound for primes generation, the smallest number possible
     :param upper_bound: Upper bound for primes generation, the largest number possible
-    :return: The list of all the possible choices between the two bounds
+    :param persist: True if the prime table should be read from / written to the Database folder
+    :return: The array of all the possible choices between the two bounds
+    """
+    primes = load_primes(upper_bound, persist)
+    return primes[bisect.bisect_left(primes, lower_bound):]
+
+
+class Codebook(dict):
+    """
+    Since RSA transforms each character independently under a fixed key, every file is a substitution over a small alphabet.
+    The codebook memoizes that substitution: a value is transformed (with pow) the first time it is looked up and read from the table afterwards.
+    Diffie-Hellman does not use it, since its transform (a single addition) is cheaper than the lookup.
+    """
+
+    def __init__(self, transform):
+        """
+        :param transform: The function applied to a value that is not in the codebook yet
+        """
+        super().__init__()
+        self.transform = transform
+
+    def __missing__(self, value):
+        result = self.transform(value)
+        self[value] = result
+        return result
+
+
+def miller_rabin_rounds(bits):
+    """
+    For randomly generated candidates, far fewer Miller-Rabin rounds than the worst case are needed in order to reach an error probability below 2^-80 (Damgard, Landrock and Pomerance)
+    :param bits: The size of the candidates, in bits
+    :return: The number of rounds needed for candidates of that size
+    """
+    for min_bits, rounds in ((1300, 2), (850, 3), (650, 4), (550, 5), (450, 6), (400, 7), (350, 8), (300, 9), (250, 12),
+                             (200, 15), (150, 18)):
+        if bits >= min_bits:
+            return rounds
+    return 27
+
+
+def miller_rabin(number, rounds):
+    """
+    Applies the Miller-Rabin primality test on an odd number greater than 3
+    :param number: The number to be tested
+    :param rounds: The number of random bases the number is tested against
+    :return: False if the number is certainly composite, True if it is prime with a probability of at least 1 - 4^(-rounds)
+    """
+    # secrets is only imported once a key is generated with the Miller-Rabin test, so that the commands start faster
+    import secrets
+    exponent, shifts = number - 1, 0
+    while exponent % 2 == 0:
+        exponent //= 2
+        shifts += 1
+    for _ in range(rounds):
+        witness = pow(2 + secrets.randbelow(number - 3), exponent, number)
+        if witness == 1 or witness == number - 1:
+            continue
+        for _ in range(shifts - 1):
+            witness = pow(witness, 2, number)
+            if witness == number - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def is_probable_prime(number, rounds=MILLER_RABIN_ROUNDS):
+    """
+    Checks if the given number is prime, by a quick trial division by the small primes followed by the Miller-Rabin test.
+    :param number: The number to be tested
+    :param rounds: The number of random bases the number is tested against
+    :return: False if the number is certainly composite, True if it is prime with a probability of at least 1 - 4^(-rounds)
+    """
+    if number < 2:
+        return False
+    for prime in load_primes(SMALL_PRIMES_BOUND, False):
+        if number % prime == 0:
+            return number == prime
+    return number < SMALL_PRIMES_BOUND ** 2 or miller_rabin(number, rounds)
+
+
+def random_prime(bits):
+    """
+    Generates a random prime number having exactly the given number of bits, without enumerating any other prime.
+    Starting from a random odd number with the highest bit set, the following PRIME_SEARCH_WINDOW odd numbers are sieved by the small primes, and only the remaining candidates go through the Miller-Rabin test.
+    :param bits: The size of the wanted prime number, in bits (at least 3)
+    :return: The generated prime number
+    """
+    import secrets
+    if bits < 3:
+        raise ValueError("Prime numbers need to have at least 3 bits!")
+    sieve_bound = min(bits * PRIME_SEARCH_SIEVE_FACTOR, PRIME_SEARCH_SIEVE_BOUND)
+    if bits <= sieve_bound.bit_length():
+        while True:
+            candidate = secrets.randbits(bits) | (1 << (bits - 1)) | 1
+            if is_probable_prime(candidate):
+                return candidate
+    rounds = miller_rabin_rounds(bits)
+    odd_primes = generate_primes(LOWER_BOUND, sieve_bound, False)
+    while True:
+        start = secrets.randbits(bits) | (1 << (bits - 1)) | 1
+        # window[index] stands for start + 2 * index, and (prime + 1) // 2 is the inverse of 2 modulo prime
+        window = bytearray([1]) * PRIME_SEARCH_WINDOW
+        for prime in odd_primes:
+            first = (-(start % prime) * ((prime + 1) // 2)) % prime
+            window[first::prime] = bytes(len(range(first, PRIME_SEARCH_WINDOW, prime)))
+        for index in itertools.compress(range(PRIME_SEARCH_WINDOW), window):
+            candidate = start + 2 * index
+            if candidate.bit_length() > bits:
+                break
+            if miller_rabin(candidate, rounds):
+                return candidate
+
+
+def parallel_map(function, items, workers=DEFAULT_WORKERS):
+    """
+    Applies the function on every item, in order, using a pool of processes if more than one worker is wanted.
+    At most CHUNKS_IN_FLIGHT_PER_WORKER items per worker are submitted ahead of the one being consumed, so that long (or endless) iterables can be processed in bounded memory.
+    The function (and its bound arguments) needs to be picklable, so it has to be defined at module level. Memoryviews are copied into bytes (or lists, for wider integers), since they cannot be pickled.
+    :param function: The function to be applied
+    :param items: An iterable of the function's arguments
+    :param workers: The number of processes to be used
+    :return: A generator of the results, in the order of the items
     """
-    generated_primes = []
-    for num in range(lower_bound, upper_bound + 1, 2):
-        if all(num % i != 0 for i in range(2, int(math.sqrt(num)) + 1)):
-            generated_primes.append(num)
-    return generated_primes
+    if workers <= 1:
+        yield from map(function, items)
+        return
+    # The pool is only imported when it is used, so that the commands start faster (and the single-process ones never import it)
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for item in items:
+            if isinstance(item, memoryview):
+                item = item.tobytes() if item.format == "B" else item.tolist()
+            pending.append(executor.submit(function, item))
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
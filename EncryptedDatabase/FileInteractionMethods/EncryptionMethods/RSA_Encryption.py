@@ -1,21 +1,36 @@
+import functools
+import itertools
 import os.path
 import random
 
 import FileInteractionMethods.ParsingMethods as PM
+import FileInteractionMethods.ProfilingMethods as PF
 from FileInteractionMethods.EncryptionMethods import EncryptionConstants
 
+# The first line of a block-packed encrypted file written in the older text layout: '#RSA-BLOCK <block width> <plaintext length>'
+BLOCK_HEADER = "#RSA-BLOCK"
+
 
 def compute_initial_prime_numbers():
     """
-    This function computes two large enough prime numbers such that n (the RSA modulus) does not exceed 2^KEY_SIZE.
+    This function computes two large enough prime numbers such that n (the RSA modulus) does not exceed 2^KEY_SIZE, while still being able to hold a byte.
     I chose RSA_KEY_SIZE = 16, since if it was chosen above 24, the algorithm would lose efficiency.
+    For key sizes above SIEVE_KEY_SIZE_LIMIT, the two prime numbers of RSA_KEY_SIZE / 2 bits are generated with the Miller-Rabin test instead.
     :return: The two chosen prime numbers
     """
-    primes_in_range = EncryptionConstants.generate_primes(EncryptionConstants.LOWER_BOUND,
-                                                          EncryptionConstants.RSA_UPPER_BOUND)
+    with PF.span("rsa.primes"):
+        if EncryptionConstants.RSA_KEY_SIZE > EncryptionConstants.SIEVE_KEY_SIZE_LIMIT:
+            half_size = EncryptionConstants.RSA_KEY_SIZE // 2
+            p1 = EncryptionConstants.random_prime(half_size)
+            p2 = p1
+            while p2 == p1:
+                p2 = EncryptionConstants.random_prime(EncryptionConstants.RSA_KEY_SIZE - half_size)
+            return p1, p2
+        primes_in_range = EncryptionConstants.generate_primes(EncryptionConstants.LOWER_BOUND,
+                                                              EncryptionConstants.RSA_UPPER_BOUND)
     p1 = 0
     p2 = 0
-    while p1 == p2 or (p1 * p2) > 2 ** EncryptionConstants.RSA_KEY_SIZE:
+    while p1 == p2 or (p1 * p2) > 2 ** EncryptionConstants.RSA_KEY_SIZE or (p1 * p2) <= EncryptionConstants.RSA_MIN_MODULUS:
         p1 = random.choice(primes_in_range)
         p2 = random.choice(primes_in_range)
     return p1, p2
@@ -59,72 +74,243 @@ def compute_d(e_value, t):
     return x % t
 
 
-def encrypt(before_path, after_path, prime1, prime2):
+class RSAKey:
+    """
+    The RSA key material derived once from the two prime numbers stored in the Database.
+    Besides n, e and d, we keep the Chinese Remainder Theorem components (d mod p-1, d mod q-1, q^-1 mod p), so that every character is transformed using three-argument pow on numbers no larger than the modulus.
+    The two codebooks memoize the transformed values, so that each distinct character is exponentiated once per key.
+    """
+
+    def __init__(self, prime1, prime2, material=None):
+        """
+        :param prime1: The first prime number generated (stored in the Database)
+        :param prime2: The second prime number generated (stored in the Database)
+        :param material: The (n, e, d, d mod p-1, d mod q-1, q^-1 mod p) touple returned by the material method, if the key was already derived (it is derived here otherwise)
+        """
+        self.prime1 = prime1
+        self.prime2 = prime2
+        self.n_value, self.totient = compute_n_and_totient(prime1, prime2)
+        if material is not None:
+            self.n_value, self.public_exponent, self.private_exponent, self.exponent1, self.exponent2, self.coefficient = material
+        else:
+            with PF.span("rsa.compute_e"):
+                self.public_exponent = compute_e(self.totient)
+            with PF.span("rsa.compute_d"):
+                self.private_exponent = compute_d(self.public_exponent, self.totient)
+            self.exponent1 = self.private_exponent % (prime1 - 1)
+            self.exponent2 = self.private_exponent % (prime2 - 1)
+            self.coefficient = compute_d(prime2, prime1)
+        self.encryption_codebook = EncryptionConstants.Codebook(self.encrypt_value)
+        self.decryption_codebook = EncryptionConstants.Codebook(self.decrypt_value)
+
+    def material(self):
+        """
+        :return: The derived values of the key, as a (n, e, d, d mod p-1, d mod q-1, q^-1 mod p) touple, so that it can be stored and built again without being derived
+        """
+        return (self.n_value, self.public_exponent, self.private_exponent, self.exponent1, self.exponent2,
+                self.coefficient)
+
+    def encrypt_value(self, value):
+        """
+        Computes (value ** e) mod n
+        :param value: The number to be encrypted, smaller than n
+        :return: The encrypted number
+        """
+        return pow(value, self.public_exponent, self.n_value)
+
+    def decrypt_value(self, value):
+        """
+        Computes (value ** d) mod n by exponentiating modulo each prime and recombining the two halves (Garner's formula).
+        :param value: The number to be decrypted, smaller than n
+        :return: The decrypted number
+        """
+        half1 = pow(value, self.exponent1, self.prime1)
+        half2 = pow(value, self.exponent2, self.prime2)
+        h_value = (self.coefficient * (half1 - half2)) % self.prime1
+        return half2 + h_value * self.prime2
+
+
+def compute_block_width(n_value):
+    """
+    This function computes how many plaintext bytes can be packed into a single RSA block, the packed number having to stay below n
+    :param n_value: The RSA modulus
+    :return: The number of bytes per block
+    """
+    return max(1, (n_value.bit_length() - 1) // 8)
+
+
+def encrypt_blocks(key, plaintext, block_width):
+    """
+    Packs every block_width bytes of the plaintext into a (big-endian) number and encrypts it. The last block is padded with zero bytes.
+    :param key: The RSA key material
+    :param plaintext: The bytes to be encrypted
+    :param block_width: The number of bytes per block
+    :return: The list of encrypted blocks
+    """
+    if block_width == 1:
+        return [key.encryption_codebook[byte] for byte in plaintext]
+    return [key.encrypt_value(int.from_bytes(plaintext[index:index + block_width].ljust(block_width, b"\0"), "big"))
+            for index in range(0, len(plaintext), block_width)]
+
+
+def decrypt_blocks(key, encoded_numbers, block_width):
+    """
+    Decrypts every block and unpacks it back into block_width bytes. The padding of the last block is kept, and needs to be dropped by the caller.
+    :param key: The RSA key material
+    :param encoded_numbers: The encrypted blocks
+    :param block_width: The number of bytes per block
+    :return: The decrypted bytes
+    """
+    if block_width == 1:
+        return bytes(key.decryption_codebook[number] for number in encoded_numbers)
+    return b"".join(key.decrypt_value(number).to_bytes(block_width, "big") for number in encoded_numbers)
+
+
+def encrypt_chunks(key, chunks, block_width, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Encrypts the plaintext one chunk at a time. Every chunk, except the last one, needs to hold a whole number of blocks.
+    :param key: The RSA key material
+    :param chunks: An iterable of plaintext chunks
+    :param block_width: The number of bytes per block
+    :param workers: The number of processes encrypting chunks in parallel
+    :return: An iterator of (plaintext chunk, encrypted blocks of that chunk) touples, in order
+    """
+    plaintext_chunks, submitted_chunks = itertools.tee(chunks)
+    encrypt_chunk = functools.partial(encrypt_blocks, key, block_width=block_width)
+    return zip(plaintext_chunks, EncryptionConstants.parallel_map(encrypt_chunk, submitted_chunks, workers))
+
+
+def decrypt_chunks(key, number_chunks, block_width, length, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Decrypts the encrypted blocks one chunk at a time, dropping the padding of the last block
+    :param key: The RSA key material
+    :param number_chunks: An iterable of sequences of encrypted blocks
+    :param block_width: The number of bytes per block
+    :param length: The length of the original plaintext, in bytes
+    :param workers: The number of processes decrypting chunks in parallel
+    :return: A generator of decrypted chunks of bytes, in order
+    """
+    remaining = length
+    decrypt_chunk = functools.partial(decrypt_blocks, key, block_width=block_width)
+    for plaintext in EncryptionConstants.parallel_map(decrypt_chunk, number_chunks, workers):
+        plaintext = plaintext[:remaining]
+        remaining -= len(plaintext)
+        yield plaintext
+
+
+def decrypt_container(key, before_path, after_path, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Decrypts an encrypted file written in the binary container layout, checking the result against the container checksum
+    :param key: The RSA key material
+    :param before_path: Path of the encrypted file
+    :param after_path: Path of the decrypted file, or a writable binary file object
+    :param workers: The number of processes decrypting chunks in parallel
+    :returns: True if the decryption went good, False otherwise
+    """
+    with open(before_path, "rb") as file:
+        header = PM.read_container_header(file)
+        if header.algorithm != PM.ALGORITHM_RSA:
+            PM.LOGGER.error("[RSA] Encrypted file was not encrypted with RSA!")
+            return False
+        number_chunks = PM.log_chunks(PF.timed_chunks(PM.read_container_chunks(file, header, PM.CHUNK_SIZE // header.block_width), "io.read"),
+                                      "[RSA DECRYPTION] Ciphertext chunk is %s")
+        decrypted_chunks = PF.timed_chunks(decrypt_chunks(key, number_chunks, header.block_width, header.length, workers),
+                                           "rsa.decrypt_chunks")
+        length, checksum = PM.write_chunks(after_path,
+                                           PM.log_chunks(decrypted_chunks, "[RSA DECRYPTION] Plaintext chunk is %r"))
+    if not PM.verify_checksum(length, checksum, header):
+        PM.remove_output(after_path)
+        return False
+    return True
+
+
+def decrypt_text(key, before_path, after_path, workers=EncryptionConstants.DEFAULT_WORKERS):
+    """
+    Decrypts an encrypted file written in one of the older, newline-separated decimal layouts: either block-packed, with a '#RSA-BLOCK' header line, or with one number per character
+    :param key: The RSA key material
+    :param before_path: Path of the encrypted file
+    :param after_path: Path of the decrypted file, or a writable binary file object
+    :param workers: The number of processes decrypting block-packed chunks in parallel
+    :returns: True if the decryption went good, False otherwise
+    """
+    with open(before_path, "r") as file:
+        first_line = file.readline()
+        if first_line.startswith(BLOCK_HEADER):
+            block_width, length = (int(value) for value in first_line.split()[1:])
+            number_chunks = PM.read_text_numbers(file, PM.CHUNK_SIZE // block_width)
+            PM.write_chunks(after_path, decrypt_chunks(key, number_chunks, block_width, length, workers))
+            return True
+        lines = itertools.chain([first_line], file) if first_line else file
+        with PM.open_output(after_path, True) as output_file:
+            for encoded_numbers in PM.read_text_numbers(lines, PM.CHUNK_SIZE):
+                output_file.write("".join(chr(key.decryption_codebook[chval]) for chval in encoded_numbers))
+    return True
+
+
+def encrypt(before_path, after_path, prime1, prime2, workers=EncryptionConstants.DEFAULT_WORKERS, key=None):
     """
     RSA encryption is ((message)**e) mod n.
-    Thus, we will encrypt the plaintext by encrypting each character's ASCII value.
-    We will obtain a sequence of numbers which we will then turn back to characters and write the result in a separate file.
+    Thus, we will encrypt the plaintext by packing as many bytes as fit below n into a block and encrypting each block, single-byte blocks being exponentiated only once per distinct value thanks to the key's codebook.
+    The file is read, encrypted and written one chunk at a time, using the binary container layout from ParsingMethods, so the memory used does not depend on the file size.
+    If RSA_BLOCK_MODE is disabled, each character's ASCII value is encrypted separately instead, and the numbers are written one per line.
     :param before_path: Path of the original file, the cached version from the Files/ folder
     :param after_path: Path of the encrypted file, from the Files/Encrypted/ folder, where we will store the encrypted version of the file - with '_encrypted' added to the end of the original file name
     :param prime1: The first prime number generated (stored in the Database)
     :param prime2: The second prime number generated (stored in the Database)
+    :param workers: The number of processes encrypting chunks in parallel
+    :param key: The RSA key material of the two prime numbers, if it was already derived (it is derived here otherwise)
     """
-    n_value, totient = compute_n_and_totient(prime1, prime2)
-    public_exponent = compute_e(totient)
-    print(
-        f"{PM.ConsoleColors.INFO}[RSA ENCRYPTION] The public key is ({str(public_exponent)},{str(n_value)}){PM.ConsoleColors.ENDCHAR}")
-    file = open(before_path, "r")
-    plaintext = file.read()
-    print(f"{PM.ConsoleColors.INFO}[RSA ENCRYPTION] Plaintext is '{plaintext}'{PM.ConsoleColors.ENDCHAR}")
-    ascii_characters = [ord(ch) for ch in plaintext]
-    encoded_numbers = [((chval ** public_exponent) % n_value) for chval in ascii_characters]
-    ciphertext = ""
-    for x in encoded_numbers:
-        ciphertext += str(x)
-    print(f"{PM.ConsoleColors.INFO}[RSA ENCRYPTION] Ciphertext is '{ciphertext}'{PM.ConsoleColors.ENDCHAR}")
-
-    with open(after_path, "w") as output_file:
-        output_file.write('\n'.join(str(number) for number in encoded_numbers))
+    if key is None:
+        key = RSAKey(prime1, prime2)
+    PM.LOGGER.info("[RSA ENCRYPTION] The public key is (%s,%s)", key.public_exponent, key.n_value)
+    if EncryptionConstants.RSA_BLOCK_MODE:
+        block_width = compute_block_width(key.n_value)
+        chunks = PF.timed_chunks(PM.read_chunks(before_path, PM.CHUNK_SIZE - PM.CHUNK_SIZE % block_width), "io.read")
+        encoded_chunks = PM.log_chunks(PF.timed_chunks(encrypt_chunks(key, chunks, block_width, workers), "rsa.encrypt_chunks"),
+                                       "[RSA ENCRYPTION] Plaintext chunk %r is encrypted as %s")
+        PM.write_container(after_path, PM.ALGORITHM_RSA, block_width, PM.compute_int_width(key.n_value - 1),
+                           encoded_chunks)
+    else:
+        chunks = PM.read_chunks(before_path, PM.CHUNK_SIZE, "r")
+        PM.write_text_numbers(after_path, ([key.encryption_codebook[ord(ch)] for ch in chunk] for chunk in chunks))
+    PM.LOGGER.info("[RSA ENCRYPTION] Encrypted file written at '%s'", after_path)
 
 
-def decrypt(before_path, after_path, prime1, prime2):
+def decrypt(before_path, after_path, prime1, prime2, workers=EncryptionConstants.DEFAULT_WORKERS, key=None):
     """
     RSA decryption is ((cipher_message)**d) mod n.
-    Thus, we will decrypt the ciphertext by decrypting each character's ASCII value. We will obtain a sequence of numbers which we will then turn back to characters and write the result in a separate file.
+    Thus, we will decrypt the ciphertext by decrypting each block and unpacking it back into bytes, the container header (or the header line of the older text layout) telling us the block width and the plaintext length.
+    The file is read, decrypted and written one chunk at a time. Files written with one number per character are decrypted character by character, each distinct value being exponentiated only once thanks to the key's codebook.
     :param before_path: Path of the encrypted file, from the Files/Encrypted/ folder, where we have stored the encrypted version of the file - with '_encrypted' added to the end of the original file name
-    :param after_path: Path of the decrypted file, which will overwrite the cached version from the Files/ folder
+    :param after_path: Path of the decrypted file, which will overwrite the cached version from the Files/ folder, or a writable binary file object (such as sys.stdout.buffer) the decrypted bytes are streamed to
     :param prime1: The first prime number generated (stored in the Database)
     :param prime2: The second prime number generated (stored in the Database)
+    :param workers: The number of processes decrypting chunks in parallel
+    :param key: The RSA key material of the two prime numbers, if it was already derived (it is derived here otherwise)
     :returns: True if the decryption went good, False otherwise
     """
     if not os.path.exists(before_path):
-        print(f"{PM.ConsoleColors.ERROR}[RSA] Encrypted file does not exist!{PM.ConsoleColors.ENDCHAR}")
+        PM.LOGGER.error("[RSA] Encrypted file does not exist!")
         return False
-    if not os.path.exists(after_path):
-        print(
-            f"{PM.ConsoleColors.WARNING}[RSA] The file was deleted from the cache folder! It will now be restored!{PM.ConsoleColors.ENDCHAR}")
-    else:
-        os.remove(after_path)
-    n_value, totient = compute_n_and_totient(prime1, prime2)
-    e = compute_e(totient)
-    private_exponent = compute_d(e, totient)
-    print(
-        f"{PM.ConsoleColors.INFO}[RSA DECRYPTION] The private key is ({str(private_exponent)},{str(n_value)}){PM.ConsoleColors.ENDCHAR}")
-    encoded_numbers = []
-    file = open(before_path, "r")
-    for line in file:
-        encoded_numbers.append(int(line.strip('\n')))
-    ciphertext = ""
-    for x in encoded_numbers:
-        ciphertext += str(x)
-    print(f"{PM.ConsoleColors.INFO}[RSA DECRYPTION] Ciphertext is '{ciphertext}'{PM.ConsoleColors.ENDCHAR}")
-    decoded_characters = [chr((chval ** private_exponent) % n_value) for chval in encoded_numbers]
-    plaintext = ""
-    for x in decoded_characters:
-        plaintext += x
-    print(f"{PM.ConsoleColors.INFO}[RSA DECRYPTION] Plaintext is '{plaintext}'{PM.ConsoleColors.ENDCHAR}")
-
-    with open(after_path, "w") as output_file:
-        output_file.write(plaintext)
-
-    return True
+    if PM.is_path(after_path):
+        if not os.path.exists(after_path):
+            PM.LOGGER.warning(
+                "[RSA] The file was deleted from the cache folder! It will now be restored!")
+        else:
+            os.remove(after_path)
+    if key is None:
+        key = RSAKey(prime1, prime2)
+    PM.LOGGER.debug("[RSA DECRYPTION] The private key is (%s,%s)", key.private_exponent, key.n_value)
+    try:
+        if PM.is_container(before_path):
+            is_decrypted = decrypt_container(key, before_path, after_path, workers)
+        else:
+            is_decrypted = decrypt_text(key, before_path, after_path, workers)
+    except (ValueError, OverflowError):
+        PM.LOGGER.error(
+            "[RSA] The encrypted file does not match the stored key!")
+        PM.remove_output(after_path)
+        return False
+    if is_decrypted and PM.is_path(after_path):
+        PM.LOGGER.info("[RSA DECRYPTION] Decrypted file written at '%s'", after_path)
+    return is_decrypted
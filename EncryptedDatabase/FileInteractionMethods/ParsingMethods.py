@@ -1,7 +1,37 @@
+import array
+import collections
+import contextlib
+import io
+import json
+import itertools
+import logging
+import mmap
 import os
+import struct
+import sys
+import zlib
 
 SIMPLE_FILES_PATH = "Files/"
 ENCRYPTED_FILES_PATH = "Files/Encrypted/"
+# The binary layout of the encrypted files: a header (magic, version, algorithm, block width, integer width, plaintext length, plaintext CRC32) followed by fixed-width little-endian integers
+CONTAINER_MAGIC = b"EDBC"
+CONTAINER_VERSION = 1
+CONTAINER_HEADER = struct.Struct("<4sBBHHQI")
+ALGORITHM_RSA = 1
+ALGORITHM_DH = 2
+# The array typecodes used in order to pack / unpack integers of a given width (in bytes) in a single call
+ARRAY_TYPECODES = {array.array(typecode).itemsize: typecode for typecode in "QLIHB"}
+# The files are encrypted / decrypted in chunks of (about) this many bytes, so that the memory used does not depend on the file size
+CHUNK_SIZE = 64 * 1024
+# The bounds and average size of the content-defined chunks, whose hashes let 'update' re-encrypt only the chunks of a file that changed.
+# A chunk ends after a line whose CRC32 falls below a threshold proportional to its length, so that the boundaries only depend on the nearby content.
+MIN_CHUNK_SIZE = 16 * 1024
+AVERAGE_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+CHUNK_BOUNDARY_FACTOR = 2 ** 32 // (AVERAGE_CHUNK_SIZE - MIN_CHUNK_SIZE)
+
+ContainerHeader = collections.namedtuple("ContainerHeader",
+                                         ["algorithm", "block_width", "int_width", "length", "checksum"])
 
 
 class ConsoleColors:
@@ -16,6 +46,102 @@ class ConsoleColors:
     ENDCHAR = '\033[0m'
 
 
+# Log level between INFO and WARNING, for operations that completed successfully
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+# Names accepted when choosing the log level, 'quiet' only letting warnings and errors through
+LOG_LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "quiet": logging.WARNING, "error": logging.ERROR}
+
+
+class ApplicationLogger(logging.Logger):
+    """
+    The logger used by the whole application, with an extra 'success' method. It also counts the errors logged, so that the one-shot commands can report a failure exit status.
+    Messages should be given in the %-style with separate arguments, so that they are only formatted if they are actually logged.
+    """
+
+    def __init__(self, name, level=logging.NOTSET):
+        super().__init__(name, level)
+        self.error_count = 0
+
+    def handle(self, record):
+        if record.levelno >= logging.ERROR:
+            self.error_count += 1
+        super().handle(record)
+
+    def success(self, message, *args, **kwargs):
+        if self.isEnabledFor(SUCCESS):
+            self._log(SUCCESS, message, args, **kwargs)
+
+
+class ColoredFormatter(logging.Formatter):
+    """
+    Formats the log records as a single line, colored by level.
+    """
+    LEVEL_COLORS = {logging.DEBUG: ConsoleColors.METADATA, logging.INFO: ConsoleColors.INFO,
+                    SUCCESS: ConsoleColors.SUCCESS, logging.WARNING: ConsoleColors.WARNING,
+                    logging.ERROR: ConsoleColors.ERROR}
+
+    def format(self, record):
+        return f"{self.LEVEL_COLORS.get(record.levelno, ConsoleColors.ERROR)}{super().format(record)}{ConsoleColors.ENDCHAR}"
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats the log records as JSON lines, so that they can be parsed by other tools.
+    """
+
+    def format(self, record):
+        return json.dumps({"time": record.created, "level": record.levelname, "message": record.getMessage()})
+
+
+# Registered through the logging manager, so that changing the level also resets the cached level checks
+logging.setLoggerClass(ApplicationLogger)
+LOGGER = logging.getLogger("EncryptedDatabase")
+logging.setLoggerClass(logging.Logger)
+LOGGER.propagate = False
+
+
+def configure_logging(level=logging.INFO, structured=False):
+    """
+    Chooses the level and format of the application logs, which are written to stderr
+    :param level: The lowest level that is logged
+    :param structured: True for JSON lines, False for colored text
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(StructuredFormatter() if structured else ColoredFormatter())
+    LOGGER.handlers = [handler]
+    LOGGER.setLevel(level)
+
+
+def display(message):
+    """
+    Writes the output of a command (not a log message) to stdout, so that it is shown whatever the log level is
+    :param message: The text to be displayed
+    """
+    print(f"{ConsoleColors.METADATA}{message}{ConsoleColors.ENDCHAR}")
+
+
+def log_chunks(chunks, message):
+    """
+    Logs every chunk at DEBUG level as it passes through a streaming pipeline.
+    When DEBUG is disabled, the chunks are returned untouched, so no text is built for the logs at all.
+    :param chunks: An iterable of chunks (or of touples, whose items are passed as separate message arguments)
+    :param message: The %-style message the chunk is logged with
+    :return: An iterable of the same chunks
+    """
+    if not LOGGER.isEnabledFor(logging.DEBUG):
+        return chunks
+    return _logged_chunks(chunks, message)
+
+
+def _logged_chunks(chunks, message):
+    for chunk in chunks:
+        arguments = chunk if isinstance(chunk, tuple) else (chunk,)
+        LOGGER.debug(message, *(argument.tolist() if isinstance(argument, memoryview) else argument
+                                for argument in arguments))
+        yield chunk
+
+
 def extract_file_metadata(path):
     """
     Given the path of a (decrypted) file, returns its size, time of last access, time of last modification and time of creation.
@@ -37,10 +163,400 @@ def verify_file(file_name, is_simple):
         raise Exception("[SYSTEM] Invalid default file directories ERROR!")
     if is_simple:
         if not os.path.isfile((os.path.join(SIMPLE_FILES_PATH, file_name)).replace("\\", "/")):
-            print(f"{ConsoleColors.ERROR}[SYSTEM] Invalid simple file path ERROR!{ConsoleColors.ENDCHAR}")
+            LOGGER.error("[SYSTEM] Invalid simple file path ERROR!")
             return False
     else:
         if not os.path.isfile((os.path.join(ENCRYPTED_FILES_PATH, file_name)).replace("\\", "/")):
-            print(f"{ConsoleColors.ERROR}[SYSTEM] Invalid encrypted file path ERROR!{ConsoleColors.ENDCHAR}")
+            LOGGER.error("[SYSTEM] Invalid encrypted file path ERROR!")
             return False
     return True
+
+
+def compute_int_width(max_value):
+    """
+    Computes how many bytes are needed in order to store any number up to the given value
+    :param max_value: The largest number that will be stored
+    :return: The width of the stored integers, in bytes
+    """
+    return max(1, (max_value.bit_length() + 7) // 8)
+
+
+def pack_numbers(numbers, int_width):
+    """
+    Packs the numbers as fixed-width little-endian integers. Numbers given as bytes are considered already packed.
+    :param numbers: The numbers to be packed
+    :param int_width: The width of every integer, in bytes
+    :return: The packed bytes
+    """
+    if isinstance(numbers, bytes):
+        return numbers
+    if int_width in ARRAY_TYPECODES:
+        packed = array.array(ARRAY_TYPECODES[int_width], numbers)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        return packed.tobytes()
+    return b"".join(number.to_bytes(int_width, "little") for number in numbers)
+
+
+def unpack_numbers(payload, int_width):
+    """
+    Unpacks fixed-width little-endian integers. On little-endian machines, the standard widths are read without copying the payload.
+    :param payload: The packed bytes (or a memoryview over them)
+    :param int_width: The width of every integer, in bytes
+    :return: A sequence of the unpacked numbers
+    """
+    if int_width in ARRAY_TYPECODES:
+        if sys.byteorder == "little":
+            return memoryview(payload).cast(ARRAY_TYPECODES[int_width])
+        numbers = array.array(ARRAY_TYPECODES[int_width])
+        numbers.frombytes(payload)
+        numbers.byteswap()
+        return numbers
+    view = memoryview(payload)
+    return [int.from_bytes(view[index:index + int_width], "little") for index in range(0, len(view), int_width)]
+
+
+def is_container(path):
+    """
+    Checks if the encrypted file at the given path uses the binary layout, or the older newline-separated text layout
+    :param path: Path of the encrypted file
+    :return: True if the file starts with the container magic, False otherwise
+    """
+    with open(path, "rb") as file:
+        return file.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC
+
+
+def read_chunks(path, chunk_size, mode="rb"):
+    """
+    Reads the file at the given path in fixed-size chunks, so that files larger than the memory can be processed
+    :param path: Path of the file to be read
+    :param chunk_size: The size of every chunk (except the last one), in bytes - or characters, for text mode
+    :param mode: "rb" for bytes, "r" for text
+    :return: A generator of the file chunks
+    """
+    with open(path, mode) as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def is_path(output):
+    """
+    Checks if a decryption output is a path, rather than a file object
+    :param output: A path, or a writable binary file object
+    :return: True if the output is a path, False otherwise
+    """
+    return isinstance(output, (str, bytes, os.PathLike))
+
+
+@contextlib.contextmanager
+def open_output(output, text=False):
+    """
+    Opens a decryption output for writing. Paths are opened (and closed afterwards), while file objects (such as sys.stdout.buffer or an io.BytesIO) are written as they are and left open.
+    :param output: A path, or a writable binary file object
+    :param text: True if text is written (the way a file opened with the "w" mode is written), False if bytes are written
+    :return: The opened file
+    """
+    if is_path(output):
+        with open(output, "w" if text else "wb") as file:
+            yield file
+    elif text:
+        text_file = io.TextIOWrapper(output, write_through=True)
+        try:
+            yield text_file
+        finally:
+            text_file.detach()
+    else:
+        yield output
+
+
+def remove_output(output):
+    """
+    Removes a (partially written) decryption output, if it is a file. Bytes already written to a file object cannot be taken back.
+    :param output: A path, or a writable binary file object
+    """
+    if is_path(output) and os.path.exists(output):
+        os.remove(output)
+
+
+class PreallocatedOutput(io.RawIOBase):
+    """
+    A writable binary file object filling a bytearray allocated upfront with the expected length of the content, so that a file decrypted in memory
+    is copied once into its final buffer, instead of growing (and copying) a buffer as io.BytesIO does. More bytes than expected can still be written.
+    """
+
+    def __init__(self, size):
+        """
+        :param size: The expected length of the content, in bytes
+        """
+        super().__init__()
+        self.buffer = bytearray(size)
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        """
+        :param data: A bytes-like object
+        :return: The number of bytes written
+        """
+        end = self.position + len(data)
+        self.buffer[self.position:end] = data
+        self.position = end
+        return len(data)
+
+    def getvalue(self):
+        """
+        :return: The written bytes, as the bytearray itself (trimmed to them, without copying it)
+        """
+        del self.buffer[self.position:]
+        return self.buffer
+
+
+def write_chunks(path, chunks):
+    """
+    Writes the given chunks of bytes one after the other, as they are produced
+    :param path: Path of the file to be written, or a writable binary file object
+    :param chunks: An iterable of bytes
+    :return: A touple of the total length (in bytes) and the CRC32 of the written bytes
+    """
+    length = 0
+    checksum = 0
+    with open_output(path) as file:
+        for chunk in chunks:
+            file.write(chunk)
+            length += len(chunk)
+            checksum = zlib.crc32(chunk, checksum)
+    return length, checksum
+
+
+def hash_file(path):
+    """
+    Computes the SHA-256 digest of a file, reading it one chunk at a time
+    :param path: Path of the file
+    :return: The hexadecimal digest
+    """
+    # hashlib is only imported once a file is hashed, so that the commands start faster
+    import hashlib
+    digest = hashlib.sha256()
+    for chunk in read_chunks(path, CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_and_hash(source_path, destination_path):
+    """
+    Copies a file (along with its access and modification times, like shutil.copy2), computing the SHA-256 digest of its content while it streams through
+    :param source_path: Path of the copied file
+    :param destination_path: Path of the copy
+    :return: The hexadecimal digest
+    """
+    import hashlib
+    import shutil
+    digest = hashlib.sha256()
+    with open(destination_path, "wb") as file:
+        for chunk in read_chunks(source_path, CHUNK_SIZE):
+            digest.update(chunk)
+            file.write(chunk)
+    shutil.copystat(source_path, destination_path)
+    return digest.hexdigest()
+
+
+def find_chunk_boundary(buffer, alignment=1):
+    """
+    Finds where the first content-defined chunk of the buffer ends: after the first line (ending past MIN_CHUNK_SIZE) whose CRC32 falls below the threshold, or at MAX_CHUNK_SIZE if there is no such line.
+    Lines are hashed with zlib, so that the whole file is not walked byte by byte in Python.
+    :param buffer: The bytes following the previous boundary, more than MAX_CHUNK_SIZE of them unless they are the end of the file
+    :param alignment: The chunks (except the last one) hold a whole number of alignment bytes, so that the encrypted blocks do not straddle two chunks
+    :return: The length of the chunk
+    """
+    end = min(len(buffer), MAX_CHUNK_SIZE)
+    line_start = buffer.rfind(b"\n", 0, MIN_CHUNK_SIZE) + 1
+    while True:
+        line_end = buffer.find(b"\n", line_start, end) + 1
+        if not line_end:
+            break
+        if zlib.crc32(buffer[line_start:line_end]) < (line_end - line_start) * CHUNK_BOUNDARY_FACTOR:
+            end = min(line_end + (-line_end) % alignment, end)
+            break
+        line_start = line_end
+    if end == MAX_CHUNK_SIZE and len(buffer) > end:
+        end -= end % alignment
+    return end
+
+
+def content_defined_chunks(path, alignment=1):
+    """
+    Reads the file at the given path in content-defined chunks (see find_chunk_boundary), so that an edit only changes the chunks around it, while the others keep their boundaries and hashes
+    :param path: Path of the file to be read
+    :param alignment: The chunks (except the last one) hold a whole number of alignment bytes
+    :return: A generator of the file chunks
+    """
+    with open(path, "rb") as file:
+        buffer = file.read(2 * MAX_CHUNK_SIZE)
+        while buffer:
+            if len(buffer) <= MAX_CHUNK_SIZE:
+                buffer += file.read(MAX_CHUNK_SIZE)
+            length = find_chunk_boundary(buffer, alignment)
+            yield buffer[:length]
+            buffer = buffer[length:]
+
+
+def write_container(path, algorithm, block_width, int_width, encoded_chunks):
+    """
+    Writes the encrypted numbers in the binary layout, one chunk at a time.
+    Since the plaintext length and checksum are only known at the end, the header is written last, over a placeholder.
+    :param path: Path of the encrypted file
+    :param algorithm: ALGORITHM_RSA or ALGORITHM_DH
+    :param block_width: How many plaintext bytes every number holds
+    :param int_width: The width of every stored number, in bytes
+    :param encoded_chunks: An iterable of (plaintext chunk, encrypted numbers of that chunk) touples
+    :return: The length of the plaintext, in bytes
+    """
+    length = 0
+    checksum = 0
+    with open(path, "wb") as file:
+        file.write(bytes(CONTAINER_HEADER.size))
+        for plaintext_chunk, encoded_numbers in encoded_chunks:
+            length += len(plaintext_chunk)
+            checksum = zlib.crc32(plaintext_chunk, checksum)
+            file.write(pack_numbers(encoded_numbers, int_width))
+        file.seek(0)
+        file.write(CONTAINER_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, algorithm, block_width, int_width, length,
+                                         checksum))
+    return length
+
+
+def write_patched_container(old_path, path, offset, payloads, length, checksum):
+    """
+    Writes a new encrypted file in the binary layout, made of the beginning of an existing one (up to the offset) followed by the payloads. The existing file is only read,
+    so that it stays intact if the new one cannot be written completely.
+    :param old_path: Path of the existing encrypted file, whose algorithm and widths are kept
+    :param path: Path of the new encrypted file
+    :param offset: How many bytes (past the header) are copied from the existing file
+    :param payloads: An iterable of packed encrypted numbers, written after the copied bytes
+    :param length: The length of the new plaintext, in bytes
+    :param checksum: The CRC32 of the new plaintext
+    """
+    with open(old_path, "rb") as old_file, open(path, "wb") as file:
+        header = read_container_header(old_file)
+        file.write(CONTAINER_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, header.algorithm, header.block_width,
+                                         header.int_width, length, checksum))
+        remaining = offset - CONTAINER_HEADER.size
+        while remaining > 0:
+            chunk = old_file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ValueError(f"The encrypted file '{old_path}' is shorter than its manifest!")
+            file.write(chunk)
+            remaining -= len(chunk)
+        for payload in payloads:
+            file.write(payload)
+
+
+def read_container_header(file):
+    """
+    Reads the header of an encrypted file written in the binary layout
+    :param file: The encrypted file, opened in binary mode and positioned at its beginning
+    :return: The container header
+    We raise a ValueError if the header is truncated, or if the file is not a container we know how to read
+    """
+    header = file.read(CONTAINER_HEADER.size)
+    if len(header) != CONTAINER_HEADER.size:
+        raise ValueError("[SYSTEM] Truncated encrypted file header ERROR!")
+    magic, version, algorithm, block_width, int_width, length, checksum = CONTAINER_HEADER.unpack(header)
+    if magic != CONTAINER_MAGIC or version != CONTAINER_VERSION:
+        raise ValueError("[SYSTEM] Unsupported encrypted file format ERROR!")
+    return ContainerHeader(algorithm, block_width, int_width, length, checksum)
+
+
+def read_container_chunks(file, header, numbers_per_chunk, raw=False):
+    """
+    Reads the encrypted numbers following the container header, one chunk at a time.
+    The file is memory-mapped and every chunk is a memoryview over the mapping, so the numbers are decoded straight from the page cache, without copying them into intermediate bytes objects.
+    Files that cannot be mapped are read chunk by chunk instead.
+    :param file: The encrypted file, positioned right after the header
+    :param header: The container header
+    :param numbers_per_chunk: How many numbers every chunk holds (except the last one)
+    :param raw: True if the packed bytes should be returned as they are read, without unpacking them
+    :return: A generator of sequences of encrypted numbers (or of packed bytes, if raw is True)
+    We raise a ValueError if the file ends in the middle of a number
+    """
+    chunk_size = numbers_per_chunk * header.int_width
+    try:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        while True:
+            payload = file.read(chunk_size)
+            if not payload:
+                return
+            if len(payload) % header.int_width:
+                raise ValueError("[SYSTEM] Truncated encrypted file ERROR!")
+            yield payload if raw else unpack_numbers(payload, header.int_width)
+    if (len(mapped) - file.tell()) % header.int_width:
+        mapped.close()
+        raise ValueError("[SYSTEM] Truncated encrypted file ERROR!")
+    view = memoryview(mapped)
+    payload = None
+    try:
+        for offset in range(file.tell(), len(mapped), chunk_size):
+            payload = view[offset:offset + chunk_size]
+            yield payload if raw else unpack_numbers(payload, header.int_width)
+    finally:
+        # The last chunk is no longer referenced by the generator, so that the mapping can be closed once the consumer dropped it too
+        payload = None
+        view.release()
+        try:
+            mapped.close()
+        except BufferError as err:
+            # A chunk is still referenced by the consumer: the mapping is closed once that chunk is garbage collected
+            LOGGER.warning("[SYSTEM] The mapping of '%s' could not be closed yet: %s", file.name, err)
+
+
+def write_text_numbers(path, number_chunks):
+    """
+    Writes the encrypted numbers in the older text layout, one per line, one chunk at a time
+    :param path: Path of the encrypted file
+    :param number_chunks: An iterable of lists of encrypted numbers
+    """
+    with open(path, "w") as file:
+        separator = ""
+        for numbers in number_chunks:
+            if numbers:
+                file.write(separator + '\n'.join(str(number) for number in numbers))
+                separator = '\n'
+
+
+def read_text_numbers(file, numbers_per_chunk):
+    """
+    Reads the encrypted numbers of the older text layout (one per line), one chunk at a time
+    :param file: The encrypted file, opened in text mode (or any iterable of its lines)
+    :param numbers_per_chunk: How many numbers every chunk holds (except the last one)
+    :return: A generator of lists of encrypted numbers
+    """
+    # int() ignores the trailing newline, so every chunk of lines is parsed by map without building a stripped copy of each line
+    lines = iter(file)
+    while True:
+        numbers = list(map(int, itertools.islice(lines, numbers_per_chunk)))
+        if not numbers:
+            return
+        yield numbers
+
+
+def verify_checksum(length, checksum, header):
+    """
+    Verifies that the decrypted bytes match the length and checksum stored in the container header
+    :param length: The length of the decrypted bytes
+    :param checksum: The CRC32 of the decrypted bytes
+    :param header: The container header
+    :return: True if the decrypted bytes are the original ones, False otherwise
+    """
+    if length != header.length or checksum != header.checksum:
+        LOGGER.error("[SYSTEM] Decrypted file does not match its checksum!")
+        return False
+    return True
+
+
+configure_logging()
@@ -0,0 +1,189 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+from FileInteractionMethods import ParsingMethods as PM
+
+# The timing spans are only recorded while the instrumentation is enabled ('stats on', '--stats' or '--profile'), so that otherwise the hot paths only check this flag
+ENABLED = False
+# Spans recorded in the worker processes (with '--workers' above 1) stay in those processes, so only the spans of the main process are aggregated
+_span_stats = {}
+# The Chrome trace events ('X' complete events) recorded while an operation is profiled into a .json file, None otherwise
+_trace_events = None
+_lock = threading.Lock()
+# Returned by span while the instrumentation is disabled: a reusable context manager doing nothing
+_DISABLED_SPAN = contextlib.nullcontext()
+
+
+class Span:
+    """
+    Times the enclosed code, adding its duration to the counters of its name (and to the trace, if one is recorded).
+    """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        """
+        :param name: The name of the span, as 'operation.stage' (for example 'add.encrypt')
+        """
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+def span(name):
+    """
+    Times the enclosed stage, if the instrumentation is enabled, as in 'with PF.span("add.encrypt"):'
+    :param name: The name of the span, as 'operation.stage'
+    :return: A context manager timing the enclosed code, or doing nothing if the instrumentation is disabled
+    """
+    if not ENABLED:
+        return _DISABLED_SPAN
+    return Span(name)
+
+
+def timed(name):
+    """
+    Decorates a function, so that every call is timed as a span (if the instrumentation is enabled)
+    :param name: The name of the span, usually the name of the operation (for example 'add')
+    :return: The decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with Span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def timed_chunks(chunks, name):
+    """
+    Times the production of every chunk of a streaming pipeline (reading, encrypting, decrypting) as a span.
+    When the instrumentation is disabled, the chunks are returned untouched, so the pipeline is not slowed down at all.
+    :param chunks: An iterable of chunks
+    :param name: The name of the span
+    :return: An iterable of the same chunks
+    """
+    if not ENABLED:
+        return chunks
+    return _timed_chunks(chunks, name)
+
+
+def _timed_chunks(chunks, name):
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        record(name, start, time.perf_counter() - start)
+        yield chunk
+
+
+def record(name, start, elapsed):
+    """
+    Adds a duration to the counters of a span
+    :param name: The name of the span
+    :param start: When the span started, as returned by time.perf_counter
+    :param elapsed: The duration of the span, in seconds
+    """
+    with _lock:
+        counters = _span_stats.get(name)
+        if counters is None:
+            counters = _span_stats[name] = [0, 0.0, 0.0]
+        counters[0] += 1
+        counters[1] += elapsed
+        counters[2] = max(counters[2], elapsed)
+        if _trace_events is not None:
+            _trace_events.append({"name": name, "cat": name.split(".")[0], "ph": "X", "ts": round(start * 1e6, 3),
+                                  "dur": round(elapsed * 1e6, 3), "pid": os.getpid(), "tid": threading.get_ident()})
+
+
+def enable(is_enabled=True):
+    """
+    Enables (or disables) the recording of the timing spans
+    :param is_enabled: True if the spans should be recorded, False otherwise
+    """
+    global ENABLED
+    ENABLED = is_enabled
+
+
+def reset():
+    """
+    Clears the counters of all the spans
+    """
+    with _lock:
+        _span_stats.clear()
+
+
+def stats():
+    """
+    :return: The counters of every span, as a dictionary of {name: {"count", "total_ms", "mean_ms", "max_ms"}}, the slowest spans (in total) first
+    """
+    with _lock:
+        counters = sorted(_span_stats.items(), key=lambda item: item[1][1], reverse=True)
+    return {name: {"count": count, "total_ms": round(total * 1000, 3), "mean_ms": round(total * 1000 / count, 3),
+                   "max_ms": round(maximum * 1000, 3)}
+            for name, (count, total, maximum) in counters}
+
+
+def show_stats():
+    """
+    Displays the counters of every span, the slowest ones (in total) first
+    """
+    span_stats = stats()
+    if not span_stats:
+        PM.display(f"[STATS] No spans recorded{'' if ENABLED else ' (the instrumentation is disabled)'}!")
+    for name, counters in span_stats.items():
+        PM.display(
+            f"[STATS] {name}: {counters['count']} calls, {counters['total_ms']} ms total, {counters['mean_ms']} ms mean, {counters['max_ms']} ms max")
+
+
+@contextlib.contextmanager
+def profiled(output_path):
+    """
+    Profiles the enclosed operation, recording its timing spans as well. A path ending in '.json' receives a Chrome trace of the spans (to be opened in chrome://tracing or Perfetto),
+    while any other path receives a cProfile dump of every function called (to be opened with 'python -m pstats').
+    :param output_path: The path the trace or the profile is written at
+    """
+    global _trace_events
+    was_enabled = ENABLED
+    enable()
+    is_trace = output_path.lower().endswith(".json")
+    profiler = None
+    if is_trace:
+        _trace_events = []
+    else:
+        # cProfile is only imported when a profile is written, so that the commands start faster
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if is_trace:
+            with _lock:
+                events, _trace_events = _trace_events, None
+            with open(output_path, "w") as trace_file:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+            PM.LOGGER.success("[PROFILE] Chrome trace of %d spans written at '%s'", len(events), output_path)
+        else:
+            profiler.disable()
+            profiler.dump_stats(output_path)
+            PM.LOGGER.success("[PROFILE] cProfile dump written at '%s' (open it with 'python -m pstats')", output_path)
+        enable(was_enabled)
@@ -0,0 +1,307 @@
+import asyncio
+import base64
+import concurrent.futures
+import json
+import os
+import sqlite3
+import time
+
+from Database import DB_Cache
+from Database import DB_Functions as DB
+from Database import DB_Repository
+from FileInteractionMethods import CompressionMethods as CM
+from FileInteractionMethods import ParsingMethods as PM
+from FileInteractionMethods import ProfilingMethods as PF
+from FileInteractionMethods.EncryptionMethods import EncryptionConstants
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# The longest request line accepted from a client, in bytes
+MAX_REQUEST_SIZE = 64 * 1024
+# The numeric fields of a 'list' request, and the types they accept (SQLite would otherwise compare text with the numbers, silently matching nothing)
+LIST_NUMBER_FIELDS = {"min_size": (int,), "max_size": (int,), "created_after": (int, float),
+                      "created_before": (int, float), "after": (int,), "limit": (int,)}
+# The number of files listed by a 'list' request which does not give a limit, the next ones being listed by passing the returned "next" id as "after"
+DEFAULT_LIST_LIMIT = DB_Repository.LIST_PAGE_SIZE
+
+
+def get_text_field(request, field, default=None):
+    """
+    Returns a text field of a request, so that a field of another JSON type is rejected before it reaches the file system or the Database
+    :param request: The request, as a dictionary
+    :param field: The name of the field
+    :param default: The value returned if the field is missing (or null)
+    :return: The value of the field
+    """
+    value = request.get(field)
+    if value is None:
+        return default
+    if not isinstance(value, str):
+        raise ValueError(f"The '{field}' field must be a string!")
+    return value
+
+
+class ServiceStats:
+    """
+    The counters reported by the service: the requests being served (the queue depth), the requests served so far and their total latency.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.served = 0
+        self.failed = 0
+        self.total_latency = 0.0
+
+    def as_dict(self):
+        """
+        :return: The counters, as a dictionary
+        """
+        return {"queue_depth": self.in_flight, "served": self.served, "failed": self.failed,
+                "mean_latency_ms": round(self.total_latency * 1000 / self.served, 3) if self.served else None}
+
+
+class FileService:
+    """
+    Serves the add / read / delete / list operations of DB_Functions to many clients concurrently.
+    The Database queries (which are short) run on the event loop, while the CPU-bound encryption and decryption are offloaded to a pool of processes.
+    Every request is a JSON object on a single line (for example {"command": "add", "path": "a.txt", "alg": "dh"}), and is answered by a JSON line.
+    """
+
+    def __init__(self, workers=EncryptionConstants.DEFAULT_WORKERS):
+        self.workers = workers
+        self.executor = None
+        self.counters = ServiceStats()
+        # The names of the files being added, so that two clients cannot add the same name at once
+        self.adding = set()
+        # The blobs being encrypted, by (digest, encryption type), so that two clients adding the same content wait for a single encryption
+        self.encrypting = {}
+
+    async def add(self, request):
+        """
+        Copies the file to the Files/ folder, encrypts it in the pool and inserts its entry
+        :param request: The request, as {"path": ..., "alg": "rsa" or "dh", "codec": one of CompressionMethods.CODEC_CHOICES (optional)}
+        :return: The name of the added file, as a dictionary
+        """
+        file_path = get_text_field(request, "path", "")
+        encryption_alg = get_text_field(request, "alg", "rsa")
+        codec = get_text_field(request, "codec", CM.DEFAULT_CODEC)
+        if encryption_alg not in ("rsa", "dh"):
+            raise ValueError("Unrecognized encryption algorithm!")
+        if codec not in CM.CODEC_CHOICES:
+            raise ValueError("Unrecognized codec!")
+        if not os.path.isfile(file_path):
+            raise ValueError("Given path is not a valid one!")
+        file_name = os.path.basename(file_path)
+        if file_name in self.adding or DB.get_repository().contains(file_name):
+            raise ValueError(f"File '{file_name}' is already in DataBase!")
+        self.adding.add(file_name)
+        try:
+            file_path = (os.path.abspath(file_path)).replace("\\", "/")
+            digest = await asyncio.to_thread(DB.cache_file, file_path, file_name)
+            if digest is None:
+                raise ValueError(f"File '{file_name}' could not be copied to the Files folder!")
+            blob = await self.fetch_or_encrypt_blob(file_name, encryption_alg, digest, codec)
+            if blob is None:
+                raise ValueError(f"File '{file_name}' could not be encrypted!")
+            before_path = (os.path.join(PM.SIMPLE_FILES_PATH, file_name)).replace("\\", "/")
+            encryption_type = "RSA" if encryption_alg == "rsa" else "DH"
+            row = (file_name, encryption_type, blob[0], *PM.extract_file_metadata(before_path), digest, blob[1], blob[2],
+                   blob[3])
+            try:
+                DB.get_repository().insert_many([row])
+            except sqlite3.Error:
+                # The blob encrypted for this request is removed (as add_files does), unless another file references it meanwhile
+                if blob[2] is not None and DB.get_repository().references(digest, encryption_type) == 0:
+                    os.remove((os.path.join(PM.ENCRYPTED_FILES_PATH, DB.get_blob_file_name(digest, encryption_type))).replace("\\", "/"))
+                raise
+        finally:
+            self.adding.discard(file_name)
+        return {"name": file_name}
+
+    async def fetch_or_encrypt_blob(self, file_name, encryption_alg, digest, codec):
+        """
+        Returns the encryption parameters and codec of the blob holding the given content, encrypting the file in the pool if no such blob is stored (or being encrypted)
+        :param file_name: The name of the file, in the Files/ folder
+        :param encryption_alg: Either "rsa" or "dh"
+        :param digest: The SHA-256 digest of the file
+        :param codec: The codec the file is compressed with, if it needs to be encrypted
+        :return: The (encryption parameters, codec, key material, manifest) touple, the key material being None and the manifest empty for a stored blob, or None if the encryption failed (or its blob was removed)
+        """
+        blob = (digest, "RSA" if encryption_alg == "rsa" else "DH")
+        if blob in self.encrypting:
+            row = await asyncio.shield(self.encrypting[blob])
+            # The encrypted file is removed if the request that encrypted it failed to insert its entry
+            if row is None or not os.path.exists(os.path.join(PM.ENCRYPTED_FILES_PATH, DB.get_blob_file_name(*blob))):
+                return None
+            return row[2], row[8], None, []
+        stored = DB.get_repository().fetch_blob(*blob)
+        if stored is not None:
+            return DB.parse_params(stored[:4]), stored[4], None, []
+        self.encrypting[blob] = asyncio.get_running_loop().run_in_executor(self.executor, DB.encrypt_file,
+                                                                           (file_name, encryption_alg, digest, codec))
+        try:
+            row = await self.encrypting[blob]
+        finally:
+            del self.encrypting[blob]
+        return None if row is None else (row[2], row[8], row[9], row[10])
+
+    async def read(self, request):
+        """
+        Returns the decrypted content of the file, from the decrypted files cache of the service or decrypted in the pool (and then cached)
+        :param request: The request, as {"name": ...}
+        :return: The name, size and content (encoded as base64) of the file, as a dictionary
+        """
+        file_name = get_text_field(request, "name", "")
+        data = DB.get_repository().fetch(file_name)
+        if data is None or file_name in self.adding:
+            raise ValueError(f"File '{file_name}' is not in DataBase!")
+        content_key = DB.get_content_key(data)
+        payload = DB_Cache.CONTENT_CACHE.get(content_key)
+        if payload is None:
+            payload = await asyncio.get_running_loop().run_in_executor(self.executor, DB.decrypt_to_bytes, data)
+            if payload is None:
+                raise ValueError(f"File '{file_name}' could not be decrypted!")
+            if len(payload) <= DB_Cache.MAX_CACHED_FILE_SIZE:
+                DB_Cache.CONTENT_CACHE.put(content_key, payload, len(payload))
+        return {"name": file_name, "size": data[7], "content": base64.b64encode(payload).decode("ascii")}
+
+    async def delete(self, request):
+        """
+        Deletes the entry of the file and its encrypted version
+        :param request: The request, as {"name": ...}
+        :return: The name of the deleted file, as a dictionary
+        """
+        file_name = get_text_field(request, "name", "")
+        if file_name in self.adding or DB.get_repository().fetch(file_name) is None:
+            raise ValueError(f"File '{file_name}' is not in DataBase!")
+        await asyncio.to_thread(DB.remove_encrypted_files, DB.get_repository().delete(file_name))
+        return {"name": file_name}
+
+    async def list(self, request):
+        """
+        Lists the names of the files matching the filters, a page (of DEFAULT_LIST_LIMIT files, unless a limit is given) at a time
+        :param request: The request, as {"prefix", "alg", "min_size", "max_size", "created_after", "created_before" (POSIX timestamps), "after" (an id), "limit"}, all of them optional
+        :return: The names of the files and the id to continue after (None if no file is left), as a dictionary
+        """
+        encryption_alg = get_text_field(request, "alg")
+        if encryption_alg not in (None, "rsa", "dh"):
+            raise ValueError("Unrecognized encryption algorithm!")
+        prefix = get_text_field(request, "prefix")
+        for field, types in LIST_NUMBER_FIELDS.items():
+            value = request.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, types)):
+                raise ValueError(f"The '{field}' field must be a number!")
+        file_filter = DB_Repository.FileFilter(prefix, encryption_alg and encryption_alg.upper(),
+                                               request.get("min_size"), request.get("max_size"),
+                                               request.get("created_after"), request.get("created_before"))
+        limit = request.get("limit", DEFAULT_LIST_LIMIT)
+        rows = list(DB.get_repository().list_files(file_filter, ("name",), request.get("after", 0), limit))
+        return {"files": [file_name for _, file_name in rows], "next": rows[-1][0] if rows and len(rows) == limit else None}
+
+    async def stats(self, request):
+        """
+        Reports the counters of the service
+        :param request: The request, as {}
+        :return: The queue depth, the number of requests served (and failed), their mean latency and the timing spans (if the instrumentation is enabled), as a dictionary
+        """
+        return {**self.counters.as_dict(), "spans": PF.stats()}
+
+    async def serve_request(self, line):
+        """
+        Runs a single request, measuring its latency
+        :param line: The JSON line received from the client
+        :return: The response, as a dictionary
+        """
+        start = time.perf_counter()
+        self.counters.in_flight += 1
+        command = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("The request must be a JSON object!")
+            command = request.get("command")
+            if command not in ("add", "read", "delete", "list", "stats"):
+                raise ValueError("Unrecognized command!")
+            response = {"ok": True, **await getattr(self, command)(request)}
+        # A single bad request is answered with an error, and never closes the connection
+        except (ValueError, TypeError, KeyError, AttributeError, OSError, sqlite3.Error) as err:
+            self.counters.failed += 1
+            response = {"ok": False, "error": str(err)}
+        finally:
+            self.counters.in_flight -= 1
+        latency = time.perf_counter() - start
+        self.counters.served += 1
+        self.counters.total_latency += latency
+        response["latency_ms"] = round(latency * 1000, 3)
+        response["queue_depth"] = self.counters.in_flight
+        PM.LOGGER.info("[SERVICE] '%s' served in %.3f ms (%d requests in flight)", command, latency * 1000,
+                       self.counters.in_flight)
+        return response
+
+    async def handle_client(self, reader, writer):
+        """
+        Answers the requests of a client, one line at a time, until it disconnects
+        :param reader: The stream the requests are read from
+        :param writer: The stream the responses are written to
+        """
+        try:
+            while line := await reader.readline():
+                writer.write(json.dumps(await self.serve_request(line)).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError) as err:
+            PM.LOGGER.warning("[SERVICE] Client connection closed: %s", err)
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        """
+        Serves the clients until the task is cancelled
+        :param host: The address of the TCP socket
+        :param port: The port of the TCP socket
+        :param socket_path: The path of a UNIX socket, used instead of TCP if given
+        """
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as self.executor:
+            if socket_path is not None:
+                server = await asyncio.start_unix_server(self.handle_client, socket_path, limit=MAX_REQUEST_SIZE)
+                PM.LOGGER.success("[SERVICE] Listening on the UNIX socket '%s'!", socket_path)
+            else:
+                server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_REQUEST_SIZE)
+                PM.LOGGER.success("[SERVICE] Listening on %s:%s!", host, port)
+            async with server:
+                await server.serve_forever()
+
+
+def start(workers=EncryptionConstants.DEFAULT_WORKERS, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """
+    Runs the service until it is interrupted (Ctrl+C)
+    :param workers: The number of processes encrypting / decrypting files
+    :param host: The address of the TCP socket
+    :param port: The port of the TCP socket
+    :param socket_path: The path of a UNIX socket, used instead of TCP if given
+    """
+    try:
+        asyncio.run(FileService(workers).serve(host, port, socket_path))
+    except KeyboardInterrupt:
+        PM.LOGGER.info("[SERVICE] Interrupted! Terminating...")
+
+
+async def send_request(request, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """
+    Sends a single request to a running service, for scripts and tests
+    :param request: The request, as a dictionary
+    :param host: The address of the TCP socket
+    :param port: The port of the TCP socket
+    :param socket_path: The path of a UNIX socket, used instead of TCP if given
+    :return: The response, as a dictionary
+    """
+    if socket_path is not None:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+        await writer.wait_closed()
@@ -0,0 +1,3 @@
+"""
+This package is responsible with serving the database operations to many clients at once, over a local socket
+"""
@@ -1,6 +1,10 @@
+import sys
+
 import CommandLine.CL_Functions as CL
 
-CL.start()
+# The guard keeps the worker processes of the encryption pool from starting the Command Line again
+if __name__ == "__main__":
+    sys.exit(CL.run(sys.argv[1:]))
 """
 The start point of the program
 """
@@ -0,0 +1,67 @@
+import io
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from Database import DB_Cache
+from Database import DB_Functions as DB
+from FileInteractionMethods import ParsingMethods as PM
+
+# The folder of the application, holding the sample Database and files
+APPLICATION_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Runs every test in a temporary copy of the Files/ folders and a new Database, so that the tracked Database and files are never modified.
+    The files are encrypted and decrypted by a single process, in order to keep the tests fast.
+    """
+
+    def setUp(self):
+        self.previous_path = os.getcwd()
+        self.root_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root_path, PM.ENCRYPTED_FILES_PATH))
+        os.makedirs(os.path.join(self.root_path, "Database"))
+        os.chdir(self.root_path)
+        PM.configure_logging(logging.CRITICAL)
+        DB_Cache.KEY_CACHE.clear()
+        DB_Cache.CONTENT_CACHE.clear()
+        DB.get_repository().create_table()
+
+    def tearDown(self):
+        DB.get_repository().close()
+        os.chdir(self.previous_path)
+        shutil.rmtree(self.root_path)
+
+    def write_file(self, file_name, content):
+        """
+        Writes a file to be added to the Database, outside of the Files/ folder
+        :param file_name: The name of the file
+        :param content: The content of the file, as bytes
+        :return: The path of the file
+        """
+        path = os.path.join(self.root_path, file_name)
+        with open(path, "wb") as file:
+            file.write(content)
+        return path
+
+    def read_file(self, file_name):
+        """
+        Decrypts a file from the Database
+        :param file_name: The name of the file
+        :return: The decrypted content, or None if the file could not be decrypted
+        """
+        data = DB.get_repository().fetch(file_name)
+        output = io.BytesIO()
+        if data is None or not DB.read_content(data, output, 1):
+            return None
+        return output.getvalue()
+
+    def encrypted_path(self, file_name):
+        """
+        :param file_name: The name of a file from the Database
+        :return: The path of its encrypted file, in the Files/Encrypted/ folder
+        """
+        return os.path.join(PM.ENCRYPTED_FILES_PATH, DB.get_encrypted_file_name(DB.get_repository().fetch(file_name)))
@@ -0,0 +1,73 @@
+import io
+import os
+import unittest
+
+from Database import DB_Functions as DB
+from FileInteractionMethods import CompressionMethods as CM
+from tests import helpers
+
+# A text which compresses well, and random bytes which do not compress at all
+TEXT_CONTENT = b"".join(f"Line {index}: the same words, over and over again.\n".encode() for index in range(20000))
+RANDOM_CONTENT = os.urandom(256 * 1024)
+
+
+class CompressionTests(helpers.DatabaseTestCase):
+    """
+    Round trips of the files compressed before being encrypted, and the choice of their codec.
+    """
+
+    def test_codec_round_trip(self):
+        for encryption_alg in ("rsa", "dh"):
+            for codec in CM.CODECS:
+                with self.subTest(encryption_alg=encryption_alg, codec=codec):
+                    file_name = f"{codec}_{encryption_alg}.txt"
+                    # Every file has its own content, so that it is not stored in the blob of another one
+                    content = TEXT_CONTENT + file_name.encode()
+                    DB.add_to_database(self.write_file(file_name, content), encryption_alg, 1, codec)
+                    self.assertEqual(DB.get_repository().fetch(file_name)[12], codec)
+                    self.assertLess(os.path.getsize(self.encrypted_path(file_name)), len(content) // 4)
+                    self.assertEqual(self.read_file(file_name), content)
+
+    def test_empty_file(self):
+        for codec in CM.CODECS:
+            DB.add_to_database(self.write_file(f"empty_{codec}.txt", b""), "dh", 1, codec)
+            self.assertEqual(self.read_file(f"empty_{codec}.txt"), b"")
+
+    def test_adaptive_codec(self):
+        DB.add_to_database(self.write_file("text.txt", TEXT_CONTENT), "dh", 1, CM.CODEC_AUTO)
+        DB.add_to_database(self.write_file("random.bin", RANDOM_CONTENT), "dh", 1, CM.CODEC_AUTO)
+        self.assertIn(DB.get_repository().fetch("text.txt")[12], CM.CODECS)
+        self.assertEqual(DB.get_repository().fetch("random.bin")[12], CM.CODEC_NONE)
+        self.assertEqual(self.read_file("text.txt"), TEXT_CONTENT)
+        self.assertEqual(self.read_file("random.bin"), RANDOM_CONTENT)
+
+    def test_same_content_with_another_codec(self):
+        # The blob of a content is reused whatever codec is asked for, so the codec of the stored blob is kept
+        DB.add_to_database(self.write_file("first.txt", TEXT_CONTENT), "rsa", 1, CM.CODEC_LZMA)
+        DB.add_to_database(self.write_file("second.txt", TEXT_CONTENT), "rsa", 1, CM.CODEC_ZLIB)
+        self.assertEqual(DB.get_repository().fetch("second.txt")[12], CM.CODEC_LZMA)
+        self.assertEqual(self.read_file("second.txt"), TEXT_CONTENT)
+
+    def test_content_that_cannot_be_decompressed(self):
+        DB.add_to_database(self.write_file("plain.txt", TEXT_CONTENT), "dh", 1, CM.CODEC_NONE)
+        for codec in CM.CODECS:
+            with self.subTest(codec=codec):
+                with DB.get_repository().connect() as connection:
+                    connection.execute("""UPDATE files SET codec = ? WHERE name = ?""", (codec, "plain.txt"))
+                self.assertIsNone(self.read_file("plain.txt"))
+
+    def test_truncated_stream(self):
+        for codec in CM.CODECS:
+            with self.subTest(codec=codec):
+                compressed = b"".join(CM.compress_chunks(codec, [TEXT_CONTENT]))
+                output = io.BytesIO()
+                writer = CM.DecompressingWriter(codec, output)
+                writer.write(compressed[:len(compressed) // 2])
+                self.assertFalse(writer.is_complete())
+                writer.write(compressed[len(compressed) // 2:])
+                self.assertTrue(writer.is_complete())
+                self.assertEqual(output.getvalue(), TEXT_CONTENT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from Database import DB_Functions as DB
+from FileInteractionMethods import ParsingMethods as PM
+from FileInteractionMethods.EncryptionMethods import Diffie_Hellman_Encryption as DH
+from FileInteractionMethods.EncryptionMethods import EncryptionConstants
+from FileInteractionMethods.EncryptionMethods import RSA_Encryption as RSA
+from tests import helpers
+
+# Every byte value, then enough text for the files to span several chunks
+BINARY_CONTENT = bytes(range(256)) + b"The quick brown fox jumps over the lazy dog.\n" * 4000
+TEXT_CONTENT = "A legacy file, stored with one number per character.\nIt has two lines!\n"
+
+
+class ContainerTests(helpers.DatabaseTestCase):
+    """
+    Round trips through the binary containers and the older text layouts, and the handling of damaged encrypted files.
+    """
+
+    def test_rsa_container_round_trip(self):
+        DB.add_to_database(self.write_file("rsa.bin", BINARY_CONTENT), "rsa", 1)
+        with open(self.encrypted_path("rsa.bin"), "rb") as file:
+            self.assertEqual(PM.read_container_header(file).algorithm, PM.ALGORITHM_RSA)
+        self.assertEqual(self.read_file("rsa.bin"), BINARY_CONTENT)
+
+    def test_dh_container_round_trip(self):
+        DB.add_to_database(self.write_file("dh.bin", BINARY_CONTENT), "dh", 1)
+        with open(self.encrypted_path("dh.bin"), "rb") as file:
+            self.assertEqual(PM.read_container_header(file).algorithm, PM.ALGORITHM_DH)
+        self.assertEqual(self.read_file("dh.bin"), BINARY_CONTENT)
+
+    def test_empty_file_round_trip(self):
+        for encryption_alg in ("rsa", "dh"):
+            DB.add_to_database(self.write_file(f"empty_{encryption_alg}.txt", b""), encryption_alg, 1)
+            self.assertEqual(self.read_file(f"empty_{encryption_alg}.txt"), b"")
+
+    def test_legacy_rsa_text(self):
+        before_path = self.write_file("legacy.txt", TEXT_CONTENT.encode())
+        prime1, prime2 = RSA.compute_initial_prime_numbers()
+        with mock.patch.object(EncryptionConstants, "RSA_BLOCK_MODE", False):
+            RSA.encrypt(before_path, "legacy_encrypted.txt", prime1, prime2, 1)
+        self.assertFalse(PM.is_container("legacy_encrypted.txt"))
+        self.assertTrue(RSA.decrypt("legacy_encrypted.txt", "legacy_decrypted.txt", prime1, prime2, 1))
+        with open("legacy_decrypted.txt", "rb") as file:
+            self.assertEqual(file.read(), TEXT_CONTENT.encode())
+
+    def test_legacy_dh_text(self):
+        keys = DH.compute_initial_prime_numbers()
+        full_key = DH.derive_full_key(*keys)
+        with open("legacy_encrypted.txt", "w") as file:
+            file.write("".join(f"{ord(ch) + full_key}\n" for ch in TEXT_CONTENT))
+        self.assertTrue(DH.decrypt("legacy_encrypted.txt", "legacy_decrypted.txt", *keys, 1))
+        with open("legacy_decrypted.txt", "rb") as file:
+            self.assertEqual(file.read(), TEXT_CONTENT.encode())
+
+    def test_sample_database(self):
+        # The sample Database holds a file encrypted with Diffie-Hellman in the text layout, before the blobs, the keys and the text parameters
+        DB.get_repository().close()
+        shutil.copy(os.path.join(helpers.APPLICATION_PATH, DB.DATABASE_PATH), DB.DATABASE_PATH)
+        shutil.copy(os.path.join(helpers.APPLICATION_PATH, PM.ENCRYPTED_FILES_PATH, "sample_text_encrypted.txt"),
+                    PM.ENCRYPTED_FILES_PATH)
+        with open(os.path.join(helpers.APPLICATION_PATH, PM.SIMPLE_FILES_PATH, "sample_text.txt"), "rb") as file:
+            self.assertEqual(self.read_file("sample_text.txt"), file.read())
+
+    def test_truncated_container(self):
+        for encryption_alg in ("rsa", "dh"):
+            file_name = f"truncated_{encryption_alg}.bin"
+            DB.add_to_database(self.write_file(file_name, BINARY_CONTENT), encryption_alg, 1)
+            with open(self.encrypted_path(file_name), "rb") as file:
+                content = file.read()
+            for length in (len(PM.CONTAINER_MAGIC) + 2, PM.CONTAINER_HEADER.size, len(content) // 2, len(content) - 1):
+                with self.subTest(encryption_alg=encryption_alg, length=length):
+                    with open(self.encrypted_path(file_name), "wb") as file:
+                        file.write(content[:length])
+                    self.assertIsNone(self.read_file(file_name))
+
+    def test_corrupt_container(self):
+        DB.add_to_database(self.write_file("corrupt.bin", BINARY_CONTENT), "dh", 1)
+        with open(self.encrypted_path("corrupt.bin"), "rb") as file:
+            content = file.read()
+        unsupported = content[:len(PM.CONTAINER_MAGIC)] + bytes([PM.CONTAINER_VERSION + 1]) + content[len(PM.CONTAINER_MAGIC) + 1:]
+        # A changed number still decrypts to a byte, so only the checksum tells that the content is wrong
+        changed = bytearray(content)
+        changed[PM.CONTAINER_HEADER.size] ^= 1
+        for corrupt in (unsupported, bytes(changed)):
+            with open(self.encrypted_path("corrupt.bin"), "wb") as file:
+                file.write(corrupt)
+            self.assertIsNone(self.read_file("corrupt.bin"))
+
+    def test_read_container_header(self):
+        DB.add_to_database(self.write_file("header.bin", BINARY_CONTENT), "rsa", 1)
+        with open(self.encrypted_path("header.bin"), "rb") as file:
+            header = file.read(PM.CONTAINER_HEADER.size)
+        unsupported = header[:len(PM.CONTAINER_MAGIC)] + bytes([PM.CONTAINER_VERSION + 1]) + header[len(PM.CONTAINER_MAGIC) + 1:]
+        for broken in (header[:-1], unsupported):
+            with open("header.bin", "wb") as file:
+                file.write(broken)
+            with open("header.bin", "rb") as file:
+                self.assertRaises(ValueError, PM.read_container_header, file)
+
+    def test_shared_blob(self):
+        DB.add_to_database(self.write_file("first.bin", BINARY_CONTENT), "rsa", 1)
+        DB.add_to_database(self.write_file("second.bin", BINARY_CONTENT), "rsa", 1)
+        blob_path = self.encrypted_path("first.bin")
+        self.assertEqual(blob_path, self.encrypted_path("second.bin"))
+        self.assertEqual(os.listdir(PM.ENCRYPTED_FILES_PATH), [os.path.basename(blob_path)])
+        DB.delete_from_database("first.bin")
+        self.assertTrue(os.path.exists(blob_path))
+        self.assertEqual(self.read_file("second.bin"), BINARY_CONTENT)
+        DB.delete_from_database("second.bin")
+        self.assertFalse(os.path.exists(blob_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
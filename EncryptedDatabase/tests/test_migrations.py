@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import unittest
+from unittest import mock
+
+from Database import DB_Functions as DB
+from Database import DB_Repository
+from FileInteractionMethods import ParsingMethods as PM
+from FileInteractionMethods.EncryptionMethods import Diffie_Hellman_Encryption as DH
+from FileInteractionMethods.EncryptionMethods import EncryptionConstants
+from FileInteractionMethods.EncryptionMethods import RSA_Encryption as RSA
+from tests import helpers
+
+# The files table as it was created before the migrations, with integer encryption parameters
+BASELINE_TABLE_COMMAND = """CREATE TABLE files (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                encryption_type TEXT NOT NULL,
+                encryption_param_1 INTEGER,
+                encryption_param_2 INTEGER,
+                encryption_param_3 INTEGER DEFAULT -1,
+                encryption_param_4 INTEGER DEFAULT -1,
+                size INTEGER,
+                last_access TIMESTAMP,
+                last_modification TIMESTAMP,
+                creation_time TIMESTAMP)"""
+BASELINE_INSERT_COMMAND = """INSERT INTO files(name, encryption_type, encryption_param_1, encryption_param_2, encryption_param_3, encryption_param_4, size, last_access, last_modification, creation_time) VALUES (?,?,?,?,?,?,?,?,?,?)"""
+TEXT_CONTENT = "A file stored before the migrations.\nIt is encrypted in the text layout!\n"
+
+
+class MigrationTests(helpers.DatabaseTestCase):
+    """
+    Migrations of a Database created with the baseline schema, including interrupted ones.
+    """
+
+    def setUp(self):
+        super().setUp()
+        DB.get_repository().close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB.DATABASE_PATH + suffix):
+                os.remove(DB.DATABASE_PATH + suffix)
+        self.create_baseline_database()
+
+    def create_baseline_database(self):
+        """
+        Creates a Database with the baseline schema, holding a file encrypted with RSA and one encrypted with Diffie-Hellman, both in the older text layout
+        """
+        before_path = self.write_file("content.txt", TEXT_CONTENT.encode())
+        self.rsa_params = RSA.compute_initial_prime_numbers()
+        with mock.patch.object(EncryptionConstants, "RSA_BLOCK_MODE", False):
+            RSA.encrypt(before_path, os.path.join(PM.ENCRYPTED_FILES_PATH, "rsa_encrypted.txt"), *self.rsa_params, 1)
+        self.dh_params = DH.compute_initial_prime_numbers()
+        full_key = DH.derive_full_key(*self.dh_params)
+        with open(os.path.join(PM.ENCRYPTED_FILES_PATH, "dh_encrypted.txt"), "w") as file:
+            file.write("\n".join(str(ord(ch) + full_key) for ch in TEXT_CONTENT))
+        metadata = PM.extract_file_metadata(before_path)
+        with sqlite3.connect(DB.DATABASE_PATH) as connection:
+            connection.execute(BASELINE_TABLE_COMMAND)
+            connection.execute(BASELINE_INSERT_COMMAND, ("rsa.txt", "RSA", *self.rsa_params, -1, -1, *metadata))
+            connection.execute(BASELINE_INSERT_COMMAND, ("dh.txt", "DH", *self.dh_params, *metadata))
+        connection.close()
+
+    def get_version(self):
+        """
+        :return: The schema version of the Database, read with a connection of its own
+        """
+        connection = sqlite3.connect(DB.DATABASE_PATH)
+        try:
+            return connection.execute("""PRAGMA user_version""").fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_migrate_baseline_schema(self):
+        self.assertEqual(self.get_version(), 0)
+        rsa_data = DB.get_repository().fetch("rsa.txt")
+        self.assertEqual(self.get_version(), len(DB_Repository.MIGRATIONS))
+        self.assertEqual(rsa_data[3:7], (str(self.rsa_params[0]), str(self.rsa_params[1]), "-1", "-1"))
+        self.assertEqual(DB.get_repository().fetch("dh.txt")[3:7], tuple(str(param) for param in self.dh_params))
+        self.assertIsNone(rsa_data[11])
+        self.assertEqual(self.read_file("rsa.txt"), TEXT_CONTENT.encode())
+        self.assertEqual(self.read_file("dh.txt"), TEXT_CONTENT.encode())
+        tables = {row[0] for row in DB.get_repository().connect().execute("""SELECT name FROM sqlite_master""")}
+        self.assertTrue({"files", "blobs", "chunks", "keys", "files_name"} <= tables)
+        self.assertNotIn("files_rebuilt", tables)
+
+    def test_files_added_after_migration(self):
+        DB.add_to_database(self.write_file("new.txt", b"A file added after the migrations"), "rsa", 1)
+        DB.add_to_database(self.write_file("rsa.txt", b"Another file with the name of a stored one"), "dh", 1)
+        self.assertEqual(self.read_file("new.txt"), b"A file added after the migrations")
+        self.assertEqual(self.read_file("rsa.txt"), TEXT_CONTENT.encode())
+        self.assertEqual(DB.get_repository().count_files(), 3)
+
+    def test_reopen_migrated_database(self):
+        DB.get_repository().connect()
+        DB.get_repository().close()
+        self.assertEqual(self.read_file("dh.txt"), TEXT_CONTENT.encode())
+        self.assertEqual(self.get_version(), len(DB_Repository.MIGRATIONS))
+
+    def test_interrupted_migration(self):
+        migrations = list(DB_Repository.MIGRATIONS)
+        rebuild = next(version for version, migration in enumerate(migrations) if isinstance(migration, list))
+        migrations[rebuild] = migrations[rebuild][:3] + ["""SELECT no_such_function()"""] + migrations[rebuild][3:]
+        with mock.patch.object(DB_Repository, "MIGRATIONS", migrations):
+            self.assertRaises(sqlite3.Error, DB.get_repository().connect)
+        # The failed migration was rolled back as a whole, while the ones before it were kept
+        self.assertEqual(self.get_version(), rebuild)
+        connection = sqlite3.connect(DB.DATABASE_PATH)
+        try:
+            self.assertIsNone(connection.execute("""SELECT 1 FROM sqlite_master WHERE name = 'files_rebuilt'""").fetchone())
+        finally:
+            connection.close()
+        self.assertEqual(self.read_file("rsa.txt"), TEXT_CONTENT.encode())
+        self.assertEqual(self.get_version(), len(DB_Repository.MIGRATIONS))
+
+    def test_rebuild_left_by_an_older_version(self):
+        # Before the migrations ran in transactions, an interrupted rebuild could leave its copy of the files table behind
+        with sqlite3.connect(DB.DATABASE_PATH) as connection:
+            connection.execute("""CREATE TABLE files_rebuilt (id INTEGER PRIMARY KEY)""")
+        connection.close()
+        self.assertEqual(self.read_file("dh.txt"), TEXT_CONTENT.encode())
+        self.assertEqual(self.get_version(), len(DB_Repository.MIGRATIONS))
+
+
+if __name__ == "__main__":
+    unittest.main()
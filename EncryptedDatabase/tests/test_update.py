@@ -0,0 +1,108 @@
+import os
+import random
+import re
+import unittest
+from unittest import mock
+
+from Database import DB_Functions as DB
+from FileInteractionMethods import CompressionMethods as CM
+from FileInteractionMethods import ParsingMethods as PM
+from tests import helpers
+
+# Enough lines of text for a file to span many content-defined chunks
+LINE_COUNT = 40000
+
+
+def make_content(seed):
+    """
+    :param seed: The seed of the random lines
+    :return: Lines of random text, as bytes
+    """
+    generator = random.Random(seed)
+    return b"".join(f"{index} {generator.getrandbits(64):x}\n".encode() for index in range(LINE_COUNT))
+
+
+class UpdateTests(helpers.DatabaseTestCase):
+    """
+    Updates of stored files, which re-encrypt only the chunks that changed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.content = make_content(0)
+        middle = len(self.content) // 2
+        self.edits = {"prefix": b"A new first line\n" + self.content,
+                      "middle": self.content[:middle] + b"An edited line in the middle\n" + self.content[middle + 100:],
+                      "suffix": self.content + b"A new last line\n"}
+
+    def update(self, file_name, content):
+        """
+        Updates a file from the Database with the given content
+        :param file_name: The name of the file
+        :param content: The new content of the file
+        :return: The messages logged by the update
+        """
+        with self.assertLogs(PM.LOGGER, "SUCCESS") as logs:
+            DB.update_in_database(self.write_file(file_name, content), 1)
+        return [record.getMessage() for record in logs.records]
+
+    def assert_partially_encrypted(self, messages):
+        counts = [re.search(r"(\d+) out of (\d+) chunks encrypted", message) for message in messages]
+        counts = [match for match in counts if match is not None]
+        self.assertEqual(len(counts), 1, messages)
+        changed, total = (int(count) for count in counts[0].groups())
+        self.assertGreater(total, 4)
+        self.assertLessEqual(changed, 2)
+
+    def test_edits(self):
+        for encryption_alg in ("rsa", "dh"):
+            for edit, content in self.edits.items():
+                with self.subTest(encryption_alg=encryption_alg, edit=edit):
+                    file_name = f"{edit}_{encryption_alg}.txt"
+                    DB.add_to_database(self.write_file(file_name, self.content), encryption_alg, 1)
+                    old_blob = self.encrypted_path(file_name)
+                    self.assert_partially_encrypted(self.update(file_name, content))
+                    self.assertEqual(self.read_file(file_name), content)
+                    self.assertFalse(os.path.exists(old_blob))
+                    data = DB.get_repository().fetch(file_name)
+                    self.assertTrue(DB.get_repository().fetch_manifest(data[11], data[2]))
+
+    def test_successive_edits(self):
+        DB.add_to_database(self.write_file("successive.txt", self.content), "rsa", 1)
+        content = self.content
+        for edit in (lambda old: old + b"A new last line\n", lambda old: b"A new first line\n" + old,
+                     lambda old: old[:len(old) // 3] + b"An edited line\n" + old[len(old) // 3 + 50:]):
+            content = edit(content)
+            self.assert_partially_encrypted(self.update("successive.txt", content))
+            self.assertEqual(self.read_file("successive.txt"), content)
+
+    def test_shared_blob(self):
+        for file_name in ("shared.txt", "other.txt"):
+            DB.add_to_database(self.write_file(file_name, self.content), "dh", 1)
+        shared_blob = self.encrypted_path("other.txt")
+        self.assert_partially_encrypted(self.update("shared.txt", self.edits["middle"]))
+        self.assertEqual(self.read_file("shared.txt"), self.edits["middle"])
+        self.assertEqual(self.read_file("other.txt"), self.content)
+        self.assertTrue(os.path.exists(shared_blob))
+        self.assertEqual(len(os.listdir(PM.ENCRYPTED_FILES_PATH)), 2)
+
+    def test_compressed_file(self):
+        DB.add_to_database(self.write_file("compressed.txt", self.content), "rsa", 1, CM.CODEC_ZLIB)
+        messages = self.update("compressed.txt", self.edits["middle"])
+        self.assertTrue(any("the whole file was encrypted" in message for message in messages), messages)
+        self.assertEqual(self.read_file("compressed.txt"), self.edits["middle"])
+        self.assertEqual(DB.get_repository().fetch("compressed.txt")[12], CM.CODEC_ZLIB)
+
+    def test_failed_update(self):
+        DB.add_to_database(self.write_file("failed.txt", self.content), "rsa", 1)
+        data = DB.get_repository().fetch("failed.txt")
+        blob_files = os.listdir(PM.ENCRYPTED_FILES_PATH)
+        with mock.patch.object(DB, "encrypt_manifest_chunks", side_effect=OSError("No space left on device")):
+            DB.update_in_database(self.write_file("failed.txt", self.edits["suffix"]), 1)
+        self.assertEqual(DB.get_repository().fetch("failed.txt"), data)
+        self.assertEqual(os.listdir(PM.ENCRYPTED_FILES_PATH), blob_files)
+        self.assertEqual(self.read_file("failed.txt"), self.content)
+
+
+if __name__ == "__main__":
+    unittest.main()